@@ -1,12 +1,14 @@
+import argparse
 import json
 import logging
 import os
 import secrets
 import string
 import sys
-from datetime import datetime
+import tempfile
+from datetime import datetime, timedelta
 from os import environ
-from typing import Dict, NoReturn
+from typing import Any, Dict, List, NoReturn, Optional, Tuple
 
 from dateutil import tz
 
@@ -15,7 +17,24 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src
 
 from crontab import CronTab
 
-from src import logger_config, post_list
+from src import (
+    accounts,
+    engagement,
+    file_watcher,
+    history,
+    hot_reload,
+    logger_config,
+    post_list,
+    profiling,
+    simulation,
+    slot_allocator,
+    video_tools,
+    work_queue,
+)
+
+
+# An entry removed from 'to-post' this close to its due time was published, not withdrawn
+WITHDRAW_MARGIN = timedelta(minutes=1)
 
 
 def log_and_exit(logger: logging.Logger, message: str) -> NoReturn:
@@ -60,13 +79,17 @@ def get_shell_script_to_run(
     return run_media_post_path
 
 
-def validate_post_date(post_date: str, logger: logging.Logger) -> datetime:
+def validate_post_date(
+    post_date: str, logger: logging.Logger, post_date_utc: Optional[datetime] = None
+) -> datetime:
     """
     Validate the post date to ensure it is in the future.
 
     Args:
     - post_date (string): The date and time of the post.
     - logger (logging.Logger): The logger to use.
+    - post_date_utc (Optional[datetime]): The post date resolved to UTC in its time zone.
+      Defaults to interpreting `post_date` in the machine's local time zone.
 
     Returns:
     - datetime: The validated and parsed datetime object.
@@ -87,8 +110,11 @@ def validate_post_date(post_date: str, logger: logging.Logger) -> datetime:
             message=f"The post_date is not in the correct format: {post_date}",
         )
 
+    if post_date_utc is None:
+        post_date_utc = parsed_date.replace(tzinfo=tz.tzlocal()).astimezone(tz.UTC)
+
     # Check if the parsed date is in the future
-    if parsed_date.astimezone(tz.UTC) <= datetime.now(tz=tz.UTC):
+    if post_date_utc <= datetime.now(tz=tz.UTC):
         log_and_exit(
             logger=logger, message=f"The post_date `{post_date}` is in the past."
         )
@@ -114,7 +140,7 @@ def create_cron_job(
     - run_media_post_path (str): The path to the shell script to run.
     - media_post_path (str): The path to the media post script.
     - scheduled_post_file_path (str): The path to the scheduled post file.
-    - post_date (datetime): The date and time to run the job.
+    - post_date (datetime): The date and time to run the job, in the machine's local time zone.
     - logger (logging.Logger): The logger to use.
 
     Raises:
@@ -133,56 +159,129 @@ def create_cron_job(
         log_and_exit(logger=logger, message=f"Failed to create cron job: {e}")
 
 
-def main() -> None:
+def prepare_video_post(
+    post: post_list.Post, thumbnails_dir: str, unique_id: str, logger: logging.Logger
+) -> None:
     """
-    Main function to schedule Instagram posts using cron jobs.
+    Probe a video post and extract its thumbnail, so the publisher does not have to.
 
-    This function performs the following tasks:
-    1. Sets up logging to a file.
-    2. Loads a list of posts from a JSON file.
-    3. Creates a temporary JSON file for each post to be scheduled.
-    4. Schedules a cron job to execute a script for each post at the specified date and time.
-    5. Writes the cron jobs to the user's crontab.
+    Args:
+    - post (Post): The video post to prepare.
+    - thumbnails_dir (str): The directory to write the extracted thumbnail to.
+    - unique_id (str): The unique identifier of the scheduled post file.
+    - logger (logging.Logger): The logger to use.
 
-    The cron job will execute the script `media_post.py` with the path to the temporary JSON file as an argument.
+    Raises:
+    - SystemExit: If the video is invalid or the thumbnail cannot be extracted.
     """
+    if os.path.splitext(post.video_path)[1].lower() not in video_tools.VIDEO_EXTENSIONS:
+        log_and_exit(logger=logger, message=f"'{post.video_path}' is not a valid video")
 
-    # Determine the current directory of the script
-    current_dir = os.path.dirname(os.path.abspath(__file__))
+    if not os.path.isfile(post.video_path) or os.path.getsize(post.video_path) == 0:
+        log_and_exit(logger=logger, message=f"'{post.video_path}' is missing or empty")
 
-    # Define paths for log file and posts JSON file
-    log_path = os.path.join(current_dir, "logs", "post-activity.log")
-    to_post_path = os.path.join(current_dir, "data", "to-post.json")
-    media_post_path = os.path.join(current_dir, "src", "media_post.py")
+    try:
+        post.video_info = video_tools.probe_video(video_path=post.video_path)
+
+        if post.thumbnail_path is None:
+            post.thumbnail_path = video_tools.extract_thumbnail(
+                video_path=post.video_path,
+                thumbnail_path=os.path.join(
+                    thumbnails_dir, f"thumbnail_{unique_id}.jpg"
+                ),
+            )
+    except Exception as e:
+        log_and_exit(
+            logger=logger, message=f"Failed to prepare video '{post.video_path}': {e}"
+        )
 
-    # Initialize logger
-    logger = logger_config.get_logger(log_file=log_path)
 
-    post_data_dir = os.path.join(current_dir, "data", "scheduled_posts")
-    os.makedirs(post_data_dir, exist_ok=True)
+def schedule_posts(
+    posts_list: post_list.PostList,
+    cron: Optional[CronTab],
+    current_dir: str,
+    post_data_dir: str,
+    logger: logging.Logger,
+    prepare_videos: bool = True,
+    shared_queue: Optional[work_queue.WorkQueue] = None,
+    taken_slots: Optional[Dict[str, List[datetime]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Allocate a slot to each loaded post, write its scheduled post file and add its cron job.
 
-    # Initialize PostList object and load posts from JSON file
-    posts_list = post_list.PostList(log_path)
+    Args:
+    - posts_list (PostList): The loaded posts.
+    - cron (Optional[CronTab]): The crontab object to add the jobs to. It is not written.
+    - current_dir (str): The current directory of the script.
+    - post_data_dir (str): The directory to write the scheduled post files to.
+    - logger (logging.Logger): The logger to use.
+    - prepare_videos (bool): Whether to probe videos and extract their thumbnails.
+    - shared_queue (Optional[WorkQueue]): The work queue shared by several publisher hosts.
+      When set, posts are added to it instead of getting a file and a cron job.
+    - taken_slots (Optional[Dict[str, List[datetime]]]): The UTC slots of every
+      account already assigned to posts scheduled earlier.
 
-    posts_list.get_posts_from_json_file(posts_file_path=to_post_path)
-    logger.info(f"Number of posts loaded: {len(posts_list.posts)}")
+    Returns:
+    - List[Dict[str, Any]]: The slot assignment of every post, with the path of
+      its scheduled post file under "scheduled_post_file_path", or its id in the
+      shared queue under "post_id".
+    """
+    media_post_path = os.path.join(current_dir, "src", "media_post.py")
+    thumbnails_dir = os.path.join(current_dir, "data", "thumbnails")
 
-    user_shell = os.path.basename(environ.get("SHELL", "/bin/bash"))
+    # Spread bursts so each account stays within its posting limits
+    assignments = slot_allocator.allocate_slots(
+        posts=posts_list.posts, accounts=posts_list.accounts, taken=taken_slots
+    )
+    shifted = [assignment for assignment in assignments if assignment["shift"]]
+    for assignment in shifted:
+        logger.info(
+            f"Post for account '{assignment['account']}' moved from {assignment['requested']} "
+            f"to {assignment['assigned']} (+{assignment['shift']})"
+        )
+    logger.info(f"Number of posts moved to respect posting limits: {len(shifted)}")
 
-    run_media_post_path = get_shell_script_to_run(
-        user_shell=user_shell, current_dir=current_dir, logger=logger
+    calendar = posts_list.build_calendar_index()
+    logger.info(
+        f"Number of posts due in the next hour: {len(calendar.due_within(now=datetime.now(tz=tz.UTC), minutes=60))}"
     )
 
-    # Access the current user's CronTab object.
-    cron = CronTab(user=True)
+    user_shell = os.path.basename(environ.get("SHELL", "/bin/bash"))
 
-    for post in posts_list.posts:
+    # Workers of the shared queue publish the posts, not cron
+    if shared_queue is None:
+        run_media_post_path = get_shell_script_to_run(
+            user_shell=user_shell, current_dir=current_dir, logger=logger
+        )
+
+    for post, assignment in zip(posts_list.posts, assignments):
         # Create a unique identifier for each post file
         unique_id = "".join(
             secrets.choice(string.ascii_lowercase + string.digits) for _ in range(6)
         )
 
-        post.post_date = validate_post_date(post_date=post.post_date, logger=logger)
+        post.post_date = validate_post_date(
+            post_date=post.post_date, logger=logger, post_date_utc=post.post_date_utc
+        )
+
+        if post.is_video and prepare_videos:
+            prepare_video_post(
+                post=post,
+                thumbnails_dir=thumbnails_dir,
+                unique_id=unique_id,
+                logger=logger,
+            )
+
+        if shared_queue is not None:
+            # The id is derived from the content, so scheduling twice queues the post once
+            post_content = json.loads(json.dumps(post.serialize(), default=str))
+            post_id = work_queue.post_id_for(post_content)
+            if not shared_queue.enqueue(
+                post_id=post_id, post=post_content, due_at=post.post_date_utc
+            ):
+                logger.info(f"Post {post_id} is already in the work queue")
+            assignment["post_id"] = post_id
+            continue
 
         # Create a unique suffix for the temporary file based on the post date
         post_date_suffix = post.post_date.strftime("%Y-%m-%d-%H-%M")
@@ -205,9 +304,601 @@ def main() -> None:
             run_media_post_path=run_media_post_path,
             media_post_path=media_post_path,
             scheduled_post_file_path=scheduled_post_file_path,
-            post_date=post.post_date,
+            # Cron runs in the machine's local time zone
+            post_date=post.post_date_utc.astimezone(tz.tzlocal()),
+            logger=logger,
+        )
+        assignment["scheduled_post_file_path"] = scheduled_post_file_path
+
+    return assignments
+
+
+def run_simulation(
+    args: argparse.Namespace,
+    current_dir: str,
+    posts_list: post_list.PostList,
+    logger: logging.Logger,
+) -> None:
+    """
+    Run the queue through the real scheduling and publishing logic against a
+    virtual clock, a stub crontab and a stub Instagram client, and print a report.
+
+    Args:
+    - args (argparse.Namespace): The parsed `simulate` command line arguments.
+    - current_dir (str): The current directory of the script.
+    - posts_list (PostList): The loaded posts.
+    - logger (logging.Logger): The logger to use.
+    """
+    stub_cron = simulation.StubCronTab()
+
+    with tempfile.TemporaryDirectory() as simulation_dir:
+        post_data_dir = os.path.join(simulation_dir, "scheduled_posts")
+        os.makedirs(post_data_dir)
+
+        assignments = schedule_posts(
+            posts_list=posts_list,
+            cron=stub_cron,
+            current_dir=current_dir,
+            post_data_dir=post_data_dir,
+            logger=logger,
+            prepare_videos=False,
+        )
+        logger.info(f"Simulating {len(assignments)} scheduled posts")
+
+        report = simulation.simulate(
+            assignments=assignments,
+            cron=stub_cron,
+            data_dir=simulation_dir,
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            rate_limit_per_hour=args.rate_limit,
+            seed=args.seed,
+        )
+
+    simulation.print_report(
+        report=report, as_json=args.json, show_timeline=args.timeline
+    )
+
+
+def run_query(args: argparse.Namespace, current_dir: str, logger: logging.Logger) -> None:
+    """
+    Print the posts matching the `query` filters, as they stream from the index.
+
+    Args:
+    - args (argparse.Namespace): The parsed `query` command line arguments.
+    - current_dir (str): The current directory of the script.
+    - logger (logging.Logger): The logger to use.
+    """
+    try:
+        since = history.parse_date_bound(args.since) if args.since else None
+        until = history.parse_date_bound(args.until, end=True) if args.until else None
+    except ValueError as e:
+        log_and_exit(logger=logger, message=f"Invalid date filter: {e}")
+
+    matches = history.query_posts(
+        data_dir=os.path.join(current_dir, "data"),
+        db_path=os.path.join(current_dir, "data", "history-index.sqlite3"),
+        statuses=args.status,
+        account=args.account,
+        since=since,
+        until=until,
+        error_type=args.error_type,
+    )
+
+    if not args.json:
+        print(history.TABLE_HEADER)
+
+    for count, match in enumerate(matches, start=1):
+        if args.limit is not None and count > args.limit:
+            break
+        print(json.dumps(match) if args.json else history.format_row(match))
+
+
+def run_recommend(
+    args: argparse.Namespace, current_dir: str, logger: logging.Logger
+) -> None:
+    """
+    Print the best posting hours of every weekday per account, after fetching the
+    engagement of the posts published since the last update with `--update`.
+
+    Args:
+    - args (argparse.Namespace): The parsed `recommend` command line arguments.
+    - current_dir (str): The current directory of the script.
+    - logger (logging.Logger): The logger to use.
+    """
+    account_settings = accounts.load_accounts(
+        os.path.join(current_dir, "data", "accounts.json")
+    )
+    model = engagement.EngagementModel(
+        model_path=os.path.join(current_dir, "data", "engagement-model.json"),
+        logger=logger,
+    )
+
+    if args.update:
+        # Imported here, so the other commands do not need instagrapi
+        from src.setup import setup_instagrapi
+
+        added = model.update_from_history(
+            success_path=os.path.join(current_dir, "data", "success.json"),
+            accounts=account_settings,
+            get_client=lambda account: setup_instagrapi(logger=logger, account=account),
+        )
+        logger.info(f"Added the engagement of {added} posts to the model")
+
+    account_names = [args.account] if args.account else sorted(model.slots)
+    account_names = account_names or [accounts.DEFAULT_ACCOUNT]
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    account: {
+                        engagement.WEEKDAYS[weekday]: [
+                            {"hour": hour, "score": round(score, 2)}
+                            for hour, score in hours
+                        ]
+                        for weekday, hours in model.best_slots(
+                            account=account, top=args.top
+                        ).items()
+                    }
+                    for account in account_names
+                },
+                indent=2,
+            )
+        )
+    else:
+        engagement.print_recommendations(
+            model=model, accounts=account_names, top=args.top
+        )
+
+
+def schedule_entries(
+    entries: List[Tuple[str, Dict[str, Any]]],
+    cron: Optional[CronTab],
+    current_dir: str,
+    logger: logging.Logger,
+    shared_queue: Optional[work_queue.WorkQueue] = None,
+    taken_slots: Optional[Dict[str, List[datetime]]] = None,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Schedule 'to-post' entries that were added while watching. Invalid entries
+    and entries dated in the past are logged and skipped, the others are
+    scheduled together, clear of the slots taken by the posts scheduled before,
+    so posting limits hold across batches.
+
+    Args:
+    - entries (List[Tuple[str, Dict[str, Any]]]): The (key, entry) pairs of the added entries.
+    - cron (Optional[CronTab]): The crontab object to add the jobs to. It is not written.
+    - current_dir (str): The current directory of the script.
+    - logger (logging.Logger): The logger to use.
+    - shared_queue (Optional[WorkQueue]): The work queue shared by several publisher hosts.
+    - taken_slots (Optional[Dict[str, List[datetime]]]): The UTC slots of every
+      account already assigned to posts scheduled earlier.
+
+    Returns:
+    - List[Tuple[str, Dict[str, Any]]]: The key of every scheduled entry, with its
+      account, due time and scheduled post file or work queue id.
+    """
+    posts_list = post_list.PostList(
+        os.path.join(current_dir, "logs", "post-activity.log"),
+        engagement_model_path=os.path.join(
+            current_dir, "data", "engagement-model.json"
+        ),
+    )
+    posts_list.accounts = accounts.load_accounts(
+        os.path.join(current_dir, "data", "accounts.json")
+    )
+
+    keys = []
+    for key, entry in entries:
+        try:
+            posts_list.load_posts(posts=[entry])
+        except (SystemExit, Exception) as e:
+            logger.error(f"Skipped invalid post '{entry.get('post_date')}': {e}")
+            continue
+
+        post = posts_list.posts[-1]
+        if post.post_date_utc <= datetime.now(tz=tz.UTC):
+            logger.error(f"Skipped post dated in the past: {post.post_date}")
+            posts_list.posts.pop()
+            continue
+        keys.append(key)
+
+    if not keys:
+        return []
+
+    post_data_dir = os.path.join(current_dir, "data", "scheduled_posts")
+    os.makedirs(post_data_dir, exist_ok=True)
+
+    try:
+        assignments = schedule_posts(
+            posts_list=posts_list,
+            cron=cron,
+            current_dir=current_dir,
+            post_data_dir=post_data_dir,
             logger=logger,
+            shared_queue=shared_queue,
+            taken_slots=taken_slots,
+        )
+    except SystemExit:
+        logger.error(f"Failed to schedule {len(keys)} new posts")
+        return []
+
+    return [
+        (
+            key,
+            {
+                "account": assignment["account"],
+                "due_at": assignment["assigned"].isoformat(),
+                **{
+                    field: assignment[field]
+                    for field in ("scheduled_post_file_path", "post_id")
+                    if field in assignment
+                },
+            },
         )
+        for key, assignment in zip(keys, assignments)
+    ]
+
+
+def withdraw_scheduled_post(
+    record: Dict[str, Any],
+    cron: Optional[CronTab],
+    logger: logging.Logger,
+    shared_queue: Optional[work_queue.WorkQueue] = None,
+) -> None:
+    """
+    Withdraw a post that was removed (or edited) in 'to-post' before its due time.
+
+    Args:
+    - record (Dict[str, Any]): Its due time and scheduled post file or work queue id.
+    - cron (Optional[CronTab]): The crontab object to remove the job from. It is not written.
+    - logger (logging.Logger): The logger to use.
+    - shared_queue (Optional[WorkQueue]): The work queue shared by several publisher hosts.
+    """
+    if "post_id" in record:
+        if shared_queue is None or not shared_queue.withdraw(
+            post_id=record["post_id"]
+        ):
+            logger.warning(
+                f"Could not withdraw post {record['post_id']} from the work queue"
+            )
+        return
+
+    scheduled_post_file_path = record["scheduled_post_file_path"]
+    if cron is not None:
+        cron.remove(*cron.find_command(scheduled_post_file_path))
+    if os.path.exists(scheduled_post_file_path):
+        os.remove(scheduled_post_file_path)
+    logger.info(f"Withdrew the post of '{scheduled_post_file_path}'")
+
+
+def run_watch(args: argparse.Namespace, current_dir: str, logger: logging.Logger) -> None:
+    """
+    Watch 'to-post' and the drop directories, and schedule the posts added to
+    them as they come, until interrupted.
+
+    Files dropped in a drop directory are moved into 'to-post'. Bursts of
+    changes are handled once, and only the entries added or removed since the
+    last change are handled: added ones are scheduled, removed ones that are
+    not due yet are withdrawn (an edit is a removal and an addition). Entries
+    already in 'to-post' when the watch first starts are taken as scheduled by
+    an earlier run, unless `--schedule-existing` is given.
+
+    Args:
+    - args (argparse.Namespace): The parsed `watch` command line arguments.
+    - current_dir (str): The current directory of the script.
+    - logger (logging.Logger): The logger to use.
+    """
+    data_dir = os.path.join(current_dir, "data")
+    to_post_path = os.path.join(data_dir, "to-post.json")
+    drop_dirs = args.drop_dir or [os.path.join(data_dir, "inbox")]
+    for drop_dir in drop_dirs:
+        os.makedirs(drop_dir, exist_ok=True)
+
+    shared_queue = (
+        work_queue.SQLiteWorkQueue(db_path=args.work_queue) if args.work_queue else None
+    )
+    tracker = hot_reload.ToPostTracker(
+        to_post_path=to_post_path,
+        state_path=os.path.join(data_dir, "watch-state.json"),
+        logger=logger,
+    )
+    baseline = not tracker.started and not args.schedule_existing
+
+    watcher = file_watcher.create_watcher(
+        files=[to_post_path], directories=drop_dirs, polling=args.poll
+    )
+    logger.info(
+        f"Watching '{to_post_path}' and {', '.join(drop_dirs)} with {type(watcher).__name__}"
+    )
+
+    try:
+        while True:
+            hot_reload.ingest_drop_files(
+                drop_dirs=drop_dirs, to_post_path=to_post_path, logger=logger
+            )
+
+            changes = tracker.read_changes()
+            if changes is not None and (changes[0] or changes[1] or baseline):
+                added, removed = changes
+                if baseline:
+                    logger.info(
+                        f"Taking {len(added)} queued posts as already scheduled"
+                    )
+                    added, baseline = [], False
+
+                cron = None if shared_queue is not None else CronTab(user=True)
+                now = datetime.now(tz=tz.UTC)
+
+                withdrawn = 0
+                for key in removed:
+                    record = tracker.pop_scheduled(key)
+                    # Published posts leave 'to-post' at their due time
+                    if (
+                        record
+                        and datetime.fromisoformat(record["due_at"])
+                        > now + WITHDRAW_MARGIN
+                    ):
+                        withdraw_scheduled_post(
+                            record=record,
+                            cron=cron,
+                            logger=logger,
+                            shared_queue=shared_queue,
+                        )
+                        withdrawn += 1
+
+                scheduled = schedule_entries(
+                    entries=added,
+                    cron=cron,
+                    current_dir=current_dir,
+                    logger=logger,
+                    shared_queue=shared_queue,
+                    taken_slots=tracker.taken_slots(),
+                )
+                for key, record in scheduled:
+                    tracker.record_scheduled(key=key, record=record)
+
+                if cron is not None and (scheduled or withdrawn):
+                    try:
+                        cron.write()
+                    except Exception as e:
+                        logger.error(f"Failed to write to CronTab: {e}")
+
+                tracker.save()
+                logger.info(
+                    f"Scheduled {len(scheduled)} new posts and withdrew {withdrawn} posts"
+                )
+
+            # Wake up now and then anyway, for dropped files still being written
+            file_watcher.wait_for_burst(
+                watcher=watcher, timeout=hot_reload.RECENT_WRITE_SECONDS
+            )
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        watcher.close()
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+    - argparse.Namespace: The parsed arguments. `command` is "schedule" when omitted.
+    """
+    parser = argparse.ArgumentParser(description="Schedule Instagram posts.")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Options every command takes
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Write a CPU and memory profile of the run to logs/. "
+        "Also enabled by the PROFILE_RUNS environment variable. "
+        "Ignored by watch, which runs until interrupted.",
+    )
+
+    schedule_parser = subparsers.add_parser(
+        "schedule", parents=[common_parser], help="Schedule the posts (default)."
+    )
+    schedule_parser.add_argument(
+        "--work-queue",
+        default=environ.get("WORK_QUEUE_PATH"),
+        help="Add the posts to this shared work queue instead of the crontab. "
+        "Defaults to the WORK_QUEUE_PATH environment variable.",
+    )
+
+    simulate_parser = subparsers.add_parser(
+        "simulate",
+        parents=[common_parser],
+        help="Dry-run the queue against a virtual clock and stub crontab/client.",
+    )
+    simulate_parser.add_argument(
+        "--latency", type=float, default=5.0, help="Mean upload latency in seconds."
+    )
+    simulate_parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.02,
+        help="Probability that an upload fails with a connection error.",
+    )
+    simulate_parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=25,
+        help="Modeled Instagram limit of posts per account per hour.",
+    )
+    simulate_parser.add_argument("--seed", type=int, default=0)
+    simulate_parser.add_argument(
+        "--json", action="store_true", help="Print the full report as JSON."
+    )
+    simulate_parser.add_argument(
+        "--timeline", action="store_true", help="Print every upload attempt."
+    )
+
+    query_parser = subparsers.add_parser(
+        "query",
+        parents=[common_parser],
+        aliases=["status"],
+        help="List queued, retrying, published and failed posts.",
+    )
+    query_parser.add_argument("--account", help="Only the posts of this account.")
+    query_parser.add_argument(
+        "--since", help="Only the posts dated at or after this date (YYYY-MM-DD[ HH:MM])."
+    )
+    query_parser.add_argument(
+        "--until", help="Only the posts dated up to this date (YYYY-MM-DD[ HH:MM])."
+    )
+    query_parser.add_argument(
+        "--status",
+        action="append",
+        choices=history.STATUSES,
+        help="Only the posts with this status, can be repeated.",
+    )
+    query_parser.add_argument(
+        "--error-type", help="Only the failures with this exception type."
+    )
+    query_parser.add_argument(
+        "--limit", type=int, default=None, help="Stop after this many posts."
+    )
+    query_parser.add_argument(
+        "--json", action="store_true", help="Print one JSON object per line."
+    )
+
+    recommend_parser = subparsers.add_parser(
+        "recommend",
+        parents=[common_parser],
+        help="Show the best posting hours per account and weekday.",
+    )
+    recommend_parser.add_argument(
+        "--update",
+        action="store_true",
+        help="Fetch the engagement of the posts published since the last update first.",
+    )
+    recommend_parser.add_argument("--account", help="Only this account.")
+    recommend_parser.add_argument(
+        "--top", type=int, default=3, help="Number of hours per weekday."
+    )
+    recommend_parser.add_argument(
+        "--json", action="store_true", help="Print the recommendations as JSON."
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        parents=[common_parser],
+        help="Schedule posts as they are added to data/to-post.json or dropped in a directory.",
+    )
+    watch_parser.add_argument(
+        "--drop-dir",
+        action="append",
+        help="Directory to take post files from, can be repeated. Defaults to data/inbox.",
+    )
+    watch_parser.add_argument(
+        "--work-queue",
+        default=environ.get("WORK_QUEUE_PATH"),
+        help="Add the posts to this shared work queue instead of the crontab. "
+        "Defaults to the WORK_QUEUE_PATH environment variable.",
+    )
+    watch_parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="Poll the files instead of using inotify, e.g. on network file systems.",
+    )
+    watch_parser.add_argument(
+        "--schedule-existing",
+        action="store_true",
+        help="On the first start, also schedule the posts already in data/to-post.json.",
+    )
+
+    # Without a command, every argument belongs to "schedule"
+    argv = sys.argv[1:]
+    if not argv or (
+        argv[0] not in subparsers.choices and argv[0] not in ("-h", "--help")
+    ):
+        argv = ["schedule", *argv]
+
+    args = parser.parse_args(argv)
+    if args.command == "status":
+        args.command = "query"
+    return args
+
+
+def run_command(
+    args: argparse.Namespace, current_dir: str, logger: logging.Logger
+) -> None:
+    """
+    Run the command given on the command line.
+
+    Args:
+    - args (argparse.Namespace): The parsed command line arguments.
+    - current_dir (str): The current directory of the script.
+    - logger (logging.Logger): The logger to use.
+    """
+    # Define paths for log file and posts JSON file
+    log_path = os.path.join(current_dir, "logs", "post-activity.log")
+    to_post_path = os.path.join(current_dir, "data", "to-post.json")
+    accounts_path = os.path.join(current_dir, "data", "accounts.json")
+    # A simulation writes nothing to the data files, the preflight cache included
+    preflight_cache_path = (
+        None
+        if args.command == "simulate"
+        else os.path.join(current_dir, "data", "preflight-cache.json")
+    )
+
+    if args.command == "query":
+        return run_query(args=args, current_dir=current_dir, logger=logger)
+
+    if args.command == "recommend":
+        return run_recommend(args=args, current_dir=current_dir, logger=logger)
+
+    if args.command == "watch":
+        return run_watch(args=args, current_dir=current_dir, logger=logger)
+
+    # Initialize PostList object and load posts from JSON file
+    posts_list = post_list.PostList(
+        log_path,
+        accounts_path=accounts_path,
+        preflight_cache_path=preflight_cache_path,
+        engagement_model_path=os.path.join(
+            current_dir, "data", "engagement-model.json"
+        ),
+    )
+
+    posts_list.get_posts_from_json_file(posts_file_path=to_post_path)
+    logger.info(f"Number of posts loaded: {len(posts_list.posts)}")
+
+    if args.command == "simulate":
+        return run_simulation(
+            args=args, current_dir=current_dir, posts_list=posts_list, logger=logger
+        )
+
+    post_data_dir = os.path.join(current_dir, "data", "scheduled_posts")
+    os.makedirs(post_data_dir, exist_ok=True)
+
+    if args.work_queue:
+        schedule_posts(
+            posts_list=posts_list,
+            cron=None,
+            current_dir=current_dir,
+            post_data_dir=post_data_dir,
+            logger=logger,
+            shared_queue=work_queue.SQLiteWorkQueue(db_path=args.work_queue),
+        )
+        logger.info(f"Posts added to the work queue: {args.work_queue}")
+        return
+
+    # Access the current user's CronTab object.
+    cron = CronTab(user=True)
+
+    schedule_posts(
+        posts_list=posts_list,
+        cron=cron,
+        current_dir=current_dir,
+        post_data_dir=post_data_dir,
+        logger=logger,
+    )
 
     # Write the cron jobs to the user's crontab
     try:
@@ -217,5 +908,56 @@ def main() -> None:
         log_and_exit(logger=logger, message=f"Failed to write to CronTab: {e}")
 
 
+def main() -> None:
+    """
+    Main function to schedule Instagram posts using cron jobs.
+
+    This function performs the following tasks:
+    1. Sets up logging to a file.
+    2. Loads a list of posts from a JSON file, resolving each post date to UTC in
+       the time zone of the post or of its account (`data/accounts.json`), and
+       moves posts as little as possible to respect each account's posting limits.
+    3. Creates a temporary JSON file for each post to be scheduled.
+    4. Schedules a cron job to execute a script for each post at the specified date and time.
+    5. Writes the cron jobs to the user's crontab.
+
+    The cron job will execute the script `media_post.py` with the path to the temporary JSON file as an argument.
+
+    With the `simulate` command, the same pipeline runs against a virtual clock
+    and nothing is written to the crontab or the data files. The `query` (or
+    `status`) command lists posts from the queue and the history files instead,
+    the `recommend` command prints the best posting hours from the engagement
+    model that "auto" post dates are picked from, and the `watch` command keeps
+    running and schedules posts as they are added.
+
+    With `--profile` (or `PROFILE_RUNS=1`), the run is profiled and its CPU and
+    memory profile is written to `logs/`, see `src/profiling.py`. The `watch`
+    command is never profiled, its profile would grow until it is interrupted.
+    """
+    args = parse_args()
+
+    # Determine the current directory of the script
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+
+    # Initialize logger
+    logger = logger_config.get_logger(
+        log_file=os.path.join(current_dir, "logs", "post-activity.log")
+    )
+
+    profile = profiling.profiling_enabled(args.profile)
+    if profile and args.command == "watch":
+        # Its profile would grow for the whole life of the watcher, written at Ctrl-C only
+        logger.warning("The watch command is not profiled, watching without profiling")
+        profile = False
+
+    with profiling.profile_run(
+        name=f"main-{args.command}",
+        logger=logger,
+        enabled=profile,
+        log_dir=os.path.join(current_dir, "logs"),
+    ):
+        run_command(args=args, current_dir=current_dir, logger=logger)
+
+
 if __name__ == "__main__":
     main()
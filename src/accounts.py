@@ -0,0 +1,48 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+# Settings of posts without an "account" key
+DEFAULT_ACCOUNT = "default"
+
+
+def load_accounts(accounts_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Load the per-account settings file.
+
+    The file maps an account name to its settings, e.g.:
+    `{"default": {"timezone": "Europe/Berlin"}}`. A missing file means no settings.
+
+    Args:
+    - accounts_path (str): The path to the accounts JSON file.
+
+    Returns:
+    - Dict[str, Dict[str, Any]]: The settings of every account.
+
+    Raises:
+    - json.JSONDecodeError: If the file is not valid JSON.
+    """
+    if not os.path.exists(accounts_path):
+        return {}
+
+    with open(accounts_path, "r") as accounts_file:
+        return json.load(accounts_file)
+
+
+def get_account_settings(
+    accounts: Dict[str, Dict[str, Any]], account: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Get the settings of an account, falling back to the default account.
+
+    Args:
+    - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+    - account (Optional[str]): The account name, None for the default account.
+
+    Returns:
+    - Dict[str, Any]: The settings of the account.
+    """
+    return {
+        **accounts.get(DEFAULT_ACCOUNT, {}),
+        **accounts.get(account or DEFAULT_ACCOUNT, {}),
+    }
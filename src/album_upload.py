@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from instagrapi import Client
+from instagrapi.extractors import extract_media_v1
+from instagrapi.types import Media
+from PIL import Image
+
+from post import Post
+
+# Number of configure attempts while Instagram finishes processing the items
+CONFIGURE_ATTEMPTS = 20
+CONFIGURE_TIMEOUT = 3
+
+# The response of `album_configure` while Instagram is still processing the items
+TRANSCODE_NOT_FINISHED = "Transcode not finished yet"
+
+JPEG_EXTENSIONS = {".jpg", ".jpeg"}
+
+
+def preprocess_album_item(image_path: str, index: int, work_dir: str) -> str:
+    """
+    Make sure an album item is an RGB JPEG, converting it into `work_dir` if needed.
+
+    Args:
+    - image_path (str): The path to the image file.
+    - index (int): The position of the item in the album, used to name converted files.
+    - work_dir (str): The directory to write converted images to.
+
+    Returns:
+    - str: The path to the image that should be uploaded.
+
+    Raises:
+    - OSError: If the image cannot be opened or converted.
+    """
+    with Image.open(image_path) as image:
+        image.verify()
+
+    with Image.open(image_path) as image:
+        if Path(image_path).suffix.lower() in JPEG_EXTENSIONS and image.mode == "RGB":
+            return image_path
+
+        converted_path = os.path.join(work_dir, f"{index}_{Path(image_path).stem}.jpg")
+        image.convert("RGB").save(converted_path, "JPEG", quality=95)
+
+    return converted_path
+
+
+def upload_album_item(
+    client: Client, image_path: str, index: int, work_dir: str, logger: logging.Logger
+) -> Dict[str, Any]:
+    """
+    Preprocess and upload a single album item, without configuring a post.
+
+    Args:
+    - client (Client): The Instagram client used for uploading media.
+    - image_path (str): The path to the image file.
+    - index (int): The position of the item in the album.
+    - work_dir (str): The directory to write converted images to.
+    - logger (logging.Logger): The logger instance to use for logging.
+
+    Returns:
+    - Dict[str, Any]: The album child entry expected by `album_configure`.
+    """
+    started_at = time.perf_counter()
+    upload_path = preprocess_album_item(
+        image_path=image_path, index=index, work_dir=work_dir
+    )
+    preprocessed_at = time.perf_counter()
+
+    # A unique upload id per item, the default is time based and collides under concurrency
+    upload_id = str(uuid.uuid4().int)[:16]
+    upload_id, width, height = client.photo_rupload(
+        Path(upload_path), upload_id=upload_id, to_album=True
+    )
+    uploaded_at = time.perf_counter()
+
+    logger.info(
+        f"Album item {index} ({image_path}) uploaded: "
+        f"preprocess {preprocessed_at - started_at:.2f}s, "
+        f"upload {uploaded_at - preprocessed_at:.2f}s"
+    )
+
+    return {
+        "upload_id": upload_id,
+        "edits": json.dumps(
+            {
+                "crop_original_size": [width, height],
+                "crop_center": [0.0, -0.0],
+                "crop_zoom": 1.0,
+            }
+        ),
+        "extra": json.dumps({"source_width": width, "source_height": height}),
+        "scene_capture_type": "",
+        "scene_type": None,
+    }
+
+
+def upload_album(
+    client: Client,
+    paths: List[str],
+    caption: str,
+    logger: logging.Logger,
+    extra_data: Optional[Dict[str, Any]] = None,
+) -> Media:
+    """
+    Upload every album item concurrently and configure the album once all are in.
+
+    Args:
+    - client (Client): The Instagram client used for uploading media.
+    - paths (List[str]): The paths to the album images, in display order.
+    - caption (str): The caption for the album.
+    - logger (logging.Logger): The logger instance to use for logging.
+    - extra_data (Optional[Dict[str, Any]]): Additional data for the post.
+
+    Returns:
+    - Media: The configured album.
+
+    Raises:
+    - ValueError: If the number of items is out of range.
+    - RuntimeError: If the items are still being processed after every attempt.
+    - Exception: Whatever else `album_configure` raised.
+    """
+    if not Post.MIN_ALBUM_ITEMS <= len(paths) <= Post.MAX_ALBUM_ITEMS:
+        raise ValueError(
+            f"An album needs between {Post.MIN_ALBUM_ITEMS} and {Post.MAX_ALBUM_ITEMS} items, got {len(paths)}"
+        )
+
+    started_at = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+            futures = [
+                executor.submit(
+                    upload_album_item,
+                    client=client,
+                    image_path=path,
+                    index=index,
+                    work_dir=work_dir,
+                    logger=logger,
+                )
+                for index, path in enumerate(paths)
+            ]
+            # Keep the children in the requested display order
+            children = [future.result() for future in futures]
+
+    logger.info(
+        f"Uploaded {len(children)} album items in {time.perf_counter() - started_at:.2f}s"
+    )
+
+    for attempt in range(CONFIGURE_ATTEMPTS):
+        time.sleep(CONFIGURE_TIMEOUT)
+        try:
+            configured = client.album_configure(
+                children, caption, [], None, extra_data=extra_data or {}
+            )
+        except Exception as e:
+            # Only the items still being processed are worth another attempt,
+            # anything else goes to the caller to be classified
+            if TRANSCODE_NOT_FINISHED not in str(e):
+                raise
+            logger.warning(f"Album configure attempt {attempt} failed: {e}")
+            continue
+
+        if configured:
+            logger.info(
+                f"Album configured {time.perf_counter() - started_at:.2f}s after upload start"
+            )
+            return extract_media_v1(configured.get("media"))
+
+    raise RuntimeError(
+        f"Failed to configure the album after {CONFIGURE_ATTEMPTS} attempts"
+    )
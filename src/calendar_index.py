@@ -0,0 +1,167 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from accounts import DEFAULT_ACCOUNT
+from post import Post
+
+
+class CalendarIndex:
+    """
+    A sorted index of posts by their UTC post date, overall and per account.
+
+    Range queries use binary search, so they cost O(log n) plus the size of the
+    answer, even for queues with hundreds of thousands of posts.
+    """
+
+    def __init__(self):
+        # Parallel sorted lists: timestamps and (timestamp, insertion order) keys
+        self._timestamps: List[float] = []
+        self._entries: List[Tuple[float, int, Post]] = []
+        self._account_timestamps: Dict[str, List[float]] = {}
+        self._counter = 0
+
+    @classmethod
+    def from_posts(cls, posts: Iterable[Post]) -> "CalendarIndex":
+        """
+        Build the index from posts whose `post_date_utc` is resolved.
+
+        Args:
+        - posts (Iterable[Post]): The posts to index.
+
+        Returns:
+        - CalendarIndex: The populated index.
+        """
+        index = cls()
+        entries = []
+        for post in posts:
+            entries.append((post.post_date_utc.timestamp(), index._counter, post))
+            index._counter += 1
+
+        # Sort once instead of inserting one by one
+        entries.sort(key=lambda entry: (entry[0], entry[1]))
+        index._entries = entries
+        index._timestamps = [entry[0] for entry in entries]
+        for timestamp, _, post in entries:
+            index._account_timestamps.setdefault(
+                post.account or DEFAULT_ACCOUNT, []
+            ).append(timestamp)
+
+        return index
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, post: Post) -> None:
+        """
+        Add a post to the index.
+
+        Args:
+        - post (Post): The post to add, with `post_date_utc` resolved.
+        """
+        timestamp = post.post_date_utc.timestamp()
+        position = bisect_right(self._timestamps, timestamp)
+        self._timestamps.insert(position, timestamp)
+        self._entries.insert(position, (timestamp, self._counter, post))
+        self._counter += 1
+        insort(
+            self._account_timestamps.setdefault(post.account or DEFAULT_ACCOUNT, []),
+            timestamp,
+        )
+
+    def between(self, start: datetime, end: datetime) -> List[Post]:
+        """
+        Get the posts scheduled in `[start, end)`, in chronological order.
+
+        Args:
+        - start (datetime): The aware start of the range.
+        - end (datetime): The aware end of the range.
+
+        Returns:
+        - List[Post]: The posts in the range.
+        """
+        low = bisect_left(self._timestamps, start.timestamp())
+        high = bisect_left(self._timestamps, end.timestamp())
+        return [post for _, _, post in self._entries[low:high]]
+
+    def due_within(self, now: datetime, minutes: int) -> List[Post]:
+        """
+        Get the posts due in the next `minutes` minutes.
+
+        Args:
+        - now (datetime): The aware current time.
+        - minutes (int): The size of the window.
+
+        Returns:
+        - List[Post]: The posts due in the window, in chronological order.
+        """
+        return self.between(start=now, end=now + timedelta(minutes=minutes))
+
+    def count_between(
+        self, start: datetime, end: datetime, account: Optional[str] = None
+    ) -> int:
+        """
+        Count the posts of an account (or of every account) scheduled in `[start, end)`.
+
+        Args:
+        - start (datetime): The aware start of the range.
+        - end (datetime): The aware end of the range.
+        - account (Optional[str]): The account to count, None for every account.
+
+        Returns:
+        - int: The number of posts in the range.
+        """
+        timestamps = (
+            self._timestamps
+            if account is None
+            else self._account_timestamps.get(account, [])
+        )
+        return bisect_left(timestamps, end.timestamp()) - bisect_left(
+            timestamps, start.timestamp()
+        )
+
+    def is_slot_free(
+        self, start: datetime, end: datetime, account: Optional[str] = None
+    ) -> bool:
+        """
+        Check whether no post of an account (or of any account) falls in `[start, end)`.
+
+        Args:
+        - start (datetime): The aware start of the slot.
+        - end (datetime): The aware end of the slot.
+        - account (Optional[str]): The account to check, None for every account.
+
+        Returns:
+        - bool: True if the slot is free, False otherwise.
+        """
+        return self.count_between(start=start, end=end, account=account) == 0
+
+    def free_slots(
+        self,
+        start: datetime,
+        end: datetime,
+        slot_minutes: int = 1,
+        account: Optional[str] = None,
+    ) -> List[datetime]:
+        """
+        List the free slots of `slot_minutes` minutes between `start` and `end`.
+
+        Args:
+        - start (datetime): The aware start of the range.
+        - end (datetime): The aware end of the range.
+        - slot_minutes (int): The length of a slot in minutes.
+        - account (Optional[str]): The account to check, None for every account.
+
+        Returns:
+        - List[datetime]: The start time of every free slot.
+        """
+        slot = timedelta(minutes=slot_minutes)
+        slots: List[datetime] = []
+
+        current = start
+        while current + slot <= end:
+            if self.is_slot_free(start=current, end=current + slot, account=account):
+                slots.append(current)
+            current += slot
+
+        return slots
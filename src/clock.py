@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Callable, Optional
+
+from dateutil import tz
+
+
+def _system_now() -> datetime:
+    """The current UTC time from the system clock."""
+    return datetime.now(tz=tz.UTC)
+
+
+_now: Callable[[], datetime] = _system_now
+
+
+def now() -> datetime:
+    """
+    Get the current aware UTC time.
+
+    Scheduling and retry code reads the time through this function, so a
+    simulation can substitute a virtual clock with `set_clock`.
+
+    Returns:
+    - datetime: The current UTC time.
+    """
+    return _now()
+
+
+def set_clock(now_function: Optional[Callable[[], datetime]]) -> None:
+    """
+    Replace the clock used by `now`, or restore the system clock with None.
+
+    Args:
+    - now_function (Optional[Callable[[], datetime]]): A function returning the aware current time.
+    """
+    global _now
+    _now = now_function or _system_now
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dateutil import tz
+
+import clock
+from accounts import DEFAULT_ACCOUNT, get_account_settings
+from history import read_records, tail_matches
+
+# Engagement is only read once a post had a day to collect likes and comments
+MATURE_AFTER = timedelta(hours=24)
+
+# A comment is worth more than a like
+COMMENT_WEIGHT = 2.0
+
+# Slots with few posts are pulled towards the account average by this many virtual posts
+PRIOR_POSTS = 3.0
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def engagement_score(media: Any) -> float:
+    """
+    Score the engagement of a published media.
+
+    Args:
+    - media (Any): The media, as returned by `Client.media_info`.
+
+    Returns:
+    - float: The number of likes plus the weighted number of comments.
+    """
+    return float(media.like_count or 0) + COMMENT_WEIGHT * float(
+        media.comment_count or 0
+    )
+
+
+def account_timezone(accounts: Dict[str, Dict[str, Any]], account: Optional[str]) -> Any:
+    """
+    Get the time zone an account posts in, the machine's local one by default.
+
+    Args:
+    - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+    - account (Optional[str]): The account name, None for the default account.
+
+    Returns:
+    - tzinfo: The time zone of the account.
+    """
+    timezone_name = get_account_settings(accounts=accounts, account=account).get(
+        "timezone"
+    )
+    return tz.gettz(timezone_name) if timezone_name else tz.tzlocal()
+
+
+class EngagementModel:
+    """
+    The average engagement of the posts of every account, by weekday and hour.
+
+    The model is kept in a JSON file together with how far into `success.json`
+    it has read, so an update only fetches the engagement of the posts that
+    matured since the previous update instead of rescanning the whole history.
+    """
+
+    def __init__(self, model_path: str, logger: logging.Logger):
+        self.model_path = model_path
+        self.logger = logger
+
+        state = self._load()
+        self.cursor: Dict[str, Any] = state.get("cursor", {})
+        # account -> "weekday-hour" -> [number of posts, mean score]
+        self.slots: Dict[str, Dict[str, List[float]]] = state.get("slots", {})
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the saved model, an unreadable or missing file is an empty model."""
+        if not os.path.exists(self.model_path):
+            return {}
+
+        try:
+            with open(self.model_path, "r") as model_file:
+                return json.load(model_file)
+        except (IOError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """Atomically write the model back to disk."""
+        temp_path = f"{self.model_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as model_file:
+            json.dump({"cursor": self.cursor, "slots": self.slots}, model_file)
+        os.replace(temp_path, self.model_path)
+
+    def add(self, account: str, weekday: int, hour: int, score: float) -> None:
+        """
+        Add the engagement of one post, updating the running mean of its slot.
+
+        Args:
+        - account (str): The account that published the post.
+        - weekday (int): The weekday it was published on, Monday is 0.
+        - hour (int): The hour it was published at, in the account's time zone.
+        - score (float): Its engagement score.
+        """
+        slot = self.slots.setdefault(account, {}).setdefault(
+            f"{weekday}-{hour}", [0, 0.0]
+        )
+        slot[0] += 1
+        slot[1] += (score - slot[1]) / slot[0]
+
+    def update_from_history(
+        self,
+        success_path: str,
+        accounts: Dict[str, Dict[str, Any]],
+        get_client: Callable[[Optional[str]], Any],
+        now: Optional[datetime] = None,
+    ) -> int:
+        """
+        Fetch the engagement of the posts published since the last update.
+
+        Reading stops at the first post younger than `MATURE_AFTER`, so it is
+        picked up by a later update once its engagement settled, and at the first
+        post of an account that cannot log in, so it is not skipped.
+
+        Args:
+        - success_path (str): The path to the success file.
+        - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+        - get_client (Callable[[Optional[str]], Any]): Returns the client of an account,
+          anything with a `media_info(media_pk)` method.
+        - now (Optional[datetime]): The aware current time. Defaults to the clock.
+
+        Returns:
+        - int: The number of posts added to the model.
+        """
+        now = now or clock.now()
+        added = 0
+
+        if not os.path.exists(success_path):
+            return added
+
+        try:
+            with open(success_path, "rb") as success_file:
+                start = self.cursor.get("end", 0)
+                if start and not tail_matches(
+                    success_file,
+                    self.cursor.get("start", 0),
+                    start,
+                    self.cursor.get("hash", ""),
+                ):
+                    self.logger.warning(
+                        f"'{success_path}' was rewritten, "
+                        "rebuilding the engagement model"
+                    )
+                    self.cursor, self.slots, start = {}, {}, 0
+
+                success_file.seek(start)
+                for record_start, raw, post in read_records(success_file, start):
+                    published_at = post.get("published_at")
+                    media_pk = post.get("media_pk")
+
+                    if published_at and media_pk:
+                        published = datetime.fromisoformat(published_at)
+                        if now - published < MATURE_AFTER:
+                            break
+
+                        account = post.get("account")
+                        try:
+                            media = get_client(account).media_info(media_pk)
+                        except SystemExit:
+                            # The account could not log in, its post is read again
+                            # by the next update instead of being skipped
+                            self.logger.error(
+                                "Could not log in account "
+                                f"'{account or DEFAULT_ACCOUNT}', "
+                                "stopping the engagement update"
+                            )
+                            break
+                        except Exception as e:
+                            # Deleted media and the like, the post just does not count
+                            self.logger.warning(
+                                "Could not fetch the engagement of media "
+                                f"{media_pk}: {e}"
+                            )
+                        else:
+                            local = published.astimezone(
+                                account_timezone(accounts, account)
+                            )
+                            self.add(
+                                account=account or DEFAULT_ACCOUNT,
+                                weekday=local.weekday(),
+                                hour=local.hour,
+                                score=engagement_score(media),
+                            )
+                            added += 1
+
+                    self.cursor = {
+                        "start": record_start,
+                        "end": record_start + len(raw),
+                        "hash": hashlib.sha256(raw).hexdigest(),
+                    }
+        finally:
+            # Keep the progress made so far, whatever stopped the update
+            self.save()
+
+        return added
+
+    def slot_scores(self, account: Optional[str]) -> Dict[Tuple[int, int], float]:
+        """
+        Score every weekday and hour slot an account has posted in.
+
+        Scores are shrunk towards the account average by `PRIOR_POSTS`, so a
+        single lucky post does not make its slot the best one.
+
+        Args:
+        - account (Optional[str]): The account name, None for the default account.
+
+        Returns:
+        - Dict[Tuple[int, int], float]: The score of every (weekday, hour) slot.
+        """
+        slots = self.slots.get(account or DEFAULT_ACCOUNT, {})
+        total = sum(count for count, _ in slots.values())
+        if not total:
+            return {}
+
+        average = sum(count * mean for count, mean in slots.values()) / total
+        scores: Dict[Tuple[int, int], float] = {}
+        for key, (count, mean) in slots.items():
+            weekday, hour = (int(part) for part in key.split("-"))
+            scores[(weekday, hour)] = (count * mean + PRIOR_POSTS * average) / (
+                count + PRIOR_POSTS
+            )
+        return scores
+
+    def best_slots(
+        self, account: Optional[str], top: int = 3
+    ) -> Dict[int, List[Tuple[int, float]]]:
+        """
+        Get the best hours of every weekday for an account.
+
+        Args:
+        - account (Optional[str]): The account name, None for the default account.
+        - top (int): The number of hours per weekday.
+
+        Returns:
+        - Dict[int, List[Tuple[int, float]]]: The best (hour, score) pairs of every weekday.
+        """
+        by_weekday: Dict[int, List[Tuple[int, float]]] = {}
+        for (weekday, hour), score in self.slot_scores(account).items():
+            by_weekday.setdefault(weekday, []).append((hour, score))
+
+        return {
+            weekday: sorted(hours, key=lambda pair: (-pair[1], pair[0]))[:top]
+            for weekday, hours in sorted(by_weekday.items())
+        }
+
+    def next_slots(
+        self, account: Optional[str], timezone: Any, now: datetime, count: int
+    ) -> List[datetime]:
+        """
+        Get the `count` best upcoming hours of the next week for an account.
+
+        Hours without history rank below every known one, by time, so an account
+        without any history gets the next hours.
+
+        Args:
+        - account (Optional[str]): The account name, None for the default account.
+        - timezone (tzinfo): The time zone of the account.
+        - now (datetime): The aware current time.
+        - count (int): The number of slots.
+
+        Returns:
+        - List[datetime]: The slots, best first, aware in the account's time zone.
+        """
+        scores = self.slot_scores(account)
+        first = now.astimezone(timezone).replace(
+            minute=0, second=0, microsecond=0
+        ) + timedelta(hours=1)
+
+        candidates = [first + timedelta(hours=offset) for offset in range(7 * 24)]
+        ranked = sorted(
+            candidates,
+            key=lambda slot: -scores.get((slot.weekday(), slot.hour), float("-inf")),
+        )
+
+        # More posts than hours in a week wrap around to the following weeks
+        return [
+            ranked[index % len(ranked)] + timedelta(weeks=index // len(ranked))
+            for index in range(count)
+        ]
+
+
+def print_recommendations(model: EngagementModel, accounts: List[str], top: int) -> None:
+    """
+    Print the best hours of every weekday for each account.
+
+    Args:
+    - model (EngagementModel): The engagement model.
+    - accounts (List[str]): The accounts to print.
+    - top (int): The number of hours per weekday.
+    """
+    for account in accounts:
+        print(f"Account '{account}':")
+        best = model.best_slots(account=account, top=top)
+        if not best:
+            print("  no engagement history yet")
+            continue
+
+        for weekday, hours in best.items():
+            slots = ", ".join(f"{hour:02d}:00 ({score:.1f})" for hour, score in hours)
+            print(f"  {WEEKDAYS[weekday]:<10} {slots}")
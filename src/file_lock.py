@@ -0,0 +1,22 @@
+import fcntl
+from contextlib import contextmanager
+from typing import Iterator
+
+
+@contextmanager
+def locked(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a file for a read-modify-write, across processes.
+
+    The lock is taken on a "<path>.lock" file next to it, so the file itself can
+    still be replaced atomically while the lock is held.
+
+    Args:
+    - path (str): The path to the file to lock.
+    """
+    with open(f"{path}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
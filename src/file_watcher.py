@@ -0,0 +1,239 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+# Events of inotify(7) that mean a watched file was written, replaced or removed
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+
+# struct inotify_event: wd, mask, cookie, len, then the name
+EVENT_HEADER = struct.Struct("iIII")
+
+# How often the polling watcher looks at the files
+POLL_INTERVAL_SECONDS = 0.25
+
+# A burst of changes is handled once it has been quiet this long, or at the latest after the max delay
+DEBOUNCE_SECONDS = 0.2
+MAX_DELAY_SECONDS = 0.6
+
+
+class InotifyWatcher:
+    """
+    Watch files and directories with Linux inotify, through libc.
+
+    Files are watched through their directory, so editors and writers that
+    replace a file instead of writing it in place are still seen.
+    """
+
+    def __init__(self, files: List[str], directories: List[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        # watch descriptor -> (directory, the watched file names or None for every file)
+        self.watches: Dict[int, Tuple[str, Optional[Set[str]]]] = {}
+        targets: Dict[str, Optional[Set[str]]] = {
+            os.path.abspath(directory): None for directory in directories
+        }
+        for path in files:
+            directory, name = os.path.split(os.path.abspath(path))
+            if directory not in targets:
+                targets[directory] = set()
+            if targets[directory] is not None:
+                targets[directory].add(name)
+
+        for directory, names in targets.items():
+            wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"Cannot watch '{directory}'")
+            self.watches[wd] = (directory, names)
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Wait for changes.
+
+        Args:
+        - timeout (Optional[float]): The seconds to wait at most, None to wait until a change.
+
+        Returns:
+        - Set[str]: The changed paths, empty if the timeout ran out. A queue
+          overflow reports every watched path.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed: Set[str] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    changed |= self.watched_paths()
+                    continue
+
+                if wd in self.watches:
+                    directory, names = self.watches[wd]
+                    if name and (names is None or name in names):
+                        changed.add(os.path.join(directory, name))
+
+        return changed
+
+    def watched_paths(self) -> Set[str]:
+        """Get the watched files, and the watched directories."""
+        paths = set()
+        for directory, names in self.watches.values():
+            if names is None:
+                paths.add(directory)
+            else:
+                paths.update(os.path.join(directory, name) for name in names)
+        return paths
+
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Watch files and directories by comparing their size and modification time,
+    where inotify is not available.
+    """
+
+    def __init__(self, files: List[str], directories: List[str]):
+        self.files = [os.path.abspath(path) for path in files]
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.signatures = self._scan()
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+        """Get the inode, size and modification time of a file, None if it is missing."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _scan(self) -> Dict[str, Optional[Tuple[int, int, int]]]:
+        """Get the signature of every watched file and of every file in the watched directories."""
+        signatures = {path: self._signature(path) for path in self.files}
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            signatures[entry.path] = self._signature(entry.path)
+            except OSError:
+                continue
+        return signatures
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Wait for changes, looking every `POLL_INTERVAL_SECONDS`.
+
+        Args:
+        - timeout (Optional[float]): The seconds to wait at most, None to wait until a change.
+
+        Returns:
+        - Set[str]: The changed paths, empty if the timeout ran out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            signatures = self._scan()
+            changed = {
+                path
+                for path in signatures.keys() | self.signatures.keys()
+                if signatures.get(path) != self.signatures.get(path)
+            }
+            self.signatures = signatures
+            if changed:
+                return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(
+                POLL_INTERVAL_SECONDS
+                if deadline is None
+                else max(0.0, min(POLL_INTERVAL_SECONDS, deadline - time.monotonic()))
+            )
+
+    def close(self) -> None:
+        """Stop watching."""
+
+
+def create_watcher(
+    files: List[str], directories: List[str], polling: bool = False
+) -> Union[InotifyWatcher, PollingWatcher]:
+    """
+    Watch files and directories with inotify, or by polling where it is not available.
+
+    Args:
+    - files (List[str]): The files to watch, they may not exist yet.
+    - directories (List[str]): The directories whose files to watch, they must exist.
+    - polling (bool): Poll even if inotify is available, e.g. on network file systems.
+
+    Returns:
+    - Union[InotifyWatcher, PollingWatcher]: The watcher.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(files=files, directories=directories)
+        except (OSError, AttributeError):
+            # Not Linux, or out of inotify instances or watches
+            pass
+    return PollingWatcher(files=files, directories=directories)
+
+
+def wait_for_burst(
+    watcher: Union[InotifyWatcher, PollingWatcher], timeout: Optional[float] = None
+) -> Set[str]:
+    """
+    Wait for changes, and collect the rest of their burst: return once no change
+    came for `DEBOUNCE_SECONDS`, or `MAX_DELAY_SECONDS` after the first change.
+
+    Args:
+    - watcher (Union[InotifyWatcher, PollingWatcher]): The watcher.
+    - timeout (Optional[float]): The seconds to wait for a first change, None to wait until one.
+
+    Returns:
+    - Set[str]: The changed paths, empty if the timeout ran out.
+    """
+    changed = watcher.wait(timeout)
+    if not changed:
+        return changed
+
+    deadline = time.monotonic() + MAX_DELAY_SECONDS
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return changed
+        more = watcher.wait(min(DEBOUNCE_SECONDS, remaining))
+        if not more:
+            return changed
+        changed |= more
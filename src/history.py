@@ -0,0 +1,494 @@
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from accounts import DEFAULT_ACCOUNT
+
+# Statuses of a post, in the order they are listed
+STATUSES = ["queued", "retrying", "success", "error"]
+
+# The history files that are indexed, the queues are small and read directly
+HISTORY_FILES = {"success": "success.json", "error": "error.json"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    status TEXT PRIMARY KEY,
+    indexed_end INTEGER NOT NULL,
+    tail_start INTEGER NOT NULL,
+    tail_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    status TEXT NOT NULL,
+    post_date TEXT NOT NULL,
+    account TEXT NOT NULL,
+    error_type TEXT,
+    record_offset INTEGER,
+    record_length INTEGER,
+    record TEXT
+);
+"""
+
+INDEXES = {
+    "records_by_date": "records (status, post_date)",
+    "records_by_account": "records (account, post_date)",
+    "records_by_error_type": "records (error_type, post_date)",
+}
+
+# Above this many new rows, the indexes are rebuilt once instead of updated per row
+BULK_INSERT_ROWS = 10000
+
+_decoder = json.JSONDecoder()
+
+
+def parse_date_bound(value: str, end: bool = False) -> str:
+    """
+    Parse a `--since`/`--until` value into the "%Y-%m-%d %H:%M" form of post dates.
+
+    Args:
+    - value (str): A "%Y-%m-%d" or "%Y-%m-%d %H:%M" date.
+    - end (bool): True for an exclusive upper bound, a bare day then includes the whole day.
+
+    Returns:
+    - str: The bound, comparable with the `post_date` strings.
+
+    Raises:
+    - ValueError: If the value matches neither format.
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M").strftime("%Y-%m-%d %H:%M")
+    except ValueError:
+        day = datetime.strptime(value, "%Y-%m-%d")
+        if end:
+            day += timedelta(days=1)
+        return day.strftime("%Y-%m-%d %H:%M")
+
+
+def _normalize_date(post_date: Any) -> str:
+    """Cut a post date to the "%Y-%m-%d %H:%M" form, the seconds are never used."""
+    return str(post_date or "")[:16]
+
+
+def _index_fields(post: Dict[str, Any]) -> Tuple[str, str, Optional[str]]:
+    """Get the indexed post date, account and error type of a record."""
+    error = post.get("error")
+    return (
+        _normalize_date(post.get("post_date")),
+        post.get("account") or DEFAULT_ACCOUNT,
+        error.get("type") if isinstance(error, dict) else None,
+    )
+
+
+def read_records(
+    history_file: Any, offset: int
+) -> Iterator[Tuple[int, bytes, Dict[str, Any]]]:
+    """
+    Read the records of a history file written one record per line, from the current position.
+
+    Args:
+    - history_file (Any): The file, opened in binary mode.
+    - offset (int): The current position in the file.
+
+    Yields:
+    - Tuple[int, bytes, Dict[str, Any]]: The byte offset, raw line and content of every record.
+
+    Raises:
+    - ValueError: If a record spans several lines, so the file must be parsed whole.
+    """
+    for line in history_file:
+        stripped = line.strip()
+        if stripped.endswith(b","):
+            stripped = stripped[:-1]
+
+        if stripped.startswith(b"{") and stripped.endswith(b"}"):
+            try:
+                post = _decoder.decode(stripped.decode())
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                raise ValueError(f"Unreadable record at byte {offset}: {e}")
+            yield offset + line.index(b"{"), stripped, post
+        elif stripped not in (b"", b"[", b"]", b"[]"):
+            raise ValueError(f"Record spanning several lines at byte {offset}")
+
+        offset += len(line)
+
+
+def tail_matches(history_file: Any, tail_start: int, tail_end: int, tail_hash: str) -> bool:
+    """
+    Check that the last record read from a file is still where it was, so the
+    file only grew since and reading can resume after it.
+
+    Args:
+    - history_file (Any): The file, opened in binary mode.
+    - tail_start (int): The byte offset of the last record read.
+    - tail_end (int): The byte offset right after it.
+    - tail_hash (str): The SHA-256 hex digest of the record.
+
+    Returns:
+    - bool: True if reading can resume at `tail_end`.
+    """
+    history_file.seek(tail_start)
+    tail = history_file.read(tail_end - tail_start)
+    return hashlib.sha256(tail).hexdigest() == tail_hash
+
+
+class HistoryIndex:
+    """
+    A SQLite index over the success and error files.
+
+    The files are written one record per line, so the index only stores the byte
+    range of each record next to the filtered fields, and a query reads back just
+    the matching lines. The files only ever grow at the end, so a refresh indexes
+    the new records only; anything else triggers a full rebuild.
+    """
+
+    def __init__(self, data_dir: str, db_path: str):
+        self.data_dir = data_dir
+        self.connection = sqlite3.connect(db_path, timeout=30.0)
+        self.connection.executescript(SCHEMA)
+        self._create_indexes()
+
+    def _create_indexes(self) -> None:
+        """Create the indexes of the filtered columns if they are missing."""
+        for name, columns in INDEXES.items():
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+
+    def _insert(self, columns: List[str], rows: List[Tuple[Any, ...]]) -> None:
+        """
+        Insert records, dropping the indexes around large batches such as a first build.
+
+        Args:
+        - columns (List[str]): The columns the rows fill.
+        - rows (List[Tuple[Any, ...]]): The rows to insert.
+        """
+        bulk = len(rows) > BULK_INSERT_ROWS
+        if bulk:
+            for name in INDEXES:
+                self.connection.execute(f"DROP INDEX IF EXISTS {name}")
+
+        self.connection.executemany(
+            f"INSERT INTO records ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})",
+            rows,
+        )
+
+        if bulk:
+            self._create_indexes()
+
+    def refresh(self) -> None:
+        """Bring the index up to date with the history files."""
+        # Take the write lock first, so concurrent refreshes do not index a record twice
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            for status, file_name in HISTORY_FILES.items():
+                self._refresh_file(status, os.path.join(self.data_dir, file_name))
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def _refresh_file(self, status: str, path: str) -> None:
+        """
+        Index the records appended to a history file since the last refresh.
+
+        Args:
+        - status (str): The status of the records of the file.
+        - path (str): The path to the file.
+        """
+        source = self.connection.execute(
+            "SELECT indexed_end, tail_start, tail_hash FROM sources WHERE status = ?",
+            (status,),
+        ).fetchone()
+
+        if not os.path.exists(path):
+            self._clear(status)
+            return
+
+        with open(path, "rb") as history_file:
+            start = 0
+            if source is not None:
+                indexed_end, tail_start, tail_hash = source
+
+                # The last indexed record is unchanged, so everything before it is too
+                if tail_matches(history_file, tail_start, indexed_end, tail_hash):
+                    start = indexed_end
+                else:
+                    self._clear(status)
+
+            history_file.seek(start)
+            if not self._index_lines(status, history_file, start):
+                self._index_whole_file(status, path)
+
+    def _clear(self, status: str) -> None:
+        """Drop every indexed record of a status."""
+        self.connection.execute("DELETE FROM records WHERE status = ?", (status,))
+        self.connection.execute("DELETE FROM sources WHERE status = ?", (status,))
+
+    def _index_lines(self, status: str, history_file: Any, offset: int) -> bool:
+        """
+        Index a file written one record per line, from the current position.
+
+        Args:
+        - status (str): The status of the records of the file.
+        - history_file (Any): The file, opened in binary mode.
+        - offset (int): The current position in the file.
+
+        Returns:
+        - bool: False if a record spans several lines, so the file must be parsed whole.
+        """
+        rows: List[Tuple[Any, ...]] = []
+        tail: Optional[Tuple[int, bytes]] = None
+
+        try:
+            for record_start, raw, post in read_records(history_file, offset):
+                rows.append((status, *_index_fields(post), record_start, len(raw)))
+                tail = (record_start, raw)
+        except ValueError:
+            return False
+
+        self._insert(
+            columns=[
+                "status",
+                "post_date",
+                "account",
+                "error_type",
+                "record_offset",
+                "record_length",
+            ],
+            rows=rows,
+        )
+        if tail is not None:
+            self._save_source(status, tail[0], tail[1])
+        return True
+
+    def _index_whole_file(self, status: str, path: str) -> None:
+        """
+        Index a file written with records spanning several lines, keeping the
+        records themselves in the index. The next write of the file by
+        `handle_post_update` turns it into one record per line.
+
+        Args:
+        - status (str): The status of the records of the file.
+        - path (str): The path to the file.
+        """
+        self._clear(status)
+        with open(path, "r") as history_file:
+            posts = json.load(history_file)
+
+        self._insert(
+            columns=["status", "post_date", "account", "error_type", "record"],
+            rows=[(status, *_index_fields(post), json.dumps(post)) for post in posts],
+        )
+        # An impossible hash, so the next refresh indexes the file again
+        self._save_source(status, 0, b"", tail_hash="")
+
+    def _save_source(
+        self,
+        status: str,
+        tail_start: int,
+        tail: bytes,
+        tail_hash: Optional[str] = None,
+    ) -> None:
+        """Remember where the indexed part of a file ends and what its last record is."""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO sources (status, indexed_end, tail_start, tail_hash) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                status,
+                tail_start + len(tail),
+                tail_start,
+                hashlib.sha256(tail).hexdigest() if tail_hash is None else tail_hash,
+            ),
+        )
+
+    def query(
+        self,
+        statuses: List[str],
+        account: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        error_type: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream the indexed records matching the filters, ordered by post date.
+
+        Args:
+        - statuses (List[str]): The statuses to include, "success" and/or "error".
+        - account (Optional[str]): Only the posts of this account.
+        - since (Optional[str]): Only the posts dated at or after this "%Y-%m-%d %H:%M" date.
+        - until (Optional[str]): Only the posts dated before this "%Y-%m-%d %H:%M" date.
+        - error_type (Optional[str]): Only the failures with this exception type.
+
+        Yields:
+        - Dict[str, Any]: The status, post date, account, error type and post of a record.
+        """
+        statuses = [status for status in statuses if status in HISTORY_FILES]
+        if not statuses:
+            return
+
+        conditions = [f"status IN ({', '.join('?' for _ in statuses)})"]
+        parameters: List[Any] = list(statuses)
+        for condition, value in [
+            ("account = ?", account),
+            ("post_date >= ?", since),
+            ("post_date < ?", until),
+            ("error_type = ?", error_type),
+        ]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        cursor = self.connection.execute(
+            "SELECT status, post_date, account, error_type, record_offset, record_length, record "
+            f"FROM records WHERE {' AND '.join(conditions)} ORDER BY post_date, rowid",
+            parameters,
+        )
+
+        files: Dict[str, Any] = {}
+        try:
+            for status, post_date, account_name, error, offset, length, record in cursor:
+                if record is None:
+                    if status not in files:
+                        files[status] = open(
+                            os.path.join(self.data_dir, HISTORY_FILES[status]), "rb"
+                        )
+                    files[status].seek(offset)
+                    record = files[status].read(length)
+
+                yield {
+                    "status": status,
+                    "post_date": post_date,
+                    "account": account_name,
+                    "error_type": error,
+                    "post": json.loads(record),
+                }
+        finally:
+            for history_file in files.values():
+                history_file.close()
+
+    def close(self) -> None:
+        """Close the index database."""
+        self.connection.close()
+
+
+def iter_queued(
+    data_dir: str, statuses: List[str]
+) -> Iterator[Tuple[str, Dict[str, Any], Optional[str]]]:
+    """
+    Read the posts still waiting to be published, from the to-post file and the retry queue.
+
+    Args:
+    - data_dir (str): The data directory.
+    - statuses (List[str]): The statuses to include, "queued" and/or "retrying".
+
+    Yields:
+    - Tuple[str, Dict[str, Any], Optional[str]]: The status, post and error type of a post.
+    """
+    if "queued" in statuses:
+        to_post_path = os.path.join(data_dir, "to-post.json")
+        if os.path.exists(to_post_path):
+            with open(to_post_path, "r") as to_post_file:
+                for post in json.load(to_post_file).get("posts", []):
+                    yield "queued", post, None
+
+    if "retrying" in statuses:
+        queue_path = os.path.join(data_dir, "retry-queue.json")
+        if os.path.exists(queue_path):
+            with open(queue_path, "r") as queue_file:
+                for entry in json.load(queue_file):
+                    yield "retrying", entry["post"], entry.get("error_type")
+
+
+def query_posts(
+    data_dir: str,
+    db_path: str,
+    statuses: Optional[List[str]] = None,
+    account: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    error_type: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream every post matching the filters: the queued and retrying posts first,
+    then the published and failed ones from the index, each ordered by post date.
+
+    Args:
+    - data_dir (str): The data directory.
+    - db_path (str): The path to the index database.
+    - statuses (Optional[List[str]]): The statuses to include. Defaults to all of them.
+    - account (Optional[str]): Only the posts of this account.
+    - since (Optional[str]): Only the posts dated at or after this "%Y-%m-%d %H:%M" date.
+    - until (Optional[str]): Only the posts dated before this "%Y-%m-%d %H:%M" date.
+    - error_type (Optional[str]): Only the failures with this exception type.
+
+    Yields:
+    - Dict[str, Any]: The status, post date, account, error type and post of a match.
+    """
+    statuses = statuses or STATUSES
+
+    pending = []
+    for status, post, error in iter_queued(data_dir=data_dir, statuses=statuses):
+        post_date, account_name, _ = _index_fields(post)
+        if (
+            (account is None or account_name == account)
+            and (since is None or post_date >= since)
+            and (until is None or post_date < until)
+            and (error_type is None or error == error_type)
+        ):
+            pending.append(
+                {
+                    "status": status,
+                    "post_date": post_date,
+                    "account": account_name,
+                    "error_type": error,
+                    "post": post,
+                }
+            )
+    yield from sorted(pending, key=lambda match: match["post_date"])
+
+    index = HistoryIndex(data_dir=data_dir, db_path=db_path)
+    try:
+        index.refresh()
+        yield from index.query(
+            statuses=statuses,
+            account=account,
+            since=since,
+            until=until,
+            error_type=error_type,
+        )
+    finally:
+        index.close()
+
+
+def format_row(match: Dict[str, Any]) -> str:
+    """
+    Format a match as a fixed width table row, so rows can be printed as they stream.
+
+    Args:
+    - match (Dict[str, Any]): A match yielded by `query_posts`.
+
+    Returns:
+    - str: The table row.
+    """
+    post = match["post"]
+    media = post.get("video_path") or post.get("image_path") or ""
+    if isinstance(media, list):
+        media = f"album of {len(media)}"
+    else:
+        media = os.path.basename(media)
+
+    description = str(post.get("description", "")).replace("\n", " ")
+    if len(description) > 40:
+        description = description[:37] + "..."
+
+    return (
+        f"{match['status']:<9} {match['post_date']:<16}  {match['account']:<12.12} "
+        f"{(match['error_type'] or '-'):<24.24} {media:<24.24} {description}"
+    )
+
+
+TABLE_HEADER = (
+    f"{'STATUS':<9} {'POST DATE':<16}  {'ACCOUNT':<12} {'ERROR':<24} "
+    f"{'MEDIA':<24} DESCRIPTION"
+)
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import file_lock
+
+# A dropped file that is not valid JSON yet is left alone this long after its last write
+RECENT_WRITE_SECONDS = 5.0
+
+
+def entry_key(post: Dict[str, Any]) -> str:
+    """
+    Key a 'to-post' entry by its content, so an edited entry is a new one.
+
+    Args:
+    - post (Dict[str, Any]): The entry as read from the JSON file.
+
+    Returns:
+    - str: The hex digest of the entry.
+    """
+    payload = json.dumps(post, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def write_to_post_file(to_post_path: str, posts: List[Dict[str, Any]]) -> None:
+    """
+    Atomically write the 'to-post' file, so a watcher never reads half of it.
+
+    Args:
+    - to_post_path (str): The path to the 'to-post' file.
+    - posts (List[Dict[str, Any]]): The entries.
+    """
+    temp_path = f"{to_post_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as to_post_file:
+        json.dump({"posts": posts}, to_post_file, indent=2)
+    os.replace(temp_path, to_post_path)
+
+
+class ToPostTracker:
+    """
+    The entries of the 'to-post' file seen so far, and what was scheduled for them.
+
+    The file is only read again when its size, modification time or inode
+    changed, and only the entries that were added or removed since the last
+    read are reported, so a watcher schedules new posts without handling the
+    whole queue again. Reading itself is not incremental: 'to-post' is a single
+    JSON document that publishers rewrite anywhere, so every change parses and
+    hashes the whole file again; only the scheduling is limited to the changes.
+    The state is kept in a JSON file, so edits made while the watcher was
+    stopped are picked up when it starts.
+    """
+
+    def __init__(self, to_post_path: str, state_path: str, logger: logging.Logger):
+        self.to_post_path = to_post_path
+        self.state_path = state_path
+        self.logger = logger
+        self.signature: Optional[Tuple[int, int, int]] = None
+
+        state = self._load()
+        # The number of entries with every key at the last read
+        self.seen: Counter = Counter(state.get("seen", {}))
+        # key -> what was scheduled for every entry with the key: its account, due
+        # time and "scheduled_post_file_path" or "post_id"
+        self.scheduled: Dict[str, List[Dict[str, Any]]] = state.get("scheduled", {})
+        self.started = "seen" in state
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the saved state, an unreadable or missing file is a fresh state."""
+        if not os.path.exists(self.state_path):
+            return {}
+
+        try:
+            with open(self.state_path, "r") as state_file:
+                return json.load(state_file)
+        except (IOError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """Atomically write the state back to disk."""
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w") as state_file:
+            json.dump({"seen": self.seen, "scheduled": self.scheduled}, state_file)
+        os.replace(temp_path, self.state_path)
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        """Get the inode, size and modification time of the file, None if it is missing."""
+        try:
+            stat = os.stat(self.to_post_path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def read_changes(
+        self,
+    ) -> Optional[Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]]:
+        """
+        Read the entries added and removed since the last read.
+
+        Returns:
+        - Optional[Tuple[List[Tuple[str, Dict[str, Any]]], List[str]]]: The
+          (key, entry) pairs of the added entries in file order, and the keys of
+          the removed ones. None if the file is being written and cannot be read yet.
+        """
+        signature = self._stat()
+        if signature is not None and signature == self.signature:
+            return [], []
+
+        posts: List[Dict[str, Any]] = []
+        if signature is not None:
+            try:
+                with open(self.to_post_path, "r") as to_post_file:
+                    posts = json.load(to_post_file).get("posts", [])
+            except (IOError, json.JSONDecodeError, AttributeError):
+                # Written in place by another process, its next write is another change
+                return None
+
+        keys = [entry_key(post) for post in posts]
+        current = Counter(keys)
+
+        added = []
+        remaining = Counter(self.seen)
+        for key, post in zip(keys, posts):
+            if remaining[key] > 0:
+                remaining[key] -= 1
+            else:
+                added.append((key, post))
+
+        removed = list((self.seen - current).elements())
+
+        self.seen = current
+        self.signature = signature
+        return added, removed
+
+    def taken_slots(self) -> Dict[str, List[datetime]]:
+        """
+        Get the slots taken by the entries scheduled so far, so new entries keep
+        the posting limits of their accounts with them.
+
+        Returns:
+        - Dict[str, List[datetime]]: The UTC due times of every account.
+        """
+        slots: Dict[str, List[datetime]] = {}
+        for records in self.scheduled.values():
+            for record in records:
+                # Records of older watchers do not know their account
+                if "account" in record:
+                    slots.setdefault(record["account"], []).append(
+                        datetime.fromisoformat(record["due_at"])
+                    )
+        return slots
+
+    def record_scheduled(self, key: str, record: Dict[str, Any]) -> None:
+        """
+        Remember what was scheduled for an entry.
+
+        Args:
+        - key (str): The key of the entry.
+        - record (Dict[str, Any]): Its account, due time and scheduled post file or work queue id.
+        """
+        self.scheduled.setdefault(key, []).append(record)
+
+    def pop_scheduled(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Forget what was scheduled for a removed entry.
+
+        Args:
+        - key (str): The key of the entry.
+
+        Returns:
+        - Optional[Dict[str, Any]]: What was scheduled for it, None if unknown.
+        """
+        records = self.scheduled.get(key)
+        if not records:
+            return None
+
+        record = records.pop(0)
+        if not records:
+            del self.scheduled[key]
+        return record
+
+
+def read_drop_file(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the posts of a file dropped in an input directory: a 'to-post' like
+    file, a list of posts or a single post.
+
+    Args:
+    - path (str): The path to the dropped file.
+
+    Returns:
+    - List[Dict[str, Any]]: The posts.
+
+    Raises:
+    - ValueError: If the file does not hold posts.
+    - json.JSONDecodeError: If the file is not valid JSON.
+    """
+    with open(path, "r") as drop_file:
+        content = json.load(drop_file)
+
+    if isinstance(content, dict):
+        content = content.get("posts", [content])
+    if not isinstance(content, list) or not all(
+        isinstance(post, dict) and "post_date" in post for post in content
+    ):
+        raise ValueError("The file does not hold posts")
+    return content
+
+
+def ingest_drop_files(
+    drop_dirs: List[str], to_post_path: str, logger: logging.Logger
+) -> int:
+    """
+    Move the posts of the files dropped in input directories into the 'to-post'
+    file, all in one write. Read files go to a "processed" directory next to
+    them once 'to-post' is written, so a failed write leaves them to the next
+    run, and unreadable ones go to "rejected". Hidden and temporary files are
+    skipped, they are still being written. 'to-post' is locked while it is read
+    and written, as publishers remove their posts from it at the same time.
+
+    Args:
+    - drop_dirs (List[str]): The input directories.
+    - to_post_path (str): The path to the 'to-post' file.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - int: The number of posts added to the 'to-post' file.
+    """
+    paths = []
+    for drop_dir in drop_dirs:
+        with os.scandir(drop_dir) as entries:
+            paths.extend(
+                entry.path
+                for entry in entries
+                if entry.is_file()
+                and not entry.name.startswith(".")
+                and not entry.name.endswith(".tmp")
+            )
+    if not paths:
+        return 0
+
+    dropped: List[Dict[str, Any]] = []
+    moves: List[Tuple[str, str]] = []
+    for path in sorted(paths):
+        try:
+            dropped.extend(read_drop_file(path))
+            moves.append((path, "processed"))
+        except json.JSONDecodeError as e:
+            # Still being written in place, its next write is another change
+            if time.time() - os.path.getmtime(path) < RECENT_WRITE_SECONDS:
+                continue
+            logger.error(f"Rejected dropped file '{path}': {e}")
+            moves.append((path, "rejected"))
+        except (IOError, ValueError) as e:
+            logger.error(f"Rejected dropped file '{path}': {e}")
+            moves.append((path, "rejected"))
+
+    if dropped:
+        with file_lock.locked(to_post_path):
+            posts: List[Dict[str, Any]] = []
+            if os.path.exists(to_post_path):
+                try:
+                    with open(to_post_path, "r") as to_post_file:
+                        posts = json.load(to_post_file).get("posts", [])
+                except (IOError, json.JSONDecodeError):
+                    # Being edited in place, the files are picked up after its write
+                    return 0
+
+            write_to_post_file(to_post_path=to_post_path, posts=posts + dropped)
+        logger.info(f"Added {len(dropped)} dropped posts to '{to_post_path}'")
+
+    for path, target in moves:
+        target_dir = os.path.join(os.path.dirname(path), target)
+        os.makedirs(target_dir, exist_ok=True)
+        os.replace(path, os.path.join(target_dir, os.path.basename(path)))
+
+    return len(dropped)
@@ -1,16 +1,136 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from typing import Dict, Optional
 
+# Default rotation settings, overridable through the environment (see `.env.example`)
+DEFAULT_ROTATION = "size"
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_ROTATION_WHEN = "midnight"
+DEFAULT_LOG_FORMAT = "text"
 
-def get_logger(log_file: str) -> logging.Logger:
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# One queue listener per log file, so repeated `get_logger` calls are no-ops
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as single-line JSON objects.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "name": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, default=str)
+
+
+def _gzip_namer(name: str) -> str:
+    """Name rotated log files with a `.gz` suffix."""
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    """Compress the rotated log file and remove the uncompressed original."""
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+def _build_file_handler(
+    log_file: str,
+    rotation: str,
+    max_bytes: int,
+    backup_count: int,
+    when: str,
+    compress: bool,
+) -> logging.Handler:
+    """
+    Build the file handler that actually writes to disk.
+
+    Args:
+    - log_file (str): The path to the log file.
+    - rotation (str): One of "size", "time" or "none".
+    - max_bytes (int): The maximum size of the log file for size based rotation.
+    - backup_count (int): The number of rotated files to keep.
+    - when (str): The interval for time based rotation (see `TimedRotatingFileHandler`).
+    - compress (bool): Whether rotated files should be gzip compressed.
+
+    Returns:
+    - logging.Handler: The configured file handler.
+
+    Raises:
+    - ValueError: If the rotation mode is unknown.
+    """
+    if rotation == "size":
+        handler: logging.Handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count
+        )
+    elif rotation == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when=when, backupCount=backup_count
+        )
+    elif rotation == "none":
+        return logging.FileHandler(log_file)
+    else:
+        raise ValueError(f"Unknown log rotation mode: {rotation}")
+
+    if compress:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+
+    return handler
+
+
+def get_logger(
+    log_file: str,
+    rotation: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    backup_count: Optional[int] = None,
+    when: Optional[str] = None,
+    log_format: Optional[str] = None,
+    compress: bool = True,
+) -> logging.Logger:
     """
     Creates and configures a logger to log messages to a specified file.
 
-    This function sets up a logger with an INFO logging level, adds a file handler
-    to direct log messages to the specified log file, and applies a specific log
-    message format.
+    This function sets up the root logger with an INFO logging level and routes
+    records through a `QueueHandler` to a `QueueListener` thread that owns the
+    (rotating) file handler, so disk I/O never blocks the caller. Calling it more
+    than once for the same file returns the already configured logger.
+
+    Options that are not passed explicitly are read from the `LOG_ROTATION`,
+    `LOG_MAX_BYTES`, `LOG_BACKUP_COUNT`, `LOG_ROTATION_WHEN` and `LOG_FORMAT`
+    environment variables.
+
+    Rotation happens within one process: cron publishers running at the same time
+    each rotate the shared log file on their own, so their rollovers can race and
+    lose records. When many posts are due at once, use `LOG_ROTATION=none` and
+    rotate the file with an external tool such as logrotate.
 
     Args:
         log_file (str): The path to the log file where log messages will be saved.
+        rotation (Optional[str]): "size", "time" or "none".
+        max_bytes (Optional[int]): The maximum log file size for size based rotation.
+        backup_count (Optional[int]): The number of rotated log files to keep.
+        when (Optional[str]): The interval for time based rotation.
+        log_format (Optional[str]): "text" or "json".
+        compress (bool): Whether rotated log files should be gzip compressed.
 
     Returns:
         logging.Logger: Configured logger instance.
@@ -21,18 +141,59 @@ def get_logger(log_file: str) -> logging.Logger:
     # Set the logging level to INFO
     logger.setLevel(logging.INFO)
 
-    # Create a file handler to write log messages to the specified file
-    file_handler = logging.FileHandler(log_file)
+    key = os.path.abspath(log_file)
+    if key in _listeners:
+        return logger
+
+    rotation = rotation or os.getenv("LOG_ROTATION", DEFAULT_ROTATION)
+    # 0 is a valid explicit value for both, e.g. `max_bytes=0` never rotates
+    if max_bytes is None:
+        max_bytes = int(os.getenv("LOG_MAX_BYTES", DEFAULT_MAX_BYTES))
+    if backup_count is None:
+        backup_count = int(os.getenv("LOG_BACKUP_COUNT", DEFAULT_BACKUP_COUNT))
+    when = when or os.getenv("LOG_ROTATION_WHEN", DEFAULT_ROTATION_WHEN)
+    log_format = log_format or os.getenv("LOG_FORMAT", DEFAULT_LOG_FORMAT)
+
+    file_handler = _build_file_handler(
+        log_file=key,
+        rotation=rotation,
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        when=when,
+        compress=compress,
+    )
 
     # Define the format for log messages
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    formatter = (
+        JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
     )
-    # Set the defined format to the file handler
     file_handler.setFormatter(formatter)
 
-    # Add the file handler to the logger
-    logger.addHandler(file_handler)
+    # The listener thread drains the queue and does the actual file writes
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, respect_handler_level=True
+    )
+    listener.start()
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listeners[key] = listener
 
     # Return the configured logger instance
     return logger
+
+
+def shutdown_logging() -> None:
+    """
+    Stop every queue listener, flushing any pending records to disk.
+
+    Registered with `atexit`, so records logged right before `sys.exit` are kept.
+    """
+    while _listeners:
+        _, listener = _listeners.popitem()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(shutdown_logging)
@@ -1,14 +1,31 @@
+import copy
 import json
 import logging
 import os
+import re
 import sys
 from datetime import datetime
 from typing import Any, Dict, List, NoReturn, Optional
 
 from instagrapi import Client
 
+import clock
+import file_lock
+from accounts import DEFAULT_ACCOUNT
+from album_upload import upload_album
+from history import HistoryIndex
 from logger_config import get_logger
+from profiling import profile_run, profiling_enabled
+from retry_queue import RetryQueue, classify_error, schedule_retry_drain
 from setup import setup_instagrapi
+from video_tools import VIDEO_EXTENSIONS
+from video_upload import upload_reel
+
+# Directory holding the success, error, to-post and retry queue files
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+# A post date already in the "%Y-%m-%d %H:%M" form of the post files
+NORMALIZED_DATE = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}")
 
 
 def log_and_exit(logger: logging.Logger, message: str) -> NoReturn:
@@ -39,100 +56,262 @@ def is_valid_image_extension(file_name: str) -> bool:
     return any(file_name.endswith(ext) for ext in valid_extensions)
 
 
-def handle_post_update(
-    success: bool, json_post_content: Dict[str, Any], logger: logging.Logger
-) -> None:
+def is_valid_video_extension(file_name: str) -> bool:
     """
-    Update the post error file based on the success of the upload.
+    Check if the given file name has a valid video extension.
+
+    Valid extensions are: .mp4, .mov.
 
     Args:
-    - success (bool): True if the upload was successful, False otherwise.
-    - json_post_content (dict): The content of the post.
+    - file_name (str): The name of the file to check.
 
     Returns:
-    - Return the content of the post file if the read is successful; otherwise, return the default value if provided, or None.
+    - bool: True if the file has a valid video extension, False otherwise.
     """
+    return any(file_name.lower().endswith(ext) for ext in VIDEO_EXTENSIONS)
 
-    def load_json_file(file_path: str, default: Optional[Any] = None) -> Any:
-        """Helper function to load JSON data from a file."""
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, "r") as file:
-                    return json.load(file)
-            except Exception:
-                log_and_exit(
-                    logger=logger, message=f"Failed to load post file: {file_path}"
-                )
-        else:
-            # Create the file with default content if it does not exist
-            write_json_file(file_path, default if default is not None else [])
-            return default if default is not None else []
-
-    def write_json_file(file_path: str, posts: List[Dict[str, Any]]) -> None:
-        """Helper function to save JSON data to a file."""
-        for post in posts:
-            if "post_date" in post:
-                try:
-                    post_date = datetime.strptime(
-                        post["post_date"], "%Y-%m-%d %H:%M:%S"
-                    )
-                    post["post_date"] = post_date.strftime("%Y-%m-%d %H:%M")
-                except ValueError:
-                    post_date = datetime.strptime(post["post_date"], "%Y-%m-%d %H:%M")
-                    post["post_date"] = post_date.strftime("%Y-%m-%d %H:%M")
-                except Exception as e:
-                    log_and_exit(
-                        logger=logger, message=f"Failed to parse post date: {e}"
-                    )
 
+def normalize_post(post: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a post with its date in the "%Y-%m-%d %H:%M" form of the post files.
+
+    Scheduled post files and work queue entries hold "%Y-%m-%d %H:%M:%S" dates,
+    so they only compare equal to their 'to-post' entry once normalized.
+
+    Args:
+    - post (Dict[str, Any]): The content of the post.
+
+    Returns:
+    - Dict[str, Any]: The normalized copy, dates that do not parse (e.g. "auto") are kept.
+    """
+    normalized = dict(post)
+    if isinstance(normalized.get("post_date"), str):
         try:
-            with open(file_path, "w") as file:
+            post_date = datetime.strptime(normalized["post_date"], "%Y-%m-%d %H:%M:%S")
+            normalized["post_date"] = post_date.strftime("%Y-%m-%d %H:%M")
+        except ValueError:
+            pass
+    return normalized
+
+
+def load_post_file(
+    file_path: str, logger: logging.Logger, default: Optional[Any] = None
+) -> Any:
+    """
+    Load a post file, creating it with the default content if it does not exist.
+
+    Args:
+    - file_path (str): The path to the post file.
+    - logger (logging.Logger): The logger instance to use.
+    - default (Optional[Any]): The content of a missing file. Defaults to an empty list.
+
+    Returns:
+    - Any: The content of the file.
+
+    Raises:
+    - SystemExit: If the file cannot be read.
+    """
+    if os.path.exists(file_path):
+        try:
+            with open(file_path, "r") as file:
+                return json.load(file)
+        except Exception:
+            log_and_exit(logger=logger, message=f"Failed to load post file: {file_path}")
+    else:
+        # Create the file with default content if it does not exist
+        write_post_file(file_path, default if default is not None else [], logger)
+        return default if default is not None else []
+
+
+def normalize_post_dates(posts: Any, logger: logging.Logger) -> None:
+    """
+    Normalize the post dates of records to "%Y-%m-%d %H:%M", in place.
+
+    Dates already in that form are skipped without parsing them, so rewriting a
+    long history file does not parse every record again.
+
+    Args:
+    - posts (Any): The records, or the 'to-post' content.
+    - logger (logging.Logger): The logger instance to use.
+
+    Raises:
+    - SystemExit: If a post date is invalid.
+    """
+    for post in posts:
+        if "post_date" in post:
+            if isinstance(post["post_date"], str) and NORMALIZED_DATE.fullmatch(
+                post["post_date"]
+            ):
+                continue
+            try:
+                post_date = datetime.strptime(post["post_date"], "%Y-%m-%d %H:%M:%S")
+                post["post_date"] = post_date.strftime("%Y-%m-%d %H:%M")
+            except ValueError:
+                post_date = datetime.strptime(post["post_date"], "%Y-%m-%d %H:%M")
+                post["post_date"] = post_date.strftime("%Y-%m-%d %H:%M")
+            except Exception as e:
+                log_and_exit(logger=logger, message=f"Failed to parse post date: {e}")
+
+
+def write_post_file(
+    file_path: str, posts: List[Dict[str, Any]], logger: logging.Logger
+) -> None:
+    """
+    Write a post file, normalizing the post dates to "%Y-%m-%d %H:%M".
+
+    Lists of records (the success and error files) are written one record per
+    line, so the history index can read back single records by byte range and
+    index only the records appended since its last refresh. The file is replaced
+    atomically, so readers never see half of it.
+
+    Args:
+    - file_path (str): The path to the post file.
+    - posts (List[Dict[str, Any]]): The records, or the 'to-post' content.
+    - logger (logging.Logger): The logger instance to use.
+
+    Raises:
+    - SystemExit: If a post date is invalid or the file cannot be written.
+    """
+    normalize_post_dates(posts=posts, logger=logger)
+
+    try:
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as file:
+            if isinstance(posts, list):
+                file.write(
+                    "[\n"
+                    + ",\n".join(f"  {json.dumps(post)}" for post in posts)
+                    + ("\n]" if posts else "]")
+                )
+            else:
                 json.dump(posts, file, indent=2)
-            logger.info(f"Post file updated: {file_path}")
+        os.replace(temp_path, file_path)
+        logger.info(f"Post file updated: {file_path}")
 
-        except (IOError, json.JSONDecodeError) as e:
-            log_and_exit(logger=logger, message=f"Failed to write post file: {e}")
+    except (IOError, json.JSONDecodeError) as e:
+        log_and_exit(logger=logger, message=f"Failed to write post file: {e}")
 
-    # Get the directory of the current script
-    current_dir = os.path.dirname(os.path.abspath(__file__))
 
-    # Define the directory where the data files are located
-    data_dir = os.path.join(current_dir, "..", "data")
+def append_post_record(
+    file_path: str, record: Dict[str, Any], logger: logging.Logger
+) -> None:
+    """
+    Append a record to the success or error file, without reading or rewriting
+    the records it already holds when it is written one record per line.
 
-    # Define paths to the success, error, and to-post files
-    success_file = os.path.join(data_dir, "success.json")
-    error_file = os.path.join(data_dir, "error.json")
-    to_post_file = os.path.join(data_dir, "to-post.json")
+    The record goes in with a single write over the closing bracket, so the
+    cost of a post does not grow with the history. Files in any other layout
+    are loaded and rewritten whole. The caller holds the lock of the file.
 
-    # Ensure the success and error files exist
-    if not os.path.exists(success_file):
-        write_json_file(success_file, [])
+    Args:
+    - file_path (str): The path to the success or error file.
+    - record (Dict[str, Any]): The record to append.
+    - logger (logging.Logger): The logger instance to use.
 
-    if not os.path.exists(error_file):
-        write_json_file(error_file, [])
+    Raises:
+    - SystemExit: If the post date is invalid or the file cannot be read or written.
+    """
+    normalize_post_dates(posts=[record], logger=logger)
+    line = json.dumps(record).encode()
 
-    # Load the current 'to-post' data if it exists, otherwise initialize an empty list
-    to_post_data = load_json_file(file_path=to_post_file, default={"posts": []})
+    try:
+        with open(file_path, "rb+") as file:
+            size = file.seek(0, os.SEEK_END)
+            file.seek(max(0, size - 3))
+            tail = file.read(3)
+
+            # An empty list, as written by `write_post_file` or `json.dump`
+            if tail in (b"[]", b"[\n]"):
+                file.seek(0)
+                file.write(b"[\n  " + line + b"\n]")
+                logger.info(f"Post file updated: {file_path}")
+                return
+            if size > 3 and tail == b"}\n]":
+                file.seek(size - 2)
+                file.write(b",\n  " + line + b"\n]")
+                logger.info(f"Post file updated: {file_path}")
+                return
+    except IOError as e:
+        log_and_exit(logger=logger, message=f"Failed to write post file: {e}")
+
+    records = load_post_file(file_path=file_path, logger=logger, default=[])
+    records.append(record)
+    write_post_file(file_path=file_path, posts=records, logger=logger)
+
+
+def handle_post_update(
+    success: bool,
+    json_post_content: Dict[str, Any],
+    logger: logging.Logger,
+    error: Optional[Dict[str, Any]] = None,
+    retrying: bool = False,
+    published: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Update the post error file based on the success of the upload.
 
-    # Determine which file to write to based on the success of the upload
-    target_file = success_file if success else error_file
+    Args:
+    - success (bool): True if the upload was successful, False otherwise.
+    - json_post_content (dict): The content of the post.
+    - error (Optional[Dict[str, Any]]): Details of the failure, stored with the error record.
+    - retrying (bool): True if the post moved to the retry queue, so it is only removed from 'to-post'.
+    - published (Optional[Dict[str, Any]]): The media ids and publish time, stored with the success record.
 
-    # Load the current content of the target file if it exists, otherwise initialize an empty list
-    target_data = load_json_file(file_path=target_file, default=[])
+    Returns:
+    - Return the content of the post file if the read is successful; otherwise, return the default value if provided, or None.
+    """
 
-    # Append the current post content to the target data
-    target_data.append(json_post_content)
+    # Define paths to the success, error, and to-post files
+    success_file = os.path.join(DATA_DIR, "success.json")
+    error_file = os.path.join(DATA_DIR, "error.json")
+    to_post_file = os.path.join(DATA_DIR, "to-post.json")
 
-    # Write the updated target data back to the target file
-    write_json_file(file_path=target_file, posts=target_data)
+    # Ensure the success and error files exist
+    if not os.path.exists(success_file):
+        write_post_file(success_file, [], logger)
 
-    user_posts = to_post_data["posts"]
+    if not os.path.exists(error_file):
+        write_post_file(error_file, [], logger)
+
+    # The scheduled content has seconds in its date, the 'to-post' entry does not
+    queued_post = normalize_post(json_post_content)
+
+    # Posts moving to the retry queue are neither a success nor an error yet
+    if not retrying:
+        # Determine which file to write to based on the success of the upload
+        target_file = success_file if success else error_file
+
+        # Other publishers and the watcher rewrite the same files
+        with file_lock.locked(target_file):
+            # Append the current post content to the target file, with the failure
+            # details or the published media if any
+            if error:
+                record = {**queued_post, "error": error}
+            else:
+                record = {**queued_post, **(published or {})}
+            append_post_record(file_path=target_file, record=record, logger=logger)
+
+    # Posts scheduled with an "auto" post date are still "auto" in the 'to-post' data
+    queued_forms = [queued_post]
+    if queued_post.get("auto_post_date"):
+        queued_form = {**queued_post, "post_date": "auto"}
+        del queued_form["auto_post_date"]
+        queued_forms.append(queued_form)
+
+    with file_lock.locked(to_post_file):
+        # Load the current 'to-post' data if it exists, otherwise initialize an empty list
+        to_post_data = load_post_file(
+            file_path=to_post_file, logger=logger, default={"posts": []}
+        )
+        user_posts = to_post_data["posts"]
 
-    # Filter the posted post from the 'to-post' data
-    if any(post == json_post_content for post in user_posts):
-        user_posts = [item for item in user_posts if item != json_post_content]
-        to_post_data["posts"] = user_posts
-        write_json_file(file_path=to_post_file, posts=to_post_data)
+        # Filter the posted post from the 'to-post' data
+        remaining = [
+            item for item in user_posts if normalize_post(item) not in queued_forms
+        ]
+        if len(remaining) != len(user_posts):
+            to_post_data["posts"] = remaining
+            write_post_file(file_path=to_post_file, posts=to_post_data, logger=logger)
 
 
 def parse_post_file_to_json(post_path: str, logger: logging.Logger) -> Dict[str, Any]:
@@ -177,7 +356,10 @@ def parse_post_file_to_json(post_path: str, logger: logging.Logger) -> Dict[str,
 
 
 def handle_post_error(
-    error_message: str, json_post_content: Dict[str, Any], logger: logging.Logger
+    error_message: str,
+    json_post_content: Dict[str, Any],
+    logger: logging.Logger,
+    error: Optional[Dict[str, Any]] = None,
 ) -> None:
     """
     This function logs an error message, updates the post files to indicate failure,
@@ -187,6 +369,7 @@ def handle_post_error(
     - error_message (str): The error message to be logged.
     - json_post_content (Dict[str, Any]): The content of the post file in JSON format.
     - logger (logging.Logger): The logger instance to use for logging the error.
+    - error (Optional[Dict[str, Any]]): Details of the failure, stored with the error record.
 
     Returns:
     - None
@@ -195,23 +378,94 @@ def handle_post_error(
     - SystemExit: The program will exit with an exit status of 1.
     """
     handle_post_update(
-        success=False, json_post_content=json_post_content, logger=logger
+        success=False, json_post_content=json_post_content, logger=logger, error=error
     )
     log_and_exit(logger=logger, message=error_message)
 
 
+def handle_upload_failure(
+    upload_error: Exception,
+    json_post_content: Dict[str, Any],
+    attempts: int,
+    logger: logging.Logger,
+) -> None:
+    """
+    Queue a failed upload for another attempt if the failure is retryable,
+    otherwise (or once it ran out of attempts) record it in the error file.
+
+    Args:
+    - upload_error (Exception): The exception raised by the upload.
+    - json_post_content (Dict[str, Any]): The content of the post file in JSON format.
+    - attempts (int): The number of attempts made, including the failed one.
+    - logger (logging.Logger): The logger instance to use for logging.
+
+    Raises:
+    - SystemExit: The program will exit with an exit status of 1.
+    """
+    classification = classify_error(upload_error)
+    error = {
+        "type": type(upload_error).__name__,
+        "message": str(upload_error),
+        "classification": classification,
+        "attempts": attempts,
+    }
+
+    if classification == "retryable":
+        queue_path = os.path.join(DATA_DIR, "retry-queue.json")
+
+        retry_queue = RetryQueue(queue_path=queue_path, logger=logger)
+        entry = retry_queue.enqueue(
+            json_post_content=json_post_content, error=upload_error, attempts=attempts
+        )
+
+        if entry is not None:
+            handle_post_update(
+                success=False,
+                json_post_content=json_post_content,
+                logger=logger,
+                retrying=True,
+            )
+            schedule_retry_drain(
+                queue_path=queue_path,
+                run_at=retry_queue.next_attempt_at(),
+                logger=logger,
+            )
+            log_and_exit(
+                logger=logger,
+                message=f"Failed to upload the post (attempt {attempts}), retrying at {entry['next_attempt_at']}: {upload_error}",
+            )
+
+    handle_post_error(
+        error_message=f"Failed to upload the post: {upload_error}",
+        json_post_content=json_post_content,
+        logger=logger,
+        error=error,
+    )
+
+
 def prepare_upload_params(
     json_post_content: Dict[str, Any], logger: logging.Logger
 ) -> Dict[str, Any]:
-    # Initial needed upload parameters
-    upload_params = {
-        "path": json_post_content.get("image_path"),
-        "caption": json_post_content.get("description"),
-    }
+    image_path = json_post_content.get("image_path")
+
+    # Initial needed upload parameters, albums take a list of paths
+    if "video_path" in json_post_content:
+        upload_params = {
+            "video_path": json_post_content["video_path"],
+            "thumbnail_path": json_post_content.get("thumbnail_path"),
+            "video_info": json_post_content.get("video_info"),
+            "caption": json_post_content.get("description"),
+        }
+    else:
+        upload_params = {
+            "paths" if isinstance(image_path, list) else "path": image_path,
+            "caption": json_post_content.get("description"),
+        }
 
     # If the optional field is provided
     if "extra_data" in json_post_content:
-        extra_data = json_post_content["extra_data"]
+        # A copy, the post content is recorded and compared as it was queued
+        extra_data = copy.deepcopy(json_post_content["extra_data"])
         try:
             extra_data["custom_accessibility_caption"] = str(
                 extra_data.get("custom_accessibility_caption", "")
@@ -237,11 +491,54 @@ def prepare_upload_params(
     return upload_params
 
 
+def publish_media(
+    client: Client, upload_params: Dict[str, Any], logger: logging.Logger
+) -> Dict[str, Any]:
+    """
+    Upload media to Instagram with the upload suited to the post.
+
+    Args:
+    - client: The Instagram client used for uploading media.
+    - upload_params (Dict[str, Any]): The parameters for the media upload.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - Dict[str, Any]: The media ids and publish time, as stored with the success record.
+
+    Raises:
+    - Exception: Whatever the upload raised.
+    """
+    if "video_path" in upload_params:
+        # Resumable upload state lives next to the other data files
+        state_dir = os.path.join(DATA_DIR, "uploads")
+        upload_media = upload_reel(
+            client=client, state_dir=state_dir, logger=logger, **upload_params
+        )
+    elif "paths" in upload_params:
+        upload_media = upload_album(client=client, logger=logger, **upload_params)
+    else:
+        upload_media = client.photo_upload(**upload_params)
+
+    # Get the uploaded post ID
+    uploaded_media = upload_media.model_dump()
+    uploaded_post_id = uploaded_media.get("id", None)
+    uploaded_post_pk = uploaded_media.get("pk", None)
+    logger.info(f"Successfully uploaded the post on Instagram. ID: {uploaded_post_id}")
+
+    # Kept so the engagement of the post can be fetched later
+    return {
+        "media_id": uploaded_post_id,
+        "media_pk": str(uploaded_post_pk) if uploaded_post_pk is not None else None,
+        "published_at": clock.now().isoformat(),
+    }
+
+
 def upload_to_instagram(
     client: Client,
     upload_params: Dict[str, Any],
     json_post_content: Dict[str, Any],
     logger: logging.Logger,
+    attempts: int = 0,
 ) -> None:
     """
     Uploads media to Instagram and handles logging and updating post files based on the result.
@@ -251,6 +548,7 @@ def upload_to_instagram(
     - upload_params (Dict[str, Any]): The parameters for the media upload.
     - json_post_content (Dict[str, Any]): The content of the post file in JSON format.
     - logger (logging.Logger): The logger instance to use for logging errors and success messages.
+    - attempts (int): The number of earlier failed attempts of this post.
 
     Returns:
     - None
@@ -259,25 +557,157 @@ def upload_to_instagram(
     - SystemExit: Exits the program with an error status if the upload fails.
     """
     try:
-        # Upload the media to Instagram
-        upload_media = client.photo_upload(**upload_params)
-
-        # Get the uploaded post ID
-        uploaded_post_id = upload_media.model_dump().get("id", None)
-        logger.info(
-            f"Successfully uploaded the post on Instagram. ID: {uploaded_post_id}"
+        published = publish_media(
+            client=client, upload_params=upload_params, logger=logger
         )
         handle_post_update(
-            success=True, json_post_content=json_post_content, logger=logger
+            success=True,
+            json_post_content=json_post_content,
+            logger=logger,
+            published=published,
         )
     except Exception as e:
-        handle_post_error(
-            error_message=f"Failed to upload the post: {e}",
+        handle_upload_failure(
+            upload_error=e,
             json_post_content=json_post_content,
+            attempts=attempts + 1,
             logger=logger,
         )
 
 
+def find_post_problem(json_post_content: Dict[str, Any]) -> Optional[str]:
+    """
+    Check the media of a post before it is uploaded.
+
+    Args:
+    - json_post_content (Dict[str, Any]): The content of the post file in JSON format.
+
+    Returns:
+    - Optional[str]: The problem found, None if the post can be uploaded.
+    """
+    if "video_path" in json_post_content:
+        video_path = json_post_content["video_path"]
+
+        # Validate the video file extension and the schedule time metadata
+        if not is_valid_video_extension(video_path):
+            return f"'{video_path}' is not a valid video"
+
+        if not os.path.isfile(video_path) or os.path.getsize(video_path) == 0:
+            return f"'{video_path}' is missing or empty"
+
+        if not json_post_content.get("thumbnail_path") or not json_post_content.get(
+            "video_info"
+        ):
+            return f"'{video_path}' was not prepared at schedule time"
+
+    # Video posts have no images to validate
+    image_path = json_post_content.get("image_path", [])
+    image_paths = image_path if isinstance(image_path, list) else [image_path]
+
+    # Validate image file extension of every image in the post
+    for path in image_paths:
+        if not is_valid_image_extension(path):
+            return f"'{path}' is not a valid image"
+
+    return None
+
+
+def is_already_published(
+    json_post_content: Dict[str, Any], post_id: Optional[str] = None
+) -> bool:
+    """
+    Check the success file for an earlier upload of the same post.
+
+    Records of posts published by a worker hold the work queue id of the post
+    and are matched on it, other records on their content.
+
+    Args:
+    - json_post_content (Dict[str, Any]): The content of the post file in JSON format.
+    - post_id (Optional[str]): The work queue id of the post, if it has one.
+
+    Returns:
+    - bool: True if the post is recorded as published.
+    """
+    # Success records hold "%Y-%m-%d %H:%M" dates, queued content may have seconds
+    queued_post = normalize_post(json_post_content)
+    post_date = str(queued_post.get("post_date", ""))[:16]
+    index = HistoryIndex(
+        data_dir=DATA_DIR, db_path=os.path.join(DATA_DIR, "history-index.sqlite3")
+    )
+    try:
+        index.refresh()
+        for match in index.query(
+            statuses=["success"],
+            account=queued_post.get("account") or DEFAULT_ACCOUNT,
+            since=post_date,
+            # "~" sorts after the digits, so this only excludes the next minutes
+            until=post_date + "~",
+        ):
+            recorded_id = match["post"].get("post_id")
+            if post_id is not None and recorded_id is not None:
+                if recorded_id == post_id:
+                    return True
+                continue
+
+            record = {
+                key: value
+                for key, value in normalize_post(match["post"]).items()
+                if key not in ("media_id", "media_pk", "published_at", "post_id")
+            }
+            if record == queued_post:
+                return True
+    finally:
+        index.close()
+
+    return False
+
+
+def publish_post_file(post_path: str, logger: logging.Logger) -> None:
+    """
+    Publish the post of a scheduled post file and record its outcome.
+
+    Args:
+    - post_path (str): The path to the scheduled post file.
+    - logger (logging.Logger): The logger instance to use.
+    """
+    json_post_content: Dict[str, Any] = parse_post_file_to_json(
+        post_path=post_path, logger=logger
+    )
+
+    # Set up the instagrapi client of the account the post belongs to
+    client = setup_instagrapi(logger=logger, account=json_post_content.get("account"))
+
+    # If the path does not exist or the path is not a file
+    if (not os.path.exists(post_path)) or (not os.path.isfile(post_path)):
+        return handle_post_error(
+            error_message=f"'{post_path}' does not exist or is not a file",
+            json_post_content=json_post_content,
+            logger=logger,
+        )
+
+    problem = find_post_problem(json_post_content=json_post_content)
+    if problem is not None:
+        return handle_post_error(
+            error_message=problem,
+            json_post_content=json_post_content,
+            logger=logger,
+        )
+
+    upload_params: Dict[str, Any] = prepare_upload_params(
+        json_post_content=json_post_content, logger=logger
+    )
+
+    # Log the final upload parameters
+    logger.info(f"Posting to Instagram with the following details: {upload_params}")
+
+    upload_to_instagram(
+        client=client,
+        upload_params=upload_params,
+        json_post_content=json_post_content,
+        logger=logger,
+    )
+
+
 def main() -> None:
     """
     Main function to handle the posting process.
@@ -288,6 +718,9 @@ def main() -> None:
     - Validates the image file extension.
     - Prepares upload parameters.
     - Logs the upload parameters and response.
+
+    With `--profile` after the post file path (or `PROFILE_RUNS=1`), the run is
+    profiled and its CPU and memory profile is written to `logs/`.
     """
 
     # Get the current directory of this script
@@ -297,48 +730,17 @@ def main() -> None:
     log_path = os.path.join(current_dir, "..", "logs", "post-activity.log")
     logger = get_logger(log_file=log_path)
 
-    if len(sys.argv) > 1:
-        post_path = sys.argv[1]
+    # "--profile" is not a post file path
+    post_args = [arg for arg in sys.argv[1:] if arg != "--profile"]
 
-        # Set up the instagrapi client
-        client = setup_instagrapi(logger=logger)
-
-        json_post_content: Dict[str, Any] = parse_post_file_to_json(
-            post_path=post_path, logger=logger
-        )
-
-        # If the path does not exist or the path is not a file
-        if (not os.path.exists(post_path)) or (not os.path.isfile(post_path)):
-            return handle_post_error(
-                error_message=f"'{post_path}' does not exist or is not a file",
-                json_post_content=json_post_content,
-                logger=logger,
-            )
-
-        image_path = json_post_content["image_path"]
-
-        # Validate image file extension
-        if not is_valid_image_extension(image_path):
-            return handle_post_error(
-                error_message=f"'{image_path}' is not a valid image",
-                json_post_content=json_post_content,
-                logger=logger,
-            )
-
-        upload_params: Dict[str, Any] = prepare_upload_params(
-            json_post_content=json_post_content, logger=logger
-        )
-
-        # Log the final upload parameters
-        logger.info(f"Posting to Instagram with the following details: {upload_params}")
-
-        upload_to_instagram(
-            client=client,
-            upload_params=upload_params,
-            json_post_content=json_post_content,
+    if len(post_args) > 0:
+        with profile_run(
+            name="media_post",
             logger=logger,
-        )
-
+            enabled=profiling_enabled("--profile" in sys.argv[1:]),
+            log_dir=os.path.join(current_dir, "..", "logs"),
+        ):
+            publish_post_file(post_path=post_args[0], logger=logger)
     else:
         log_and_exit(logger=logger, message="Please provide the path to the post file")
 
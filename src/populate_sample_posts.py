@@ -1,9 +1,13 @@
+import argparse
 import logging
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 from random import choice
-from typing import List, NoReturn
+from typing import Any, Callable, Dict, List, NoReturn, Optional, Tuple
 
 import lorem
 import numpy as np
@@ -29,23 +33,145 @@ def log_and_exit(logger: logging.Logger, message: str) -> NoReturn:
     sys.exit(1)
 
 
+# Pillow format names and fast encoder options per file extension, only the
+# extensions `media_post` publishes
+IMAGE_FORMATS = {
+    "jpg": ("JPEG", {"quality": 85}),
+    "png": ("PNG", {"compress_level": 1}),
+}
+
+# Images handed to a worker at a time, large enough to amortize the task overhead
+CHUNK_SIZE = 16
+
+# Per-worker state: the reused pixel buffer and the precomputed coordinate grids
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_worker(width: int, height: int) -> None:
+    """
+    Allocate the buffers of a worker once, so no image allocates its own.
+
+    Args:
+    - width (int): Width of the images.
+    - height (int): Height of the images.
+    """
+    _worker_state["pixels"] = np.empty((height, width, 3), dtype=np.uint8)
+    _worker_state["x"] = (np.arange(width, dtype=np.uint32) * 256 // width).astype(
+        np.uint8
+    )[np.newaxis, :]
+    _worker_state["y"] = (np.arange(height, dtype=np.uint32) * 256 // height).astype(
+        np.uint8
+    )[:, np.newaxis]
+    _worker_state["cols"] = np.arange(width)
+
+
+def _fill_noise(pixels: np.ndarray, rng: np.random.Generator) -> None:
+    """Fill the buffer with random noise, the worst case for the encoders."""
+    np.copyto(
+        pixels, np.frombuffer(rng.bytes(pixels.size), dtype=np.uint8).reshape(pixels.shape)
+    )
+
+
+def _fill_gradient(pixels: np.ndarray, rng: np.random.Generator) -> None:
+    """Fill the buffer with a diagonal gradient with random offsets per channel."""
+    x, y = _worker_state["x"], _worker_state["y"]
+    offsets = rng.integers(0, 256, size=3, dtype=np.uint8)
+
+    # uint8 arithmetic wraps around, which gives every image different bands
+    np.add(x, offsets[0], out=pixels[:, :, 0])
+    np.add(y, offsets[1], out=pixels[:, :, 1])
+    np.add(x, y, out=pixels[:, :, 2])
+    pixels[:, :, 2] += offsets[2]
+
+
+def _fill_pattern(pixels: np.ndarray, rng: np.random.Generator) -> None:
+    """Fill the buffer with a checkerboard of two random colors and random tile size."""
+    tile = int(rng.integers(16, 129))
+    colors = rng.integers(0, 256, size=(2, 3), dtype=np.uint8)
+
+    # Only two distinct rows exist, so build them once and copy them band by band
+    parity = (_worker_state["cols"] // tile) % 2
+    rows = (colors[parity], colors[1 - parity])
+    for band, top in enumerate(range(0, pixels.shape[0], tile)):
+        pixels[top : top + tile] = rows[band % 2]
+
+
+GENERATORS: Dict[str, Callable[[np.ndarray, np.random.Generator], None]] = {
+    "noise": _fill_noise,
+    "gradient": _fill_gradient,
+    "pattern": _fill_pattern,
+}
+
+
+def _render_chunk(
+    indexes: range, generator: str, image_format: str, save_dir: str, seed: int
+) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    Generate and save a chunk of images in a worker, reusing the worker buffers.
+
+    Args:
+    - indexes (range): The indexes of the images to render.
+    - generator (str): The name of the pixel generator.
+    - image_format (str): The file extension of the images.
+    - save_dir (str): Directory to save the images.
+    - seed (int): The base seed, each image is seeded with (seed, index).
+
+    Returns:
+    - List[Tuple[int, str, Optional[str]]]: The index, path and error (None on success) of every image.
+    """
+    pixels = _worker_state["pixels"]
+    fill = GENERATORS[generator]
+    pil_format, save_options = IMAGE_FORMATS[image_format]
+    results: List[Tuple[int, str, Optional[str]]] = []
+
+    for index in indexes:
+        file_path = os.path.join(save_dir, f"sample_image_{index}.{image_format}")
+
+        try:
+            # Seeding per image keeps the output independent of the worker layout
+            fill(pixels, np.random.default_rng([seed, index]))
+            Image.fromarray(pixels, "RGB").save(file_path, pil_format, **save_options)
+            results.append((index, file_path, None))
+        except Exception as e:
+            results.append((index, file_path, str(e)))
+
+    return results
+
+
 def generate_sample_images(
-    num_images: int, width: int, height: int, save_dir: str
+    num_images: int,
+    width: int,
+    height: int,
+    save_dir: str,
+    generator: str = "noise",
+    image_format: str = "jpg",
+    workers: Optional[int] = None,
+    seed: int = 0,
 ) -> List[str]:
     """
-    Generate random images and save them to the specified directory.
+    Generate images and save them to the specified directory.
+
+    Images are rendered in chunks by a pool of worker processes, each with its own
+    preallocated buffer, so generation and encoding scale across cores. Results
+    are collected in chunk order while the other workers keep rendering.
 
     Args:
     - num_images (int): Number of images to generate.
     - width (int): Width of the images.
     - height (int): Height of the images.
     - save_dir (str): Directory to save the images.
+    - generator (str): The pixel generator: "noise", "gradient" or "pattern".
+      Gradients and patterns are much cheaper to generate and encode than noise.
+    - image_format (str): The file format: "jpg" or "png".
+    - workers (Optional[int]): Number of worker processes. Defaults to the number of CPUs,
+      1 renders in this process.
+    - seed (int): The seed of the generated pixels.
 
     Returns:
     - List[str]: List of file paths of the saved images.
 
     Raises:
-    - SystemExit: If any of the input parameters are invalid.
+    - SystemExit: If any of the input parameters are invalid or an image cannot be saved.
     """
     if num_images <= 0 or width <= 0 or height <= 0:
         log_and_exit(
@@ -53,28 +179,61 @@ def generate_sample_images(
             message="Invalid input parameters. Please provide positive values.",
         )
 
+    if generator not in GENERATORS or image_format not in IMAGE_FORMATS:
+        log_and_exit(
+            logger=logger,
+            message=f"Invalid generator '{generator}' or image format '{image_format}'.",
+        )
+
     # Create the save_dir folder if it does not exist
     os.makedirs(save_dir, exist_ok=True)
 
-    file_paths: List[str] = []
-
-    for i in range(num_images):
-        # Generate random pixel data for an image
-        random_data = np.random.randint(0, 256, (height, width, 3), dtype=np.uint8)
-
-        # Create an image from the pixel data
-        image = Image.fromarray(random_data, "RGB")
+    workers = workers or os.cpu_count() or 1
+    chunks = [
+        range(start, min(start + CHUNK_SIZE, num_images))
+        for start in range(0, num_images, CHUNK_SIZE)
+    ]
+    render = partial(
+        _render_chunk,
+        generator=generator,
+        image_format=image_format,
+        save_dir=save_dir,
+        seed=seed,
+    )
 
-        image_format = "jpg"
-        file_path = os.path.join(save_dir, f"sample_image_{i}.{image_format}")
+    file_paths: List[str] = [""] * num_images
+    started_at = time.perf_counter()
+
+    if workers == 1 or len(chunks) == 1:
+        _init_worker(width=width, height=height)
+        chunk_results = map(render, chunks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            initializer=_init_worker,
+            initargs=(width, height),
+        )
+        chunk_results = executor.map(render, chunks)
 
-        try:
-            image.save(file_path)
-            file_paths.append(file_path)
-        except Exception as e:
-            log_and_exit(
-                logger=logger, message=f"There was a problem saving image {i}: {e}"
-            )
+    try:
+        for results in chunk_results:
+            for index, file_path, error in results:
+                if error is not None:
+                    log_and_exit(
+                        logger=logger,
+                        message=f"There was a problem saving image {index}: {error}",
+                    )
+                file_paths[index] = file_path
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started_at
+    logger.info(
+        f"Generated {num_images} {generator} images ({width}x{height} {image_format}) "
+        f"in {elapsed:.2f}s with {workers} workers"
+    )
 
     return file_paths
 
@@ -119,12 +278,57 @@ def generate_sample_posts(num_posts: int, image_paths: List[str]) -> List[Post]:
             image_path=choice(image_paths),
             description=lorem.sentence(),
             post_date=tomorrow.strftime("%Y-%m-%d %H:%M"),
+            timezone="UTC",
         )
         posts.append(post_obj)
     return posts
 
 
+def parse_args() -> argparse.Namespace:
+    """
+    Parse the command line arguments.
+
+    Returns:
+    - argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate sample images and posts into data/to-post.json."
+    )
+    parser.add_argument(
+        "--posts", type=int, default=POST_COUNT, help="Number of posts to generate."
+    )
+    parser.add_argument(
+        "--images",
+        type=int,
+        default=None,
+        help="Number of images to generate. Defaults to the number of posts.",
+    )
+    parser.add_argument("--width", type=int, default=1080, help="Width of the images.")
+    parser.add_argument(
+        "--height", type=int, default=1340, help="Height of the images."
+    )
+    parser.add_argument(
+        "--generator",
+        choices=sorted(GENERATORS),
+        default="noise",
+        help="Pixel generator, gradient and pattern are the fastest.",
+    )
+    parser.add_argument(
+        "--format", choices=sorted(IMAGE_FORMATS), default="jpg", help="Image format."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Defaults to the number of CPUs.",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the images.")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
 
     log_path = os.path.join(current_dir, "..", "logs", "post-activity.log")
@@ -136,10 +340,17 @@ if __name__ == "__main__":
     post_list = PostList(log_path)
 
     image_paths = generate_sample_images(
-        num_images=POST_COUNT, width=1080, height=1340, save_dir=sample_images_dir
+        num_images=args.images or args.posts,
+        width=args.width,
+        height=args.height,
+        save_dir=sample_images_dir,
+        generator=args.generator,
+        image_format=args.format,
+        workers=args.workers,
+        seed=args.seed,
     )
 
-    sample_posts = generate_sample_posts(num_posts=POST_COUNT, image_paths=image_paths)
+    sample_posts = generate_sample_posts(num_posts=args.posts, image_paths=image_paths)
 
     post_list.posts.extend(sample_posts)
 
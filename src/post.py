@@ -1,4 +1,5 @@
-from typing import Any, Dict, Optional
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
 
 
 class Post:
@@ -7,9 +8,15 @@ class Post:
 
     Args:
     - description (str): The description for the post.
-    - image_path (str): The path to the image file.
+    - image_path (Optional[Union[str, List[str]]]): The path to the image file, or a list of paths for an album.
     - post_date (str): The date and time of the post.
     - extra_data (Optional[Dict[str, Any]]): Additional data for the post. Defaults to None.
+    - video_path (Optional[str]): The path to the video file of a reel. Defaults to None.
+    - thumbnail_path (Optional[str]): The path to the reel thumbnail, extracted at schedule time. Defaults to None.
+    - video_info (Optional[Dict[str, Any]]): The width, height and duration of the reel, probed at schedule time. Defaults to None.
+    - account (Optional[str]): The account to publish with, see `accounts.py`. Defaults to None (the default account).
+    - timezone (Optional[str]): The IANA time zone of `post_date`, e.g. "Europe/Berlin". Defaults to None (the account's time zone).
+    - auto_post_date (bool): True if `post_date` was picked by the engagement model from an "auto" post date. Defaults to False.
     """
 
     ALLOWED_EXTRA_DATA_FIELDS = {
@@ -18,17 +25,56 @@ class Post:
         "disable_comments",
     }
 
+    # Instagram accepts between 2 and 10 items in a single carousel post
+    MIN_ALBUM_ITEMS = 2
+    MAX_ALBUM_ITEMS = 10
+
     def __init__(
         self,
         description: str,
-        image_path: str,
+        image_path: Optional[Union[str, List[str]]],
         post_date: str,
         extra_data: Optional[Dict[str, Any]] = None,
+        video_path: Optional[str] = None,
+        thumbnail_path: Optional[str] = None,
+        video_info: Optional[Dict[str, Any]] = None,
+        account: Optional[str] = None,
+        timezone: Optional[str] = None,
+        auto_post_date: bool = False,
     ):
         self.image_path = image_path
         self.description = description
         self.post_date = post_date
         self.extra_data = self.validate_extra_data(extra_data=extra_data)
+        self.video_path = video_path
+        self.thumbnail_path = thumbnail_path
+        self.video_info = video_info
+        self.account = account
+        self.timezone = timezone
+        self.auto_post_date = auto_post_date
+
+        # The post date resolved to UTC, set once when the post is loaded
+        self.post_date_utc: Optional[datetime] = None
+
+    @property
+    def is_album(self) -> bool:
+        """
+        Whether the post is a carousel/album of several images.
+
+        Returns:
+        - bool: True if `image_path` is a list of paths, False otherwise.
+        """
+        return isinstance(self.image_path, list)
+
+    @property
+    def is_video(self) -> bool:
+        """
+        Whether the post is a video/reel.
+
+        Returns:
+        - bool: True if the post has a `video_path`, False otherwise.
+        """
+        return self.video_path is not None
 
     def validate_extra_data(
         self, extra_data: Optional[Dict[str, Any]]
@@ -60,17 +106,36 @@ class Post:
         Returns:
         - dict: A dictionary containing the serialized data of the object.
                 The dictionary has the following keys:
-                - "image_path" (str): The path to the image file.
+                - "image_path" (str | List[str]): The path to the image file, or the album image paths.
                 - "description" (str): The description for the post.
                 - "post_date" (str): The date and time of the post.
                 If the object has extra data, it is added to the dictionary under the key "extra_data".
+                Video posts have "video_path", "thumbnail_path" and "video_info" instead of "image_path".
+                The optional "account" and "timezone" keys are added when set, and
+                "auto_post_date" when the post date was picked by the engagement model.
         """
         data: Dict[str, Any] = {
-            "image_path": self.image_path,
             "description": self.description,
             "post_date": self.post_date,
         }
 
+        if self.image_path is not None:
+            data["image_path"] = self.image_path
+
+        if self.video_path is not None:
+            data["video_path"] = self.video_path
+            data["thumbnail_path"] = self.thumbnail_path
+            data["video_info"] = self.video_info
+
+        if self.account is not None:
+            data["account"] = self.account
+
+        if self.timezone is not None:
+            data["timezone"] = self.timezone
+
+        if self.auto_post_date:
+            data["auto_post_date"] = True
+
         if self.extra_data is not None:
             data["extra_data"] = self.extra_data
 
@@ -1,10 +1,17 @@
 import json
 import sys
 from datetime import datetime
-from typing import List, NoReturn, Optional
+from typing import Any, Dict, List, NoReturn, Optional
 
+from dateutil import tz
+
+import clock
+from accounts import DEFAULT_ACCOUNT, get_account_settings, load_accounts
+from calendar_index import CalendarIndex
+from engagement import EngagementModel
 from logger_config import get_logger
 from post import Post
+from preflight import PreflightCache, file_signature, validate_post
 
 
 class PostList:
@@ -12,9 +19,23 @@ class PostList:
     A class to manage/represent a list of posts.
     """
 
-    def __init__(self, log_path: str):
+    def __init__(
+        self,
+        log_path: str,
+        accounts_path: Optional[str] = None,
+        preflight_cache_path: Optional[str] = None,
+        engagement_model_path: Optional[str] = None,
+    ):
         self.posts = []
         self.logger = get_logger(log_path)
+        self.accounts_path = accounts_path
+        self.preflight_cache_path = preflight_cache_path
+        self.engagement_model_path = engagement_model_path
+        self.accounts: Dict[str, dict] = {}
+
+        # The engagement model and the number of "auto" posts placed per account
+        self.engagement_model: Optional[EngagementModel] = None
+        self.auto_post_counts: Dict[str, int] = {}
 
     def _log_and_exit(self, message: str) -> NoReturn:
         """
@@ -56,6 +77,182 @@ class PostList:
         # Return the date formatted without seconds
         return parsed_date.strftime("%Y-%m-%d %H:%M")
 
+    def resolve_post_date_utc(
+        self, post_date: str, timezone_name: Optional[str]
+    ) -> datetime:
+        """
+        Resolve a naive post date in the given time zone into an aware UTC datetime.
+
+        Args:
+        - post_date (str): The date string, in the "%Y-%m-%d %H:%M" format.
+        - timezone_name (Optional[str]): The IANA time zone name, None for the machine's local zone.
+
+        Returns:
+        - datetime: The post date in UTC.
+
+        Raises:
+        - ValueError: If the date or the time zone is invalid.
+        """
+        post_timezone = tz.gettz(timezone_name) if timezone_name else tz.tzlocal()
+        if post_timezone is None:
+            raise ValueError(f"Unknown time zone: {timezone_name}")
+
+        parsed_date = datetime.strptime(post_date, "%Y-%m-%d %H:%M")
+        return parsed_date.replace(tzinfo=post_timezone).astimezone(tz.UTC)
+
+    def resolve_auto_post_date(
+        self, account: Optional[str], timezone_name: Optional[str]
+    ) -> str:
+        """
+        Pick the post date of an "auto" post from the engagement model: the n-th
+        "auto" post of an account gets its n-th best hour of the coming week.
+
+        Args:
+        - account (Optional[str]): The account of the post, None for the default account.
+        - timezone_name (Optional[str]): The IANA time zone name, None for the machine's local zone.
+
+        Returns:
+        - str: The post date, in the "%Y-%m-%d %H:%M" format in the given time zone.
+
+        Raises:
+        - ValueError: If the time zone is invalid.
+        """
+        if self.engagement_model_path is None:
+            self._log_and_exit(message="'auto' post dates need an engagement model")
+
+        post_timezone = tz.gettz(timezone_name) if timezone_name else tz.tzlocal()
+        if post_timezone is None:
+            raise ValueError(f"Unknown time zone: {timezone_name}")
+
+        if self.engagement_model is None:
+            self.engagement_model = EngagementModel(
+                model_path=self.engagement_model_path, logger=self.logger
+            )
+
+        key = account or DEFAULT_ACCOUNT
+        index = self.auto_post_counts.get(key, 0)
+        self.auto_post_counts[key] = index + 1
+
+        if index == 0 and not self.engagement_model.slot_scores(account):
+            self.logger.warning(
+                f"No engagement history for account '{key}', 'auto' posts take the next hours"
+            )
+
+        slot = self.engagement_model.next_slots(
+            account=account, timezone=post_timezone, now=clock.now(), count=index + 1
+        )[index]
+        return slot.strftime("%Y-%m-%d %H:%M")
+
+    def preflight(self, posts: List[dict], source: Optional[List[Any]] = None) -> None:
+        """
+        Validate the captions and `extra_data` of every post in one pass, before
+        anything is scheduled, so bad posts fail now rather than at their deadline.
+
+        Results are memoized by file signature and content hash when a preflight
+        cache path is set.
+
+        Args:
+        - posts (List[dict]): The posts as read from the JSON file.
+        - source (Optional[List[Any]]): The `file_signature` of the JSON file, taken before it was read.
+
+        Raises:
+        - SystemExit: If any post is invalid, after logging the problems of each.
+        """
+        if self.preflight_cache_path:
+            cache = PreflightCache(cache_path=self.preflight_cache_path)
+            invalid = cache.validate_all(posts, source=source)
+            self.logger.info(
+                f"Preflight validated {cache.misses} posts, {cache.hits} unchanged posts reused"
+            )
+        else:
+            invalid = {}
+            for index, post in enumerate(posts):
+                errors = validate_post(post)
+                if errors:
+                    invalid[index] = errors
+
+        for index, errors in invalid.items():
+            self.logger.error(
+                f"Post {index} ('{posts[index].get('post_date')}') failed preflight: {'; '.join(errors)}"
+            )
+
+        if invalid:
+            self._log_and_exit(message=f"{len(invalid)} posts failed preflight")
+
+    def build_calendar_index(self) -> CalendarIndex:
+        """
+        Build a calendar index over the loaded posts.
+
+        Returns:
+        - CalendarIndex: The posts indexed by their UTC post date.
+        """
+        return CalendarIndex.from_posts(self.posts)
+
+    def load_posts(
+        self, posts: List[dict], source: Optional[List[Any]] = None
+    ) -> List[Post]:
+        """
+        Validate posts as read from a JSON file and add them to the list.
+
+        Args:
+        - posts (List[dict]): The posts as read from the JSON file.
+        - source (Optional[List[Any]]): The `file_signature` of the JSON file, taken before it was read.
+
+        Returns:
+        - List[Post]: List of Post objects loaded so far.
+
+        Raises:
+        - ValueError: If a post date or time zone is invalid.
+        - SystemExit: If any post is invalid.
+        """
+        self.preflight(posts=posts, source=source)
+
+        for post in posts:
+            if not all(key in post for key in ["description", "post_date"]) or (
+                "image_path" in post
+            ) == ("video_path" in post):
+                self._log_and_exit(message="Missing required keys in the post object")
+
+            image_path = post.get("image_path")
+            if isinstance(image_path, list) and not (
+                Post.MIN_ALBUM_ITEMS <= len(image_path) <= Post.MAX_ALBUM_ITEMS
+            ):
+                self._log_and_exit(
+                    message=f"An album needs between {Post.MIN_ALBUM_ITEMS} and {Post.MAX_ALBUM_ITEMS} images: {image_path}"
+                )
+
+            extra_data: Optional[dict] = post.get("extra_data")
+
+            # Resolve the time zone once, per post or else per account
+            timezone_name = post.get("timezone") or get_account_settings(
+                accounts=self.accounts, account=post.get("account")
+            ).get("timezone")
+
+            post_date = post["post_date"]
+            auto_post_date = post_date == "auto"
+            if auto_post_date:
+                post_date = self.resolve_auto_post_date(
+                    account=post.get("account"), timezone_name=timezone_name
+                )
+
+            post_obj = Post(
+                image_path=image_path,
+                description=post["description"],
+                post_date=self.parse_post_date(post_date=post_date),
+                extra_data=extra_data,
+                video_path=post.get("video_path"),
+                thumbnail_path=post.get("thumbnail_path"),
+                account=post.get("account"),
+                timezone=post.get("timezone"),
+                auto_post_date=auto_post_date,
+            )
+            post_obj.post_date_utc = self.resolve_post_date_utc(
+                post_date=post_obj.post_date, timezone_name=timezone_name
+            )
+            self.posts.append(post_obj)
+
+        return self.posts
+
     def get_posts_from_json_file(self, posts_file_path: str) -> List[Post]:
         """
         Load posts from a JSON file and populate the list.
@@ -72,30 +269,20 @@ class PostList:
         - json.JSONDecodeError: If the JSON file is not valid JSON.
         """
         try:
+            self.accounts = (
+                load_accounts(self.accounts_path) if self.accounts_path else {}
+            )
+
+            # Taken before the read, a write during the read changes it
+            source = file_signature(posts_file_path)
+
             with open(posts_file_path, "r") as posts_json_file:
                 data = json.load(posts_json_file)
 
                 if "posts" not in data:
                     self._log_and_exit(message="No 'posts' key found in the json file")
 
-                for post in data["posts"]:
-                    if not all(
-                        key in post
-                        for key in ["image_path", "description", "post_date"]
-                    ):
-                        self._log_and_exit(
-                            message="Missing required keys in the post object"
-                        )
-
-                    extra_data: Optional[dict] = post.get("extra_data")
-
-                    post_obj = Post(
-                        image_path=post["image_path"],
-                        description=post["description"],
-                        post_date=self.parse_post_date(post_date=post["post_date"]),
-                        extra_data=extra_data,
-                    )
-                    self.posts.append(post_obj)
+                self.load_posts(posts=data["posts"], source=source)
 
         except FileNotFoundError:
             self._log_and_exit(message=f"File not found: {posts_file_path}")
@@ -108,7 +295,7 @@ class PostList:
 
         except ValueError as ve:
             self._log_and_exit(
-                message=f"Invalid date format provided in the post object: {ve}"
+                message=f"Invalid date or time zone provided in the post object: {ve}"
             )
 
         except Exception as e:
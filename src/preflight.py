@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# Instagram limits for a caption
+MAX_CAPTION_LENGTH = 2200
+MAX_HASHTAGS = 30
+MAX_MENTIONS = 20
+
+# Bump when the rules change, so cached results are not reused
+PREFLIGHT_VERSION = 1
+
+HASHTAG_PATTERN = re.compile(r"(?<!\w)#\w+")
+MENTION_PATTERN = re.compile(r"(?<!\w)@[\w.]+")
+
+
+def content_hash(post: Dict[str, Any]) -> str:
+    """
+    Hash the content of a post, together with the version of the rules.
+
+    Args:
+    - post (Dict[str, Any]): The post as read from the JSON file.
+
+    Returns:
+    - str: The hex digest identifying the post content.
+    """
+    payload = json.dumps([PREFLIGHT_VERSION, post], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def file_signature(path: str) -> Optional[List[Any]]:
+    """
+    Identify the current version of a file without reading it.
+
+    Args:
+    - path (str): The path to the file.
+
+    Returns:
+    - Optional[List[Any]]: Its absolute path, size and modification time, None if it is missing.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def validate_post(post: Dict[str, Any]) -> List[str]:
+    """
+    Check the caption and `extra_data` of a post against Instagram's limits and
+    the types `prepare_upload_params` coerces at publish time.
+
+    Args:
+    - post (Dict[str, Any]): The post as read from the JSON file.
+
+    Returns:
+    - List[str]: The problems found, empty if the post is valid.
+    """
+    errors: List[str] = []
+
+    caption = post.get("description")
+    if not isinstance(caption, str):
+        errors.append("'description' must be a string")
+    else:
+        if len(caption) > MAX_CAPTION_LENGTH:
+            errors.append(
+                f"caption is {len(caption)} characters long, the limit is {MAX_CAPTION_LENGTH}"
+            )
+
+        hashtags = len(HASHTAG_PATTERN.findall(caption))
+        if hashtags > MAX_HASHTAGS:
+            errors.append(
+                f"caption has {hashtags} hashtags, the limit is {MAX_HASHTAGS}"
+            )
+
+        mentions = len(MENTION_PATTERN.findall(caption))
+        if mentions > MAX_MENTIONS:
+            errors.append(
+                f"caption has {mentions} mentions, the limit is {MAX_MENTIONS}"
+            )
+
+    extra_data = post.get("extra_data")
+    if extra_data is not None and not isinstance(extra_data, dict):
+        errors.append("'extra_data' must be an object")
+    elif extra_data:
+        accessibility_caption = extra_data.get("custom_accessibility_caption")
+        if accessibility_caption is not None and not isinstance(
+            accessibility_caption, str
+        ):
+            errors.append("'custom_accessibility_caption' must be a string")
+
+        for key in ["like_and_view_counts_disabled", "disable_comments"]:
+            if key not in extra_data:
+                continue
+            try:
+                value = int(extra_data[key])
+            except (ValueError, TypeError):
+                errors.append(f"'{key}' must be 0 or 1, got {extra_data[key]!r}")
+                continue
+            if value not in (0, 1):
+                errors.append(f"'{key}' must be 0 or 1, got {extra_data[key]!r}")
+
+    return errors
+
+
+class PreflightCache:
+    """
+    Preflight results memoized in a JSON file, so posts that did not change
+    since the last run are not validated again.
+
+    When the posts come from a file whose path, size and modification time did
+    not change, the results of the last run are reused without looking at the
+    posts. Otherwise every post is hashed, and only the posts whose content
+    hash is not cached are validated.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        cache = self._load()
+        # content hash -> problems of every post of the last run
+        self.results: Dict[str, List[str]] = cache.get("results", {})
+        # The file the posts of the last run came from, and their problems by position
+        self.source: Optional[List[Any]] = cache.get("source")
+        self.invalid: Dict[str, List[str]] = cache.get("invalid", {})
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the cache, an unreadable, missing or outdated file is an empty cache."""
+        if not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, "r") as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, json.JSONDecodeError):
+            return {}
+
+        if not isinstance(cache, dict) or cache.get("version") != PREFLIGHT_VERSION:
+            return {}
+        return cache
+
+    def validate_all(
+        self, posts: List[Dict[str, Any]], source: Optional[List[Any]] = None
+    ) -> Dict[int, List[str]]:
+        """
+        Validate every post in one pass, reusing cached results.
+
+        Only the results of the given posts are kept, so the cache does not grow
+        with posts that left the queue.
+
+        Args:
+        - posts (List[Dict[str, Any]]): The posts as read from the JSON file.
+        - source (Optional[List[Any]]): The `file_signature` of the file, taken
+          before it was read. None if the posts do not come from a file.
+
+        Returns:
+        - Dict[int, List[str]]: The problems of every invalid post, by position.
+        """
+        if source is not None and source == self.source:
+            self.hits += len(posts)
+            return {int(index): errors for index, errors in self.invalid.items()}
+
+        results: Dict[str, List[str]] = {}
+        invalid: Dict[int, List[str]] = {}
+
+        for index, post in enumerate(posts):
+            digest = content_hash(post)
+            if digest in results:
+                errors = results[digest]
+            elif digest in self.results:
+                errors = self.results[digest]
+                self.hits += 1
+            else:
+                errors = validate_post(post)
+                self.misses += 1
+
+            results[digest] = errors
+            if errors:
+                invalid[index] = errors
+
+        if results != self.results or source != self.source:
+            self.results = results
+            self.source = source
+            self.invalid = {str(index): errors for index, errors in invalid.items()}
+            self.save()
+
+        return invalid
+
+    def save(self) -> None:
+        """Atomically write the cache back to disk."""
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump(
+                {
+                    "version": PREFLIGHT_VERSION,
+                    "source": self.source,
+                    "invalid": self.invalid,
+                    "results": self.results,
+                },
+                cache_file,
+            )
+        os.replace(temp_path, self.cache_path)
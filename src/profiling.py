@@ -0,0 +1,406 @@
+import argparse
+import cProfile
+import glob
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not recorded
+    resource = None
+
+# Number of allocation sites and functions kept in the summary of a run
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+# The bookkeeping of a run, always kept in the summary and in the comparison
+WATCHED_FUNCTIONS = {
+    "get_posts_from_json_file",
+    "load_posts",
+    "preflight",
+    "schedule_posts",
+    "handle_post_update",
+    "load_post_file",
+    "write_post_file",
+}
+
+# Time changes below this share of the base run's wall time, or below this many
+# seconds, and memory changes below this many kilobytes are noise, not regressions
+NOISE_SHARE = 0.01
+MIN_SECONDS_DELTA = 0.05
+MIN_KB_DELTA = 1024
+
+# Directory the profiles are written to by default
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "logs")
+
+
+def profiling_enabled(flag: bool = False) -> bool:
+    """
+    Tell whether a run is profiled: with its `--profile` flag, or with
+    `PROFILE_RUNS=1` in the environment or in `.env` (for the cron runs).
+
+    Args:
+    - flag (bool): Whether `--profile` was passed.
+
+    Returns:
+    - bool: True if the run is profiled.
+    """
+    if flag:
+        return True
+    load_dotenv()
+    return os.environ.get("PROFILE_RUNS", "").lower() in ("1", "true", "yes")
+
+
+def new_run_id(name: str) -> str:
+    """
+    Identify a run by what ran, when and in which process.
+
+    Args:
+    - name (str): What ran, e.g. "main-schedule" or "media_post".
+
+    Returns:
+    - str: The run id.
+    """
+    return f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+def get_peak_rss_kb() -> Optional[int]:
+    """Get the peak resident set size of the process in kilobytes, None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def summarize_functions(profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+    """
+    Get the functions that took the most cumulative time, and the watched ones.
+
+    Functions are named by file and function, without the line number, so runs
+    of different versions of the code can be compared.
+
+    Args:
+    - profiler (cProfile.Profile): The stopped profiler.
+
+    Returns:
+    - List[Dict[str, Any]]: The name, calls, own and cumulative seconds of every kept function.
+    """
+    profiler.create_stats()
+    functions: Dict[str, Dict[str, Any]] = {}
+    for (file_name, _, function), (_, calls, own, cumulative, _) in profiler.stats.items():
+        name = f"{os.path.basename(file_name)}:{function}"
+        entry = functions.setdefault(
+            name,
+            {"function": name, "calls": 0, "own_seconds": 0.0, "cumulative_seconds": 0.0},
+        )
+        entry["calls"] += calls
+        entry["own_seconds"] += own
+        entry["cumulative_seconds"] += cumulative
+
+    ranked = sorted(functions.values(), key=lambda entry: -entry["cumulative_seconds"])
+    return ranked[:TOP_FUNCTIONS] + [
+        entry
+        for entry in ranked[TOP_FUNCTIONS:]
+        if entry["function"].split(":")[-1] in WATCHED_FUNCTIONS
+    ]
+
+
+def summarize_allocations(snapshot: tracemalloc.Snapshot) -> List[Dict[str, Any]]:
+    """
+    Get the source lines holding the most memory at the end of a run.
+
+    Args:
+    - snapshot (tracemalloc.Snapshot): The snapshot taken at the end of the run.
+
+    Returns:
+    - List[Dict[str, Any]]: The location, kilobytes and number of blocks of every kept line.
+    """
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+    )
+    return [
+        {
+            "location": f"{statistic.traceback[0].filename}:{statistic.traceback[0].lineno}",
+            "size_kb": round(statistic.size / 1024, 1),
+            "count": statistic.count,
+        }
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+    ]
+
+
+@contextmanager
+def profile_run(
+    name: str,
+    logger: logging.Logger,
+    enabled: bool = True,
+    log_dir: str = LOG_DIR,
+) -> Iterator[Optional[str]]:
+    """
+    Profile the code run inside the block, and write its artifacts to the log
+    directory when it ends, even by `sys.exit`:
+    - `profile-<run id>.prof`: the cProfile stats, for `pstats` or snakeviz.
+    - `profile-<run id>.json`: the wall and CPU time, peak RSS, peak traced
+      memory, the top allocations (tracemalloc) and the top functions.
+
+    Tracing allocations slows the run down, compare runs profiled the same way.
+
+    Args:
+    - name (str): What runs, e.g. "main-schedule" or "media_post".
+    - logger (logging.Logger): The logger instance to use.
+    - enabled (bool): False to run the block without profiling it.
+    - log_dir (str): The directory to write the artifacts to.
+
+    Yields:
+    - Optional[str]: The run id, None when not profiling.
+    """
+    if not enabled:
+        yield None
+        return
+
+    run_id = new_run_id(name)
+    logger.info(f"Profiling run {run_id}")
+
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    started_at = datetime.now().isoformat()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    exit_code: Any = 0
+
+    profiler.enable()
+    try:
+        yield run_id
+    except SystemExit as e:
+        exit_code = e.code
+        raise
+    except BaseException as e:
+        exit_code = type(e).__name__
+        raise
+    finally:
+        profiler.disable()
+        wall_seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+        _, traced_peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        summary = {
+            "run_id": run_id,
+            "name": name,
+            "argv": sys.argv,
+            "started_at": started_at,
+            "exit_code": exit_code,
+            "wall_seconds": round(wall_seconds, 4),
+            "cpu_seconds": round(cpu_seconds, 4),
+            "peak_rss_kb": get_peak_rss_kb(),
+            "traced_peak_kb": round(traced_peak / 1024, 1),
+            "top_allocations": summarize_allocations(snapshot),
+            "top_functions": summarize_functions(profiler),
+        }
+
+        os.makedirs(log_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(log_dir, f"profile-{run_id}.prof"))
+        summary_path = os.path.join(log_dir, f"profile-{run_id}.json")
+        with open(summary_path, "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+        logger.info(
+            f"Profile of run {run_id} written to '{summary_path}': {wall_seconds:.2f}s wall, "
+            f"{cpu_seconds:.2f}s CPU, peak RSS {summary['peak_rss_kb']} KB"
+        )
+
+
+def load_summary(run: str, log_dir: str = LOG_DIR) -> Dict[str, Any]:
+    """
+    Load the summary of a profiled run.
+
+    Args:
+    - run (str): The run id, or the path to its summary file.
+    - log_dir (str): The directory the profiles are in.
+
+    Returns:
+    - Dict[str, Any]: The summary.
+
+    Raises:
+    - FileNotFoundError: If there is no such run.
+    """
+    path = run if run.endswith(".json") else os.path.join(log_dir, f"profile-{run}.json")
+    with open(path, "r") as summary_file:
+        return json.load(summary_file)
+
+
+def percent_change(base: float, new: float) -> float:
+    """Get the change from `base` to `new` in percent, a change from 0 counts as 100%."""
+    if base == 0:
+        return 0.0 if new == 0 else 100.0
+    return (new - base) / base * 100
+
+
+def compare_runs(
+    base: Dict[str, Any], new: Dict[str, Any], threshold: float, top: int = 15
+) -> List[str]:
+    """
+    Diff two profiled runs: totals, the watched functions and the functions that
+    changed the most. Only the wall and CPU time, the peak RSS and the watched
+    functions are flagged as regressions, when they grow by more than the
+    threshold and by more than the noise. The other functions are only listed:
+    timings of single functions drift between runs of the same code.
+
+    Args:
+    - base (Dict[str, Any]): The summary of the reference run.
+    - new (Dict[str, Any]): The summary of the run to check.
+    - threshold (float): The increase in percent that counts as a regression.
+    - top (int): The number of most changed functions to list.
+
+    Returns:
+    - List[str]: The report lines, the regressions start with "REGRESSION".
+    """
+    lines = [f"Comparing {base['run_id']} (base) with {new['run_id']}", ""]
+
+    # A share of the run, so long runs are not flagged for the load of the machine
+    seconds_noise = max(MIN_SECONDS_DELTA, NOISE_SHARE * base["wall_seconds"])
+
+    def compare(
+        label: str,
+        base_value: Any,
+        new_value: Any,
+        unit: str,
+        noise: float,
+        gated: bool = True,
+    ) -> None:
+        if base_value is None or new_value is None:
+            lines.append(f"{'':<10} {label:<44} n/a")
+            return
+
+        change = percent_change(base_value, new_value)
+        regression = gated and change > threshold and new_value - base_value > noise
+        lines.append(
+            f"{'REGRESSION' if regression else '':<10} {label:<44} "
+            f"{base_value:>12.2f} -> {new_value:>12.2f} {unit:<3} {change:+7.1f}%"
+        )
+
+    compare("wall time", base["wall_seconds"], new["wall_seconds"], "s", seconds_noise)
+    compare("CPU time", base["cpu_seconds"], new["cpu_seconds"], "s", seconds_noise)
+    compare("peak RSS", base["peak_rss_kb"], new["peak_rss_kb"], "KB", MIN_KB_DELTA)
+    compare(
+        "peak traced memory",
+        base["traced_peak_kb"],
+        new["traced_peak_kb"],
+        "KB",
+        MIN_KB_DELTA,
+        gated=False,
+    )
+
+    base_functions = {entry["function"]: entry for entry in base["top_functions"]}
+    new_functions = {entry["function"]: entry for entry in new["top_functions"]}
+    names = base_functions.keys() | new_functions.keys()
+
+    def cumulative(functions: Dict[str, Dict[str, Any]], name: str) -> float:
+        return functions.get(name, {}).get("cumulative_seconds", 0.0)
+
+    watched = sorted(name for name in names if name.split(":")[-1] in WATCHED_FUNCTIONS)
+    if watched:
+        lines += ["", "Bookkeeping (cumulative time):"]
+        for name in watched:
+            compare(
+                name,
+                cumulative(base_functions, name),
+                cumulative(new_functions, name),
+                "s",
+                seconds_noise,
+            )
+
+    changed = sorted(
+        (name for name in names if name not in watched),
+        key=lambda name: -abs(
+            cumulative(new_functions, name) - cumulative(base_functions, name)
+        ),
+    )[:top]
+    if changed:
+        lines += ["", "Most changed functions (cumulative time, not gated):"]
+        for name in changed:
+            compare(
+                name,
+                cumulative(base_functions, name),
+                cumulative(new_functions, name),
+                "s",
+                seconds_noise,
+                gated=False,
+            )
+
+    new_allocations = new["top_allocations"][:5]
+    if new_allocations:
+        lines += ["", f"Top allocations of {new['run_id']}:"]
+        lines += [
+            f"  {entry['location']:<60} {entry['size_kb']:>10.1f} KB {entry['count']:>8} blocks"
+            for entry in new_allocations
+        ]
+
+    return lines
+
+
+def main() -> None:
+    """
+    List the profiled runs, or compare two of them.
+    """
+    parser = argparse.ArgumentParser(description="Inspect profiled runs.")
+    parser.add_argument("--log-dir", default=LOG_DIR, help="Where the profiles are.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="List the profiled runs, oldest first.")
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Diff two runs, exits with 1 if the second one regressed."
+    )
+    compare_parser.add_argument("base", help="The run id (or summary file) of the reference run.")
+    compare_parser.add_argument("new", help="The run id (or summary file) of the run to check.")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Increase in percent that counts as a regression (default: 10).",
+    )
+    compare_parser.add_argument(
+        "--top", type=int, default=15, help="Number of most changed functions to list."
+    )
+    args = parser.parse_args()
+
+    if args.command == "list":
+        paths = glob.glob(os.path.join(args.log_dir, "profile-*.json"))
+        for path in sorted(paths, key=os.path.getmtime):
+            summary = load_summary(path)
+            print(
+                f"{summary['run_id']:<48} {summary['wall_seconds']:>9.2f}s "
+                f"{summary['cpu_seconds']:>9.2f}s CPU {summary['peak_rss_kb'] or 0:>10} KB"
+            )
+        return
+
+    try:
+        base = load_summary(args.base, log_dir=args.log_dir)
+        new = load_summary(args.new, log_dir=args.log_dir)
+    except (IOError, json.JSONDecodeError) as e:
+        print(f"Cannot read the profile: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    lines = compare_runs(base=base, new=new, threshold=args.threshold, top=args.top)
+    print("\n".join(lines))
+    if any(line.startswith("REGRESSION") for line in lines):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
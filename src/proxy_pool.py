@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import clock
+import file_lock
+
+# A proxy is rotated out once its smoothed latency or consecutive failures exceed these
+MAX_LATENCY_SECONDS = 5.0
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Weight of the newest sample in the exponentially weighted latency average
+LATENCY_SMOOTHING = 0.3
+
+# An unhealthy proxy gets another chance after this long, one more failure sends it back
+UNHEALTHY_COOLDOWN_SECONDS = 10 * 60
+
+# Failures of a request that are the proxy's (or the network's) fault
+TRANSPORT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.RetryError,
+)
+
+# Keep-alive pool size, large enough for the concurrent album item uploads
+POOL_SIZE = 16
+
+
+def mount_connection_pool(session: requests.Session) -> None:
+    """
+    Size the keep-alive connection pool of a session, keeping its retry policy
+    (instagrapi retries 429 and 5xx responses with backoff).
+
+    Args:
+    - session (requests.Session): The session to configure.
+    """
+    for prefix in ("https://", "http://"):
+        session.mount(
+            prefix,
+            HTTPAdapter(
+                pool_connections=POOL_SIZE,
+                pool_maxsize=POOL_SIZE,
+                max_retries=session.get_adapter(prefix).max_retries,
+            ),
+        )
+
+
+class TrackedAdapter(HTTPAdapter):
+    """
+    A keep-alive adapter that reports the outcome of every request sent through
+    a proxy to the proxy pool, including the connection and proxy errors that
+    never produce a response.
+    """
+
+    def __init__(self, proxy_pool: "ProxyPool", proxy: str, **kwargs: Any):
+        self.proxy_pool = proxy_pool
+        self.proxy = proxy
+        super().__init__(**kwargs)
+
+    def send(
+        self, request: requests.PreparedRequest, *args: Any, **kwargs: Any
+    ) -> requests.Response:
+        try:
+            response = super().send(request, *args, **kwargs)
+        except TRANSPORT_ERRORS:
+            self.proxy_pool.record_failure(self.proxy)
+            raise
+
+        if response.status_code >= 500:
+            self.proxy_pool.record_failure(self.proxy)
+        # Upload times depend on the file size, only GETs say how fast the proxy is
+        elif request.method == "GET":
+            self.proxy_pool.record_latency(self.proxy, response.elapsed.total_seconds())
+        return response
+
+
+class ProxyPool:
+    """
+    Per-account sticky proxy assignment with health tracking.
+
+    Each account keeps the same proxy between runs. A proxy that gets slow or
+    keeps failing is marked unhealthy and its accounts move to the next healthy
+    proxy. After `UNHEALTHY_COOLDOWN_SECONDS` it is tried again: a success
+    restarts its statistics, a failure starts another cool-down. Statistics are
+    persisted in a JSON file after every change, merged with the changes of the
+    other publisher processes, so they all see the same health.
+    """
+
+    def __init__(self, proxies: List[str], state_path: str, logger: logging.Logger):
+        self.proxies = proxies
+        self.state_path = state_path
+        self.logger = logger
+        self._lock = threading.Lock()
+
+        state = self._load()
+        self.assignments: Dict[str, str] = state.get("assignments", {})
+        self.stats: Dict[str, Dict[str, Any]] = state.get("stats", {})
+
+        # What this process changed since the last save, merged into the file
+        self._changed_accounts: Set[str] = set()
+        self._changed_proxies: Set[str] = set()
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the persisted state, an unreadable or missing file is a fresh state."""
+        if not os.path.exists(self.state_path):
+            return {}
+
+        try:
+            with open(self.state_path, "r") as state_file:
+                return json.load(state_file)
+        except (IOError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """
+        Atomically persist the assignments and statistics changed by this
+        process, and pick up the ones other processes saved meanwhile.
+        """
+        with file_lock.locked(self.state_path), self._lock:
+            state = self._load()
+            assignments = state.get("assignments", {})
+            stats = state.get("stats", {})
+            for account in self._changed_accounts:
+                assignments[account] = self.assignments[account]
+            for proxy in self._changed_proxies:
+                stats[proxy] = self.stats[proxy]
+
+            temp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as state_file:
+                json.dump({"assignments": assignments, "stats": stats}, state_file)
+            os.replace(temp_path, self.state_path)
+
+            self.assignments, self.stats = assignments, stats
+            self._changed_accounts.clear()
+            self._changed_proxies.clear()
+
+    def refresh(self) -> None:
+        """Pick up the assignments and statistics saved by other processes."""
+        with self._lock:
+            state = self._load()
+            self.assignments = {
+                **state.get("assignments", {}),
+                **{account: self.assignments[account] for account in self._changed_accounts},
+            }
+            self.stats = {
+                **state.get("stats", {}),
+                **{proxy: self.stats[proxy] for proxy in self._changed_proxies},
+            }
+
+    def is_healthy(self, proxy: str) -> bool:
+        """
+        Check whether a proxy is fast and reliable enough to keep using.
+
+        Args:
+        - proxy (str): The proxy URL.
+
+        Returns:
+        - bool: True if the proxy is healthy, False otherwise.
+        """
+        unhealthy_at = self.stats.get(proxy, {}).get("unhealthy_at")
+        return (
+            unhealthy_at is None
+            or clock.now().timestamp() - unhealthy_at >= UNHEALTHY_COOLDOWN_SECONDS
+        )
+
+    def _update_health(self, stats: Dict[str, Any]) -> None:
+        """Start a cool-down if the statistics of a proxy went over the limits, holding the lock."""
+        if (
+            stats.get("latency", 0.0) > MAX_LATENCY_SECONDS
+            or stats.get("consecutive_failures", 0) >= MAX_CONSECUTIVE_FAILURES
+        ):
+            stats["unhealthy_at"] = clock.now().timestamp()
+
+    def get_proxy(
+        self, account: str, proxies: Optional[List[str]] = None
+    ) -> Optional[str]:
+        """
+        Get the sticky proxy of an account, rotating away from an unhealthy one.
+
+        Args:
+        - account (str): The account name.
+        - proxies (Optional[List[str]]): The proxies the account may use. Defaults to every proxy of the pool.
+
+        Returns:
+        - Optional[str]: The proxy URL, or None if no proxies are configured.
+        """
+        proxies = proxies or self.proxies
+        if not proxies:
+            return None
+
+        self.refresh()
+        current = self.assignments.get(account)
+        if current in proxies and self.is_healthy(current):
+            return current
+
+        # Start from a stable position per account, so accounts spread over the proxies
+        start = int(hashlib.sha256(account.encode()).hexdigest(), 16) % len(proxies)
+        if current in proxies:
+            start = proxies.index(current) + 1
+
+        candidates = [
+            proxies[(start + offset) % len(proxies)] for offset in range(len(proxies))
+        ]
+        healthy = [proxy for proxy in candidates if self.is_healthy(proxy)]
+
+        # With every proxy unhealthy, use the one with the lowest latency
+        chosen = (
+            healthy[0]
+            if healthy
+            else min(
+                candidates,
+                key=lambda proxy: self.stats.get(proxy, {}).get("latency", float("inf")),
+            )
+        )
+
+        if current is not None and chosen != current:
+            self.logger.warning(
+                f"Rotating account '{account}' from proxy {current} to {chosen}"
+            )
+
+        self.assignments[account] = chosen
+        self._changed_accounts.add(account)
+        self.save()
+        return chosen
+
+    def record_latency(self, proxy: str, seconds: float) -> None:
+        """
+        Record a successful request through a proxy.
+
+        Args:
+        - proxy (str): The proxy URL.
+        - seconds (float): The time the request took.
+        """
+        with self._lock:
+            stats = self.stats.setdefault(proxy, {})
+            # A proxy back from its cool-down starts a fresh average
+            previous = None if stats.pop("unhealthy_at", None) else stats.get("latency")
+            stats["latency"] = (
+                seconds
+                if previous is None
+                else LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * previous
+            )
+            stats["consecutive_failures"] = 0
+            self._update_health(stats)
+            self._changed_proxies.add(proxy)
+        self.save()
+
+    def record_failure(self, proxy: str) -> None:
+        """
+        Record a failed request through a proxy.
+
+        Args:
+        - proxy (str): The proxy URL.
+        """
+        with self._lock:
+            stats = self.stats.setdefault(proxy, {})
+            stats["consecutive_failures"] = stats.get("consecutive_failures", 0) + 1
+            stats["failures"] = stats.get("failures", 0) + 1
+            self._update_health(stats)
+            self._changed_proxies.add(proxy)
+        self.save()
+
+    def track_session(self, session: requests.Session, proxy: str) -> None:
+        """
+        Record the latency, server errors and connection errors of every request of a session.
+
+        Args:
+        - session (requests.Session): The session using the proxy.
+        - proxy (str): The proxy URL.
+        """
+        for prefix in ("https://", "http://"):
+            session.mount(
+                prefix,
+                TrackedAdapter(
+                    proxy_pool=self,
+                    proxy=proxy,
+                    pool_connections=POOL_SIZE,
+                    pool_maxsize=POOL_SIZE,
+                    max_retries=session.get_adapter(prefix).max_retries,
+                ),
+            )
@@ -0,0 +1,830 @@
+import argparse
+import io
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import requests
+from dateutil import tz
+from PIL import Image
+
+import clock
+import file_lock
+from accounts import DEFAULT_ACCOUNT, load_accounts
+from engagement import account_timezone
+from history import HistoryIndex
+from logger_config import get_logger
+from media_post import DATA_DIR, load_post_file, normalize_post, write_post_file
+from proxy_pool import mount_connection_pool
+from retry_queue import RetryQueue
+from setup import get_account_proxy, setup_instagrapi
+from work_queue import SQLiteWorkQueue
+
+# Media per feed page, every page is a single API call
+PAGE_SIZE = 50
+
+# Media of every account kept in the cache, the newest ones
+MAX_CACHED_MEDIA = 5000
+
+# A media may be taken a little before its post date, cron and clocks drift
+TAKEN_AT_MARGIN = timedelta(minutes=5)
+
+# Images whose average hashes differ in at most this many of their 64 bits are the same
+MAX_HASH_DISTANCE = 10
+
+# Sources of the posts that may have been published without being recorded
+SOURCES = ["queued", "retrying", "error", "in_doubt"]
+
+
+def normalize_caption(caption: Optional[str]) -> str:
+    """
+    Normalize a caption for matching, Instagram trims and collapses some whitespace.
+
+    Args:
+    - caption (Optional[str]): The caption.
+
+    Returns:
+    - str: The caption with whitespace collapsed, in case folded form.
+    """
+    return " ".join((caption or "").split()).casefold()
+
+
+def average_hash(image: Image.Image) -> int:
+    """
+    Compute the 64 bit average hash of an image, which survives resizing and recompression.
+
+    Args:
+    - image (Image.Image): The image.
+
+    Returns:
+    - int: The hash, one bit per cell of an 8x8 grayscale thumbnail.
+    """
+    # JPEG images decode at a fraction of their size, the hash only needs 8x8 pixels
+    image.draft("L", (64, 64))
+    pixels = list(image.convert("L").resize((8, 8), Image.Resampling.BILINEAR).getdata())
+    mean = sum(pixels) / len(pixels)
+    return sum(1 << index for index, pixel in enumerate(pixels) if pixel > mean)
+
+
+def hash_distance(first: int, second: int) -> int:
+    """Count the differing bits of two average hashes."""
+    return bin(first ^ second).count("1")
+
+
+def to_utc_iso(moment: datetime) -> str:
+    """Format a time as a UTC ISO string, naive times are taken as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=tz.UTC)
+    return moment.astimezone(tz.UTC).isoformat()
+
+
+def summarize_media(media: Any) -> Dict[str, Any]:
+    """
+    Keep the fields of a media that are needed for matching.
+
+    Args:
+    - media (Any): The media, as returned by `Client.user_medias_paginated_v1`.
+
+    Returns:
+    - Dict[str, Any]: The pk, id, caption, time taken and thumbnail URL of the media.
+    """
+    thumbnail_url = media.thumbnail_url
+    # Albums have no thumbnail of their own, their first item stands for them
+    if thumbnail_url is None and getattr(media, "resources", None):
+        thumbnail_url = media.resources[0].thumbnail_url
+
+    return {
+        "pk": str(media.pk),
+        "id": media.id,
+        "caption": media.caption_text,
+        "taken_at": to_utc_iso(media.taken_at),
+        "thumbnail_url": str(thumbnail_url) if thumbnail_url else None,
+        "hash": None,
+    }
+
+
+class ReconcileCache:
+    """
+    The recent media of every account and the hashes of the local images.
+
+    For every account the cache knows down to which time its feed was fetched
+    without gaps, so a later run only fetches the media published since and
+    stops at the first page it already has. Thumbnails are hashed once, and a
+    local image is hashed again only when its size or modification time changes.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+
+        state = self._load()
+        # account -> {"oldest": UTC ISO time the feed is known down to, "" for all of it, "media": pk -> summary}
+        self.accounts: Dict[str, Dict[str, Any]] = state.get("accounts", {})
+        # path -> [modification time, size, hash]
+        self.local_hashes: Dict[str, List[Any]] = state.get("local_hashes", {})
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the saved cache, an unreadable or missing file is an empty cache."""
+        if not os.path.exists(self.cache_path):
+            return {}
+
+        try:
+            with open(self.cache_path, "r") as cache_file:
+                return json.load(cache_file)
+        except (IOError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """Atomically write the cache back to disk."""
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump(
+                {"accounts": self.accounts, "local_hashes": self.local_hashes},
+                cache_file,
+            )
+        os.replace(temp_path, self.cache_path)
+
+    def local_hash(self, path: str) -> Optional[int]:
+        """
+        Get the average hash of a local image.
+
+        Args:
+        - path (str): The path to the image.
+
+        Returns:
+        - Optional[int]: The hash, None if the image cannot be read.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        cached = self.local_hashes.get(path)
+        if cached and cached[:2] == [stat.st_mtime, stat.st_size]:
+            return cached[2]
+
+        try:
+            with Image.open(path) as image:
+                image_hash = average_hash(image)
+        except (OSError, ValueError):
+            return None
+
+        self.local_hashes[path] = [stat.st_mtime, stat.st_size, image_hash]
+        return image_hash
+
+
+def fetch_recent_media(
+    client: Any,
+    account: str,
+    since: datetime,
+    cache: ReconcileCache,
+    logger: logging.Logger,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Get the media an account published since a time, fetching only what the cache lacks.
+
+    Pages are fetched newest first until a page reaches past `since`, or reaches
+    media the cache already has once the cache covers `since`.
+
+    Args:
+    - client (Any): The client of the account, anything with `user_id` and `user_medias_paginated_v1`.
+    - account (str): The account name.
+    - since (datetime): The aware time to fetch back to.
+    - cache (ReconcileCache): The cache.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - Tuple[List[Dict[str, Any]], int]: The summaries of the media taken since `since`, and the number of API calls made.
+    """
+    since_iso = to_utc_iso(since)
+    cached = cache.accounts.setdefault(account, {"oldest": None, "media": {}})
+    known = cached["media"]
+    cached_oldest = cached["oldest"]
+    cache_covers_since = cached_oldest is not None and cached_oldest <= since_iso
+
+    end_cursor = ""
+    calls = 0
+    oldest: Optional[str] = None
+    reached_cache = False
+    while True:
+        medias, end_cursor = client.user_medias_paginated_v1(
+            client.user_id, amount=PAGE_SIZE, end_cursor=end_cursor
+        )
+        calls += 1
+        summaries = [summarize_media(media) for media in medias]
+        if not summaries:
+            # An empty first page is an empty feed, a later one a failed request
+            oldest = "" if oldest is None else oldest
+            break
+
+        # Pinned media sit at the top of the first page, the last one of a page is in feed order
+        last = summaries[-1]
+        reached_cache = reached_cache or (
+            cached_oldest is not None
+            and last["pk"] in known
+            and last["taken_at"] >= cached_oldest
+        )
+
+        for summary in summaries:
+            # Keep the hash of a thumbnail that was already downloaded
+            if summary["pk"] in known:
+                summary["hash"] = known[summary["pk"]].get("hash")
+            known[summary["pk"]] = summary
+
+        oldest = last["taken_at"] if end_cursor else ""
+        if not end_cursor or last["taken_at"] < since_iso:
+            break
+        if reached_cache and cache_covers_since:
+            break
+
+    # Fetched pages that reach the cached ones extend its coverage, otherwise there is a gap
+    cached["oldest"] = min(oldest, cached_oldest) if reached_cache else oldest
+
+    if len(known) > MAX_CACHED_MEDIA:
+        by_time = sorted(known.values(), key=lambda summary: summary["taken_at"])
+        kept = by_time[-MAX_CACHED_MEDIA:]
+        cached["media"] = known = {summary["pk"]: summary for summary in kept}
+        cached["oldest"] = max(cached["oldest"], kept[0]["taken_at"])
+
+    logger.info(f"Fetched {calls} pages of the feed of account '{account}'")
+    return (
+        [summary for summary in known.values() if summary["taken_at"] >= since_iso],
+        calls,
+    )
+
+
+def resolve_post_date_utc(
+    post: Dict[str, Any], accounts: Dict[str, Dict[str, Any]]
+) -> Optional[datetime]:
+    """
+    Resolve the post date of a post in its time zone into an aware UTC datetime.
+
+    Args:
+    - post (Dict[str, Any]): The content of the post.
+    - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+
+    Returns:
+    - Optional[datetime]: The post date in UTC, None if the date or time zone is invalid.
+    """
+    try:
+        post_date = datetime.strptime(str(post.get("post_date"))[:16], "%Y-%m-%d %H:%M")
+    except ValueError:
+        return None
+
+    timezone = (
+        tz.gettz(post["timezone"])
+        if post.get("timezone")
+        else account_timezone(accounts, post.get("account"))
+    )
+    if timezone is None:
+        return None
+    return post_date.replace(tzinfo=timezone).astimezone(tz.UTC)
+
+
+def record_key(post: Dict[str, Any]) -> str:
+    """Key a post by its content, to compare records in bulk."""
+    return json.dumps(post, sort_keys=True, default=str)
+
+
+def post_key(post: Dict[str, Any]) -> str:
+    """
+    Key a post by its normalized content, so the same post waiting in several
+    places gets the same key whether its date has seconds or not.
+    """
+    return record_key(normalize_post(post))
+
+
+def gather_candidates(
+    data_dir: str,
+    accounts: Dict[str, Dict[str, Any]],
+    since: datetime,
+    now: datetime,
+    work_queue: Optional[SQLiteWorkQueue],
+    account: Optional[str],
+    logger: logging.Logger,
+) -> List[Dict[str, Any]]:
+    """
+    Collect the posts that may have been published without being recorded: due
+    posts still in 'to-post', posts waiting for a retry, failed posts and posts
+    in doubt in the shared work queue.
+
+    Args:
+    - data_dir (str): The data directory.
+    - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+    - since (datetime): Only the posts dated at or after this aware time.
+    - now (datetime): The aware current time.
+    - work_queue (Optional[SQLiteWorkQueue]): The shared work queue, if any.
+    - account (Optional[str]): Only the posts of this account.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - List[Dict[str, Any]]: The source, account, post, post date in UTC and
+      original record of every candidate.
+    """
+    sources: List[Tuple[str, Dict[str, Any], Any]] = []
+
+    to_post_path = os.path.join(data_dir, "to-post.json")
+    if os.path.exists(to_post_path):
+        with open(to_post_path, "r") as to_post_file:
+            # "auto" posts get their date when scheduled, they are only tracked from there
+            for post in json.load(to_post_file).get("posts", []):
+                sources.append(("queued", post, post))
+
+    for entry in RetryQueue(
+        queue_path=os.path.join(data_dir, "retry-queue.json"), logger=logger
+    ).entries:
+        sources.append(("retrying", entry["post"], entry))
+
+    # Post dates are local to their time zone, a day earlier covers every offset
+    index = HistoryIndex(
+        data_dir=data_dir, db_path=os.path.join(data_dir, "history-index.sqlite3")
+    )
+    try:
+        index.refresh()
+        for match in index.query(
+            statuses=["error"],
+            account=account,
+            since=(since - timedelta(days=1)).strftime("%Y-%m-%d %H:%M"),
+        ):
+            record = match["post"]
+            post = {key: value for key, value in record.items() if key != "error"}
+            sources.append(("error", post, record))
+    finally:
+        index.close()
+
+    if work_queue is not None:
+        for entry in work_queue.list_posts(status="in_doubt"):
+            sources.append(("in_doubt", entry["post"], entry["post_id"]))
+
+    candidates = []
+    for source, post, record in sources:
+        post_account = post.get("account") or DEFAULT_ACCOUNT
+        if account is not None and post_account != account:
+            continue
+
+        post_date_utc = resolve_post_date_utc(post=post, accounts=accounts)
+        if post_date_utc is None or not since <= post_date_utc <= now:
+            continue
+
+        candidates.append(
+            {
+                "source": source,
+                "account": post_account,
+                "post": post,
+                "post_date_utc": post_date_utc,
+                "record": record,
+            }
+        )
+
+    return candidates
+
+
+def get_recorded_media_pks(data_dir: str, account: str, since: datetime) -> Set[str]:
+    """
+    Get the media already recorded in the success file, they cannot match another post.
+
+    Args:
+    - data_dir (str): The data directory.
+    - account (str): The account name.
+    - since (datetime): Only the posts dated at or after this aware time.
+
+    Returns:
+    - Set[str]: The pks of the recorded media.
+    """
+    index = HistoryIndex(
+        data_dir=data_dir, db_path=os.path.join(data_dir, "history-index.sqlite3")
+    )
+    try:
+        index.refresh()
+        return {
+            str(match["post"]["media_pk"])
+            for match in index.query(
+                statuses=["success"],
+                account=account,
+                since=(since - timedelta(days=1)).strftime("%Y-%m-%d %H:%M"),
+            )
+            if match["post"].get("media_pk")
+        }
+    finally:
+        index.close()
+
+
+def get_post_image_path(post: Dict[str, Any]) -> Optional[str]:
+    """Get the local image that stands for a post: its image, first album item or reel thumbnail."""
+    if "video_path" in post:
+        return post.get("thumbnail_path")
+
+    image_path = post.get("image_path")
+    if isinstance(image_path, list):
+        return image_path[0] if image_path else None
+    return image_path
+
+
+def make_thumbnail_hasher(
+    account: str, logger: logging.Logger
+) -> Callable[[Dict[str, Any]], Optional[int]]:
+    """
+    Make a function hashing the thumbnail of a media, downloaded through the
+    account's proxy on a keep-alive session.
+
+    Args:
+    - account (str): The account name.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - Callable[[Dict[str, Any]], Optional[int]]: Returns the hash of a media summary,
+      None if its thumbnail cannot be downloaded.
+    """
+    session = requests.Session()
+    mount_connection_pool(session)
+    proxy = get_account_proxy(
+        account=None if account == DEFAULT_ACCOUNT else account, logger=logger
+    )
+    if proxy:
+        session.proxies = {"http": proxy, "https": proxy}
+
+    def thumbnail_hash(summary: Dict[str, Any]) -> Optional[int]:
+        if summary["hash"] is None and summary["thumbnail_url"]:
+            try:
+                response = session.get(summary["thumbnail_url"], timeout=30)
+                response.raise_for_status()
+                with Image.open(io.BytesIO(response.content)) as image:
+                    summary["hash"] = average_hash(image)
+            except (requests.RequestException, OSError) as e:
+                logger.warning(f"Could not hash the thumbnail of media {summary['pk']}: {e}")
+        return summary["hash"]
+
+    return thumbnail_hash
+
+
+def match_candidates(
+    candidates: List[Dict[str, Any]],
+    media: List[Dict[str, Any]],
+    cache: ReconcileCache,
+    thumbnail_hash: Callable[[Dict[str, Any]], Optional[int]],
+) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Match the candidates of an account with its media by caption, and by image
+    hash when several media (or none, for empty captions) tell them apart.
+
+    Thumbnails are only downloaded to break such ties. Every media matches at
+    most one post, earlier posts first.
+
+    Args:
+    - candidates (List[Dict[str, Any]]): The candidates of the account, as returned by `gather_candidates`.
+    - media (List[Dict[str, Any]]): The media of the account not recorded yet.
+    - cache (ReconcileCache): The cache, for the hashes of the local images.
+    - thumbnail_hash (Callable[[Dict[str, Any]], Optional[int]]): Hashes the thumbnail of a media.
+
+    Returns:
+    - Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]]]:
+      The (candidate, media) matches, and the candidates that matched several media.
+    """
+    by_caption: Dict[str, List[Dict[str, Any]]] = {}
+    for summary in sorted(media, key=lambda summary: summary["taken_at"]):
+        by_caption.setdefault(normalize_caption(summary["caption"]), []).append(summary)
+
+    matches = []
+    ambiguous = []
+    used = set()
+    # The same post waiting in several places matches the same media
+    matched_posts: Dict[str, Dict[str, Any]] = {}
+    for candidate in sorted(candidates, key=lambda candidate: candidate["post_date_utc"]):
+        key = post_key(candidate["post"])
+        if key in matched_posts:
+            matches.append((candidate, matched_posts[key]))
+            continue
+
+        caption = normalize_caption(candidate["post"].get("description"))
+        earliest = to_utc_iso(candidate["post_date_utc"] - TAKEN_AT_MARGIN)
+        options = [
+            summary
+            for summary in by_caption.get(caption, [])
+            if summary["pk"] not in used and summary["taken_at"] >= earliest
+        ]
+        if not options:
+            continue
+
+        if caption and len(options) == 1:
+            chosen = options[0]
+        else:
+            image_path = get_post_image_path(candidate["post"])
+            local_hash = cache.local_hash(image_path) if image_path else None
+            if local_hash is None:
+                ambiguous.append(candidate)
+                continue
+
+            distances = []
+            for summary in options:
+                remote_hash = thumbnail_hash(summary)
+                if remote_hash is not None:
+                    distance = hash_distance(local_hash, remote_hash)
+                    if distance <= MAX_HASH_DISTANCE:
+                        distances.append((distance, summary["taken_at"], summary))
+            if not distances:
+                # The same caption on a different image is another post
+                if caption:
+                    ambiguous.append(candidate)
+                continue
+            chosen = min(distances, key=lambda item: item[:2])[2]
+
+        used.add(chosen["pk"])
+        matched_posts[key] = chosen
+        matches.append((candidate, chosen))
+
+    return matches, ambiguous
+
+
+def apply_matches(
+    matches: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+    data_dir: str,
+    work_queue: Optional[SQLiteWorkQueue],
+    logger: logging.Logger,
+) -> None:
+    """
+    Record the matched posts as published, all at once: append them to the
+    success file and remove them from the error file, 'to-post', the retry
+    queue and the shared work queue.
+
+    Args:
+    - matches (List[Tuple[Dict[str, Any], Dict[str, Any]]]): The (candidate, media) matches.
+    - data_dir (str): The data directory.
+    - work_queue (Optional[SQLiteWorkQueue]): The shared work queue, if any.
+    - logger (logging.Logger): The logger instance to use.
+    """
+    if not matches:
+        return
+
+    # A post found in several places is recorded once
+    published: Dict[str, Dict[str, Any]] = {}
+    removed: Dict[str, Set[Any]] = {source: set() for source in SOURCES}
+    for candidate, summary in matches:
+        published.setdefault(
+            post_key(candidate["post"]),
+            {
+                **normalize_post(candidate["post"]),
+                "media_id": summary["id"],
+                "media_pk": summary["pk"],
+                "published_at": summary["taken_at"],
+            },
+        )
+        # In doubt posts are known by their work queue id, retry entries by theirs
+        source = candidate["source"]
+        record = candidate["record"]
+        if source == "in_doubt":
+            removed[source].add(record)
+        elif source == "retrying":
+            removed[source].add(record["entry_id"])
+        else:
+            removed[source].add(record_key(record))
+
+    # Publishers and the watcher rewrite the same files
+    success_path = os.path.join(data_dir, "success.json")
+    with file_lock.locked(success_path):
+        success_data = load_post_file(
+            file_path=success_path, logger=logger, default=[]
+        )
+        success_data.extend(published.values())
+        write_post_file(file_path=success_path, posts=success_data, logger=logger)
+
+    if removed["error"]:
+        error_path = os.path.join(data_dir, "error.json")
+        with file_lock.locked(error_path):
+            error_data = load_post_file(file_path=error_path, logger=logger, default=[])
+            write_post_file(
+                file_path=error_path,
+                posts=[
+                    record
+                    for record in error_data
+                    if record_key(record) not in removed["error"]
+                ],
+                logger=logger,
+            )
+
+    if removed["queued"]:
+        to_post_path = os.path.join(data_dir, "to-post.json")
+        with file_lock.locked(to_post_path):
+            to_post_data = load_post_file(
+                file_path=to_post_path, logger=logger, default={"posts": []}
+            )
+            to_post_data["posts"] = [
+                post
+                for post in to_post_data["posts"]
+                if record_key(post) not in removed["queued"]
+            ]
+            write_post_file(file_path=to_post_path, posts=to_post_data, logger=logger)
+
+    if removed["retrying"]:
+        RetryQueue(
+            queue_path=os.path.join(data_dir, "retry-queue.json"), logger=logger
+        ).remove_ids(removed["retrying"])
+
+    if work_queue is not None:
+        for post_id in removed["in_doubt"]:
+            work_queue.resolve(post_id=post_id, status="published", now=clock.now())
+
+    logger.info(f"Reconciled {len(published)} published posts")
+
+
+def reconcile(
+    data_dir: str,
+    cache_path: str,
+    since: datetime,
+    logger: logging.Logger,
+    get_client: Callable[[Optional[str]], Any],
+    work_queue: Optional[SQLiteWorkQueue] = None,
+    account: Optional[str] = None,
+    dry_run: bool = False,
+    requeue_missing: bool = False,
+) -> Dict[str, Any]:
+    """
+    Find the posts that were published without being recorded, by comparing the
+    candidates with the recent media of their accounts, and fix their state.
+
+    Args:
+    - data_dir (str): The data directory.
+    - cache_path (str): The path to the cache file.
+    - since (datetime): Only the posts dated at or after this aware time.
+    - logger (logging.Logger): The logger instance to use.
+    - get_client (Callable[[Optional[str]], Any]): Returns the client of an account, None for the default account.
+    - work_queue (Optional[SQLiteWorkQueue]): The shared work queue, to settle its posts in doubt.
+    - account (Optional[str]): Only reconcile this account.
+    - dry_run (bool): Only report, without changing any file.
+    - requeue_missing (bool): Give the posts in doubt that are not on Instagram back to the queue.
+
+    Returns:
+    - Dict[str, Any]: The report: the API calls made, and the matched, ambiguous,
+      missing and requeued candidates.
+    """
+    now = clock.now()
+    accounts = load_accounts(os.path.join(data_dir, "accounts.json"))
+    cache = ReconcileCache(cache_path=cache_path)
+    report: Dict[str, Any] = {
+        "api_calls": 0,
+        "matched": [],
+        "ambiguous": [],
+        "missing": [],
+        "requeued": [],
+    }
+
+    by_account: Dict[str, List[Dict[str, Any]]] = {}
+    for candidate in gather_candidates(
+        data_dir=data_dir,
+        accounts=accounts,
+        since=since,
+        now=now,
+        work_queue=work_queue,
+        account=account,
+        logger=logger,
+    ):
+        by_account.setdefault(candidate["account"], []).append(candidate)
+
+    for account_name, candidates in sorted(by_account.items()):
+        # Only fetch back to the oldest candidate of the account
+        oldest = min(candidate["post_date_utc"] for candidate in candidates)
+        try:
+            client = get_client(None if account_name == DEFAULT_ACCOUNT else account_name)
+            media, calls = fetch_recent_media(
+                client=client,
+                account=account_name,
+                since=oldest - TAKEN_AT_MARGIN,
+                cache=cache,
+                logger=logger,
+            )
+        except (SystemExit, Exception) as e:
+            logger.error(f"Could not fetch the media of account '{account_name}': {e}")
+            continue
+        report["api_calls"] += calls
+
+        recorded = get_recorded_media_pks(
+            data_dir=data_dir, account=account_name, since=oldest
+        )
+        matches, ambiguous = match_candidates(
+            candidates=candidates,
+            media=[summary for summary in media if summary["pk"] not in recorded],
+            cache=cache,
+            thumbnail_hash=make_thumbnail_hasher(account=account_name, logger=logger),
+        )
+        report["matched"].extend(matches)
+        report["ambiguous"].extend(ambiguous)
+
+        settled = {id(candidate) for candidate, _ in matches} | {
+            id(candidate) for candidate in ambiguous
+        }
+        report["missing"].extend(
+            candidate for candidate in candidates if id(candidate) not in settled
+        )
+
+    cache.save()
+
+    if dry_run:
+        return report
+
+    apply_matches(
+        matches=report["matched"], data_dir=data_dir, work_queue=work_queue, logger=logger
+    )
+
+    if requeue_missing and work_queue is not None:
+        for candidate in report["missing"]:
+            covered_since = cache.accounts.get(candidate["account"], {}).get("oldest")
+            # Only when the feed was fetched back past the post, so it surely is not live
+            if (
+                candidate["source"] == "in_doubt"
+                and covered_since is not None
+                and covered_since
+                <= to_utc_iso(candidate["post_date_utc"] - TAKEN_AT_MARGIN)
+                and work_queue.resolve(
+                    post_id=candidate["record"], status="pending", now=clock.now()
+                )
+            ):
+                report["requeued"].append(candidate)
+
+    return report
+
+
+def print_report(report: Dict[str, Any], dry_run: bool) -> None:
+    """
+    Print the outcome of a reconciliation.
+
+    Args:
+    - report (Dict[str, Any]): The report returned by `reconcile`.
+    - dry_run (bool): True if nothing was changed.
+    """
+    verb = "would be recorded" if dry_run else "recorded"
+    print(f"{len(report['matched'])} posts found on Instagram and {verb} as published:")
+    for candidate, summary in report["matched"]:
+        post = candidate["post"]
+        print(
+            f"  {candidate['source']:<9} {str(post.get('post_date'))[:16]:<16} "
+            f"{candidate['account']:<12} media {summary['pk']}"
+        )
+
+    if report["ambiguous"]:
+        print(f"{len(report['ambiguous'])} posts match several media or none clearly, check them by hand:")
+        for candidate in report["ambiguous"]:
+            post = candidate["post"]
+            print(
+                f"  {candidate['source']:<9} {str(post.get('post_date'))[:16]:<16} "
+                f"{candidate['account']:<12} {normalize_caption(post.get('description'))[:40]}"
+            )
+
+    print(f"{len(report['missing'])} posts not on Instagram")
+    if report["requeued"]:
+        print(f"{len(report['requeued'])} posts in doubt given back to the work queue")
+    print(f"{report['api_calls']} feed pages fetched")
+
+
+def main() -> None:
+    """
+    Reconcile the post files with the media actually published on Instagram.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    log_path = os.path.join(current_dir, "..", "logs", "post-activity.log")
+
+    parser = argparse.ArgumentParser(
+        description="Find posts that were published without being recorded and fix their state."
+    )
+    parser.add_argument("--account", help="Only reconcile this account.")
+    parser.add_argument(
+        "--since-days",
+        type=int,
+        default=30,
+        help="Only reconcile the posts of the last days (default: 30).",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only report, without changing any file."
+    )
+    parser.add_argument(
+        "--work-queue",
+        default=os.environ.get("WORK_QUEUE_PATH"),
+        help="Also settle the posts in doubt of this shared work queue.",
+    )
+    parser.add_argument(
+        "--requeue-missing",
+        action="store_true",
+        help="Give the posts in doubt that are not on Instagram back to the work queue.",
+    )
+    args = parser.parse_args()
+
+    logger = get_logger(log_file=log_path)
+    work_queue = (
+        SQLiteWorkQueue(db_path=args.work_queue) if args.work_queue else None
+    )
+
+    report = reconcile(
+        data_dir=DATA_DIR,
+        cache_path=os.path.join(DATA_DIR, "reconcile-cache.json"),
+        since=clock.now() - timedelta(days=args.since_days),
+        logger=logger,
+        get_client=lambda account: setup_instagrapi(logger=logger, account=account),
+        work_queue=work_queue,
+        account=args.account,
+        dry_run=args.dry_run,
+        requeue_missing=args.requeue_missing,
+    )
+    print_report(report=report, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import logging
+import os
+from typing import Any, Dict, List
+
+from logger_config import get_logger
+from media_post import prepare_upload_params, upload_to_instagram
+from retry_queue import RetryQueue, schedule_retry_drain
+from setup import setup_instagrapi
+
+
+def drain_retry_queue(queue_path: str, logger: logging.Logger) -> None:
+    """
+    Retry every due post of the retry queue, most overdue first.
+
+    Failed attempts are queued again (or dead-lettered) by `upload_to_instagram`,
+    and the drain job is rescheduled for the next pending entry. An entry only
+    leaves the queue once the outcome of its attempt is recorded; posts whose
+    account cannot log in are postponed instead.
+
+    Args:
+    - queue_path (str): The path to the retry queue file.
+    - logger (logging.Logger): The logger instance to use for logging.
+    """
+    due_entries = RetryQueue(queue_path=queue_path, logger=logger).due()
+    logger.info(f"Retrying {len(due_entries)} queued posts")
+
+    for entry in due_entries:
+        json_post_content = entry["post"]
+
+        try:
+            # Clients are cached per account, so this logs in once per account
+            client = setup_instagrapi(
+                logger=logger, account=json_post_content.get("account")
+            )
+        except (SystemExit, Exception) as e:
+            logger.error(
+                f"Could not set up the client of account "
+                f"'{json_post_content.get('account')}', postponing the post: {e!r}"
+            )
+            RetryQueue(queue_path=queue_path, logger=logger).postpone(entry)
+            continue
+
+        # The media_post handlers exit after recording the outcome of a post
+        try:
+            upload_params = prepare_upload_params(
+                json_post_content=json_post_content, logger=logger
+            )
+            upload_to_instagram(
+                client=client,
+                upload_params=upload_params,
+                json_post_content=json_post_content,
+                logger=logger,
+                attempts=entry["attempts"],
+            )
+        except SystemExit:
+            pass
+
+        # Reload, a failed attempt was queued again as a new entry
+        RetryQueue(queue_path=queue_path, logger=logger).remove(entry)
+
+    # Reload, failed attempts may have been queued again
+    retry_queue = RetryQueue(queue_path=queue_path, logger=logger)
+    next_attempt_at = retry_queue.next_attempt_at()
+    if next_attempt_at is not None:
+        schedule_retry_drain(
+            queue_path=queue_path, run_at=next_attempt_at, logger=logger
+        )
+
+
+def get_dead_letters(error_file: str) -> List[Dict[str, Any]]:
+    """
+    Get the posts that failed permanently or ran out of retry attempts.
+
+    Args:
+    - error_file (str): The path to the error file.
+
+    Returns:
+    - List[Dict[str, Any]]: The failed posts, with their failure details when known.
+    """
+    if not os.path.exists(error_file):
+        return []
+
+    with open(error_file, "r") as file:
+        return json.load(file)
+
+
+def main() -> None:
+    """
+    Drain the retry queue, or print the dead-letter view with `--dead-letters`.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    log_path = os.path.join(current_dir, "..", "logs", "post-activity.log")
+    default_queue_path = os.path.join(current_dir, "..", "data", "retry-queue.json")
+    error_file = os.path.join(current_dir, "..", "data", "error.json")
+
+    parser = argparse.ArgumentParser(description="Retry failed Instagram posts.")
+    parser.add_argument("queue_path", nargs="?", default=default_queue_path)
+    parser.add_argument(
+        "--dead-letters",
+        action="store_true",
+        help="Print the posts that will not be retried and exit.",
+    )
+    args = parser.parse_args()
+
+    if args.dead_letters:
+        for post in get_dead_letters(error_file=error_file):
+            error = post.get("error") or {}
+            print(
+                f"{post.get('post_date')}\t"
+                f"{error.get('type', 'unknown')}\t"
+                f"attempts={error.get('attempts', 1)}\t"
+                f"{post.get('image_path') or post.get('video_path')}\t"
+                f"{error.get('message', '')}"
+            )
+        return
+
+    logger = get_logger(log_file=log_path)
+    drain_retry_queue(queue_path=args.queue_path, logger=logger)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import requests
+from crontab import CronTab
+from dateutil import tz
+from instagrapi.exceptions import (
+    ClientConnectionError,
+    ClientJSONDecodeError,
+    ClientRequestTimeout,
+    ClientThrottledError,
+    PleaseWaitFewMinutes,
+    RateLimitError,
+)
+
+import clock
+import file_lock
+
+# Failures that are worth another attempt, anything else is permanent
+RETRYABLE_EXCEPTIONS = (
+    ClientConnectionError,
+    ClientJSONDecodeError,
+    ClientRequestTimeout,
+    ClientThrottledError,
+    PleaseWaitFewMinutes,
+    RateLimitError,
+    requests.ConnectionError,
+    requests.Timeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+MAX_ATTEMPTS = 5
+BASE_BACKOFF_SECONDS = 5 * 60
+MAX_BACKOFF_SECONDS = 6 * 60 * 60
+
+# Comment identifying the single cron job that drains the retry queue
+RETRY_CRON_COMMENT = "insta-cron-post-retry-queue"
+
+DATE_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classify an upload failure as retryable or permanent.
+
+    Args:
+    - error (BaseException): The exception raised by the upload.
+
+    Returns:
+    - str: "retryable" or "permanent".
+    """
+    return "retryable" if isinstance(error, RETRYABLE_EXCEPTIONS) else "permanent"
+
+
+def compute_backoff(attempts: int) -> timedelta:
+    """
+    Compute the delay before the next attempt, exponential with jitter.
+
+    Args:
+    - attempts (int): The number of attempts made so far.
+
+    Returns:
+    - timedelta: The delay before the next attempt.
+    """
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class RetryQueue:
+    """
+    A durable, JSON file backed queue of posts waiting for another upload attempt.
+
+    Each entry holds its id, the post content, the number of attempts made, the
+    time of the next attempt and the last error. Publishers failing in the same
+    minute update the file at once, so every change reloads the file under a
+    lock, applies itself and writes the file back.
+    """
+
+    def __init__(self, queue_path: str, logger: logging.Logger):
+        self.queue_path = queue_path
+        self.logger = logger
+        self.entries: List[Dict[str, Any]] = self._load()
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """Load the queue entries, an unreadable or missing file is an empty queue."""
+        if not os.path.exists(self.queue_path):
+            return []
+
+        try:
+            with open(self.queue_path, "r") as queue_file:
+                entries = json.load(queue_file)
+        except (IOError, json.JSONDecodeError) as e:
+            self.logger.error(f"Failed to load retry queue '{self.queue_path}': {e}")
+            return []
+
+        # Entries queued before they had ids get one derived from their content
+        for entry in entries:
+            if "entry_id" not in entry:
+                payload = json.dumps(entry, sort_keys=True, default=str)
+                entry["entry_id"] = hashlib.sha256(payload.encode()).hexdigest()[:32]
+        return entries
+
+    def save(self) -> None:
+        """Atomically write the queue entries back to disk."""
+        temp_path = f"{self.queue_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as queue_file:
+            json.dump(self.entries, queue_file, indent=2)
+        os.replace(temp_path, self.queue_path)
+
+    def update(self, change: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """
+        Apply a change to the entries on disk, holding the lock of the queue file
+        from the read to the write, so concurrent changes are not lost.
+
+        Args:
+        - change (Callable[[List[Dict[str, Any]]], None]): Changes the entries in place.
+        """
+        with file_lock.locked(self.queue_path):
+            self.entries = self._load()
+            change(self.entries)
+            self.save()
+
+    def enqueue(
+        self,
+        json_post_content: Dict[str, Any],
+        error: BaseException,
+        attempts: int,
+        now: Optional[datetime] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Queue a post for another attempt, unless it ran out of attempts.
+
+        Args:
+        - json_post_content (Dict[str, Any]): The content of the post.
+        - error (BaseException): The exception raised by the failed attempt.
+        - attempts (int): The number of attempts made, including the failed one.
+        - now (Optional[datetime]): The current time. Defaults to `clock.now()`.
+
+        Returns:
+        - Optional[Dict[str, Any]]: The queued entry, or None if the post should be dead-lettered.
+        """
+        if attempts >= MAX_ATTEMPTS:
+            return None
+
+        now = now or clock.now()
+        entry = {
+            "entry_id": uuid.uuid4().hex,
+            "post": json_post_content,
+            "attempts": attempts,
+            "next_attempt_at": (now + compute_backoff(attempts)).isoformat(),
+            "error_type": type(error).__name__,
+            "last_error": str(error),
+        }
+        self.update(lambda entries: entries.append(entry))
+        return entry
+
+    def due(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Get every entry that is due, most overdue post first. The entries stay
+        queued until `remove` is called once the outcome of their attempt is
+        recorded, so a drain that dies halfway loses none of them.
+
+        Entries are ordered by their original `post_date`, so posts that are
+        already late go out before ones that were meant for later.
+
+        Args:
+        - now (Optional[datetime]): The current time. Defaults to `clock.now()`.
+
+        Returns:
+        - List[Dict[str, Any]]: The due entries in priority order.
+        """
+        now = now or clock.now()
+
+        due = [
+            entry
+            for entry in self.entries
+            if datetime.fromisoformat(entry["next_attempt_at"]) <= now
+        ]
+        return sorted(due, key=lambda entry: entry["post"].get("post_date", ""))
+
+    def remove(self, entry: Dict[str, Any]) -> None:
+        """
+        Remove an entry whose attempt was recorded: as a success, an error, or
+        as a new entry for the next attempt.
+
+        Args:
+        - entry (Dict[str, Any]): The entry, as returned by `due`.
+        """
+        self.remove_ids({entry["entry_id"]})
+
+    def remove_ids(self, entry_ids: Set[str]) -> None:
+        """
+        Remove entries by their id, in one write.
+
+        Args:
+        - entry_ids (Set[str]): The "entry_id" of every entry to remove.
+        """
+
+        def drop(queued: List[Dict[str, Any]]) -> None:
+            queued[:] = [item for item in queued if item["entry_id"] not in entry_ids]
+
+        self.update(drop)
+
+    def postpone(self, entry: Dict[str, Any], now: Optional[datetime] = None) -> None:
+        """
+        Move the next attempt of an entry that could not be attempted (e.g. the
+        login failed) by the backoff of its attempts, without counting an attempt.
+
+        Args:
+        - entry (Dict[str, Any]): The entry, as returned by `due`.
+        - now (Optional[datetime]): The current time. Defaults to `clock.now()`.
+        """
+        now = now or clock.now()
+        next_attempt_at = (now + compute_backoff(entry["attempts"])).isoformat()
+
+        def move(queued: List[Dict[str, Any]]) -> None:
+            for item in queued:
+                if item["entry_id"] == entry["entry_id"]:
+                    item["next_attempt_at"] = next_attempt_at
+
+        self.update(move)
+
+    def next_attempt_at(self) -> Optional[datetime]:
+        """
+        Get the time of the earliest pending attempt.
+
+        Returns:
+        - Optional[datetime]: The earliest `next_attempt_at`, or None if the queue is empty.
+        """
+        if not self.entries:
+            return None
+
+        return min(
+            datetime.fromisoformat(entry["next_attempt_at"]) for entry in self.entries
+        )
+
+
+def schedule_retry_drain(
+    queue_path: str, run_at: datetime, logger: logging.Logger
+) -> None:
+    """
+    (Re)schedule the single cron job that drains the retry queue.
+
+    Callers pass the earliest `next_attempt_at` of the queue, so the job always
+    fires for the next pending entry. The drain script reschedules it after each run.
+
+    Args:
+    - queue_path (str): The path to the retry queue file.
+    - run_at (datetime): The time the queue should be drained.
+    - logger (logging.Logger): The logger instance to use for logging.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    user_shell = os.path.basename(os.environ.get("SHELL", "/bin/bash"))
+
+    shell_script_map: Dict[str, str] = {
+        "bash": os.path.join(src_dir, "scripts", "run_media_post.sh"),
+        "fish": os.path.join(src_dir, "scripts", "run_media_post.fish"),
+    }
+
+    run_media_post_path = shell_script_map.get(user_shell, None)
+    if run_media_post_path is None:
+        logger.error(f"Unsupported shell for the retry queue: {user_shell}")
+        return
+
+    retry_posts_path = os.path.join(src_dir, "retry_posts.py")
+
+    # Cron runs in the local time zone at minute resolution, round up to the next minute
+    run_at_local = run_at.astimezone(tz.tzlocal()) + timedelta(minutes=1)
+
+    try:
+        cron = CronTab(user=True)
+        cron.remove_all(comment=RETRY_CRON_COMMENT)
+
+        command = (
+            f"SHELL=$(command -v {user_shell})"
+            + (";" if user_shell == "bash" else "")
+            + f" {user_shell} {run_media_post_path} {retry_posts_path} {os.path.abspath(queue_path)}"
+        )
+        job = cron.new(command=command, comment=RETRY_CRON_COMMENT)
+        job.setall(run_at_local.strftime("%M %H %d %m *"))
+        cron.write()
+        logger.info(
+            f"Retry queue drain scheduled for {run_at_local.strftime(DATE_FORMAT)}"
+        )
+    except Exception as e:
+        logger.error(f"Failed to schedule the retry queue drain: {e}")
@@ -80,7 +80,7 @@ end
 # Get the path to the python3 executable from the virtual environment
 set -l PYTHON_EXEC (command -v python)
 
-"$PYTHON_EXEC" "$MEDIA_POST_PATH" "$POST_FILE_PATH"
-
-# Remove the cronjob after running the script
+# Remove the cronjob before running the script, so the script can schedule a new one
 crontab -l | grep -v "$POST_FILE_PATH" | crontab -
+
+"$PYTHON_EXEC" "$MEDIA_POST_PATH" "$POST_FILE_PATH"
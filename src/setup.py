@@ -1,11 +1,23 @@
 import logging
 import os
 import sys
-from typing import NoReturn, Tuple
+from typing import Dict, List, NoReturn, Optional, Tuple
 
 from dotenv import load_dotenv
 from instagrapi import Client
 
+from accounts import DEFAULT_ACCOUNT, get_account_settings, load_accounts
+from proxy_pool import ProxyPool, mount_connection_pool
+
+# Directory holding the accounts and proxy health files
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+# Logged in clients per account, reused for every upload of a long-lived process
+_clients: Dict[str, Client] = {}
+# The proxy each cached client goes through, None for a direct connection
+_client_proxies: Dict[str, Optional[str]] = {}
+_proxy_pool: Optional[ProxyPool] = None
+
 
 def log_and_exit(logger: logging.Logger, message: str) -> NoReturn:
     """
@@ -19,15 +31,20 @@ def log_and_exit(logger: logging.Logger, message: str) -> NoReturn:
     sys.exit(1)
 
 
-def get_credentials(logger: logging.Logger) -> Tuple[str, str]:
+def get_credentials(
+    logger: logging.Logger, account: Optional[str] = None
+) -> Tuple[str, str]:
     """
     Retrieve the username and password from environment variables.
 
     This function loads the environment variables from a .env file using dotenv,
     then retrieves the username and password from the environment variables.
+    Accounts other than the default one use `INSTA_USERNAME_<ACCOUNT>` and
+    `INSTA_PASSWORD_<ACCOUNT>`.
 
     Args:
     - logger (logging.Logger): The logger instance to use for logging.
+    - account (Optional[str]): The account name, None for the default account.
 
     Returns:
     - Tuple[str, str]: A tuple containing the username and password retrieved from the environment variables.
@@ -38,9 +55,13 @@ def get_credentials(logger: logging.Logger) -> Tuple[str, str]:
 
     load_dotenv()
 
+    suffix = (
+        f"_{account.upper()}" if account and account != DEFAULT_ACCOUNT else ""
+    )
+
     # Get the username and password from the environment variables:
-    username: str | None = os.getenv("INSTA_USERNAME")
-    password: str | None = os.getenv("INSTA_PASSWORD")
+    username: str | None = os.getenv(f"INSTA_USERNAME{suffix}")
+    password: str | None = os.getenv(f"INSTA_PASSWORD{suffix}")
 
     # Check if username or password is None, and raise an exception if so.
     if username is None or password is None:
@@ -52,15 +73,105 @@ def get_credentials(logger: logging.Logger) -> Tuple[str, str]:
     return username, password
 
 
-def setup_instagrapi(logger: logging.Logger) -> Client:
+def get_proxy_pool(logger: logging.Logger) -> ProxyPool:
+    """
+    Get the process wide proxy pool.
+
+    Proxies come from the "proxies" list of each account in `data/accounts.json`,
+    and the comma separated `INSTA_PROXIES` environment variable.
+
+    Args:
+    - logger (logging.Logger): The logger instance to use for logging.
+
+    Returns:
+    - ProxyPool: The proxy pool, possibly without any proxies.
+    """
+    global _proxy_pool
+
+    if _proxy_pool is None:
+        accounts = load_accounts(os.path.join(DATA_DIR, "accounts.json"))
+
+        proxies: List[str] = [
+            proxy.strip()
+            for proxy in os.getenv("INSTA_PROXIES", "").split(",")
+            if proxy.strip()
+        ]
+        for settings in accounts.values():
+            proxies.extend(
+                proxy for proxy in settings.get("proxies", []) if proxy not in proxies
+            )
+
+        _proxy_pool = ProxyPool(
+            proxies=proxies,
+            state_path=os.path.join(DATA_DIR, "proxy-health.json"),
+            logger=logger,
+        )
+
+    return _proxy_pool
+
+
+def get_account_proxy(account: Optional[str], logger: logging.Logger) -> Optional[str]:
+    """
+    Get the sticky proxy of an account, restricted to its own "proxies" list if it has one.
+
+    Args:
+    - account (Optional[str]): The account name, None for the default account.
+    - logger (logging.Logger): The logger instance to use for logging.
+
+    Returns:
+    - Optional[str]: The proxy URL, or None for a direct connection.
+    """
+    settings = get_account_settings(
+        accounts=load_accounts(os.path.join(DATA_DIR, "accounts.json")),
+        account=account,
+    )
+
+    return get_proxy_pool(logger=logger).get_proxy(
+        account=account or DEFAULT_ACCOUNT, proxies=settings.get("proxies")
+    )
+
+
+def use_proxy(
+    client: Client, proxy: Optional[str], key: str, logger: logging.Logger
+) -> None:
+    """
+    Route a client through a proxy, tracking the health of the proxy, or
+    connect it directly when the proxy is None.
+
+    Args:
+    - client (Client): The instagrapi client.
+    - proxy (Optional[str]): The proxy URL, None for a direct connection.
+    - key (str): The account of the client.
+    - logger (logging.Logger): The logger instance to use for logging.
+    """
+    if proxy:
+        client.set_proxy(proxy)
+        get_proxy_pool(logger=logger).track_session(client.private, proxy)
+        get_proxy_pool(logger=logger).track_session(client.public, proxy)
+        logger.info(f"Using proxy {proxy} for account '{key}'")
+    else:
+        client.set_proxy("")
+        mount_connection_pool(client.private)
+        mount_connection_pool(client.public)
+    _client_proxies[key] = proxy
+
+
+def setup_instagrapi(logger: logging.Logger, account: Optional[str] = None) -> Client:
     """
     Set up the instagrapi client with the provided username and password.
 
     This function uses the get_credentials() function to retrieve the username and password,
     then initializes the instagrapi client with the credentials.
 
+    Clients are cached per account, so a long-lived process logs in once and
+    reuses the keep-alive connection pool for every upload. When proxies are
+    configured the account gets its sticky proxy from the proxy pool, checked
+    again on every call, so a cached client moves off a proxy that turned
+    unhealthy (in this process or another one).
+
     Args:
     - logger (logging.Logger): The logger instance to use for logging.
+    - account (Optional[str]): The account to log in with, None for the default account.
 
     Returns:
     - client (instagrapi.Client): The instagrapi client with the provided credentials.
@@ -68,9 +179,26 @@ def setup_instagrapi(logger: logging.Logger) -> Client:
     Raises:
     - SystemExit: If an error occurs while logging in to Instagram.
     """
-    username, password = get_credentials(logger=logger)
+    key = account or DEFAULT_ACCOUNT
+    proxy = get_account_proxy(account=account, logger=logger)
+
+    if key in _clients:
+        client = _clients[key]
+        # The session cookies stay valid through another proxy
+        if _client_proxies.get(key) != proxy:
+            use_proxy(client=client, proxy=proxy, key=key, logger=logger)
+        return client
+
+    username, password = get_credentials(logger=logger, account=account)
     client = Client()
 
+    # Keep-alive pools, so every request of a long-lived process reuses connections
+    mount_connection_pool(client.private)
+    mount_connection_pool(client.public)
+
+    if proxy:
+        use_proxy(client=client, proxy=proxy, key=key, logger=logger)
+
     try:
         login_success = client.login(username=username, password=password)
 
@@ -80,8 +208,11 @@ def setup_instagrapi(logger: logging.Logger) -> Client:
         logger.info("Instagram Login successful")
 
     except Exception as e:
+        # Connection and proxy errors were recorded (and saved) by the session of the proxy
         log_and_exit(
             logger=logger, message=f"An error occurred while trying to login: {e}"
         )
 
+    _clients[key] = client
+    _client_proxies[key] = proxy
     return client
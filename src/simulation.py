@@ -0,0 +1,518 @@
+import heapq
+import json
+import logging
+import math
+import os
+import random
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from dateutil import tz
+from instagrapi.exceptions import (
+    ClientConnectionError,
+    MediaNotFound,
+    PleaseWaitFewMinutes,
+)
+
+import clock
+import media_post
+import retry_posts
+import retry_queue
+from accounts import DEFAULT_ACCOUNT
+
+# Modeled time between a cron job firing and the upload starting (shell, venv, login)
+STARTUP_SECONDS = 8.0
+
+
+class VirtualClock:
+    """
+    A clock that only moves when the simulation moves it.
+    """
+
+    def __init__(self, start: datetime):
+        self.current = start
+
+    def now(self) -> datetime:
+        return self.current
+
+    def set(self, moment: datetime) -> None:
+        self.current = moment
+
+    def advance(self, seconds: float) -> None:
+        self.current += timedelta(seconds=seconds)
+
+
+class StubCronJob:
+    """
+    A crontab job that only records its command and schedule.
+    """
+
+    def __init__(self, command: str, comment: str = ""):
+        self.command = command
+        self.comment = comment
+        self.schedule_expression: Optional[str] = None
+
+    def setall(self, expression: str) -> None:
+        self.schedule_expression = expression
+
+    def next_run(self, after: datetime) -> datetime:
+        """
+        Resolve the "%M %H %d %m *" schedule into the next aware local datetime.
+
+        Args:
+        - after (datetime): The aware time the job was created at.
+
+        Returns:
+        - datetime: The next time the job fires.
+        """
+        minute, hour, day, month, _ = self.schedule_expression.split()
+        local_after = after.astimezone(tz.tzlocal())
+        fire_at = datetime(
+            local_after.year,
+            int(month),
+            int(day),
+            int(hour),
+            int(minute),
+            tzinfo=tz.tzlocal(),
+        )
+        if fire_at < local_after - timedelta(minutes=1):
+            fire_at = fire_at.replace(year=fire_at.year + 1)
+        return fire_at
+
+
+class StubCronTab:
+    """
+    A stand-in for `crontab.CronTab` that keeps the jobs in memory.
+    """
+
+    def __init__(self, user: Any = True):
+        self.user = "simulation"
+        self.jobs: List[StubCronJob] = []
+
+    def new(self, command: str, comment: str = "") -> StubCronJob:
+        job = StubCronJob(command=command, comment=comment)
+        self.jobs.append(job)
+        return job
+
+    def remove_all(self, comment: Optional[str] = None) -> None:
+        self.jobs = [job for job in self.jobs if comment and job.comment != comment]
+
+    def write(self) -> None:
+        pass
+
+
+class StubMedia:
+    """
+    The subset of `instagrapi.types.Media` used by the publisher.
+    """
+
+    def __init__(self, media_id: str, like_count: int = 0, comment_count: int = 0):
+        self.media_id = media_id
+        self.like_count = like_count
+        self.comment_count = comment_count
+
+    def model_dump(self) -> Dict[str, Any]:
+        return {"id": self.media_id, "pk": self.media_id}
+
+
+class StubClient:
+    """
+    A stand-in for `instagrapi.Client` with modeled latency, failures and rate limits.
+
+    Each upload advances the virtual clock by a log-normally distributed latency.
+    An account going over `rate_limit_per_hour` gets `PleaseWaitFewMinutes`, and
+    any upload fails with `ClientConnectionError` with probability `failure_rate`.
+    Published media get modeled engagement that peaks for posts published in the
+    evening (UTC), readable through `media_info` like on the real client.
+
+    Captions are not unique, so the simulation tells the client which post the
+    next upload is for with `expect`.
+    """
+
+    def __init__(
+        self,
+        virtual_clock: VirtualClock,
+        rng: random.Random,
+        latency: float,
+        failure_rate: float,
+        rate_limit_per_hour: int,
+        posts_by_key: Dict[str, Dict[str, Any]],
+    ):
+        self.virtual_clock = virtual_clock
+        self.rng = rng
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_per_hour = rate_limit_per_hour
+        self.posts_by_key = posts_by_key
+        self.current_post: Dict[str, Any] = {}
+        self.published: Dict[str, Deque[datetime]] = {}
+        self.attempts: List[Dict[str, Any]] = []
+        self.media: Dict[str, StubMedia] = {}
+        self.user_id = "0"
+
+    def _latency(self) -> float:
+        """Sample an upload latency with the configured mean."""
+        sigma = 0.5
+        return self.rng.lognormvariate(math.log(self.latency) - sigma**2 / 2, sigma)
+
+    def expect(self, json_post_content: Dict[str, Any]) -> None:
+        """
+        Tell which post the next upload is for.
+
+        Args:
+        - json_post_content (Dict[str, Any]): The content of the post.
+        """
+        self.current_post = self.posts_by_key.get(post_key(json_post_content), {})
+
+    def publish(self, caption: str) -> StubMedia:
+        """
+        Model a single upload of the expected post and record it.
+
+        Args:
+        - caption (str): The caption of the post.
+
+        Returns:
+        - StubMedia: The published media.
+
+        Raises:
+        - PleaseWaitFewMinutes: If the account went over its rate limit.
+        - ClientConnectionError: If the upload randomly fails.
+        """
+        post = self.current_post
+        account = post.get("account", DEFAULT_ACCOUNT)
+
+        started_at = self.virtual_clock.now()
+        self.virtual_clock.advance(self._latency())
+        finished_at = self.virtual_clock.now()
+
+        attempt = {
+            "account": account,
+            "caption": caption,
+            "requested": post.get("requested"),
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+        self.attempts.append(attempt)
+
+        window = self.published.setdefault(account, deque())
+        while window and window[0] <= finished_at - timedelta(hours=1):
+            window.popleft()
+
+        if len(window) >= self.rate_limit_per_hour:
+            attempt["status"] = "rate_limited"
+            raise PleaseWaitFewMinutes("Simulated rate limit")
+
+        if self.rng.random() < self.failure_rate:
+            attempt["status"] = "failed"
+            raise ClientConnectionError("Simulated connection error")
+
+        window.append(finished_at)
+        attempt["status"] = "published"
+
+        # Engagement follows a daily cycle with its peak at 18:00
+        daily_cycle = math.cos((finished_at.hour - 18) / 24 * 2 * math.pi)
+        likes = max(0, round(self.rng.gauss(100 + 60 * daily_cycle, 15)))
+        media = StubMedia(
+            media_id=str(len(self.attempts)),
+            like_count=likes,
+            comment_count=max(0, round(likes * self.rng.uniform(0.02, 0.08))),
+        )
+        self.media[media.media_id] = media
+        return media
+
+    def media_info(self, media_pk: str) -> StubMedia:
+        """
+        Get a published media, with its modeled engagement.
+
+        Args:
+        - media_pk (str): The media pk.
+
+        Returns:
+        - StubMedia: The media.
+
+        Raises:
+        - MediaNotFound: If no media was published with this pk.
+        """
+        if media_pk not in self.media:
+            raise MediaNotFound("Simulated missing media")
+        return self.media[media_pk]
+
+    def photo_upload(self, caption: str, **kwargs: Any) -> StubMedia:
+        return self.publish(caption=caption)
+
+
+def post_key(json_post_content: Dict[str, Any]) -> str:
+    """
+    Key a post by its content. `extra_data` is left out, the publisher coerces
+    its values in place before the first upload.
+
+    Args:
+    - json_post_content (Dict[str, Any]): The content of the post.
+
+    Returns:
+    - str: The key.
+    """
+    return json.dumps(
+        {key: value for key, value in json_post_content.items() if key != "extra_data"},
+        sort_keys=True,
+        default=str,
+    )
+
+
+def _stub_upload(client: StubClient, caption: str, **kwargs: Any) -> StubMedia:
+    """Stand-in for `upload_album` and `upload_reel`, which do not use `photo_upload`."""
+    return client.publish(caption=caption)
+
+
+def _percentile(values: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+def _peak_concurrency(
+    intervals: List[Tuple[datetime, datetime]]
+) -> Tuple[int, Optional[datetime]]:
+    """Sweep the process intervals and return the peak overlap and when it happened."""
+    events = sorted(
+        [(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals],
+        key=lambda event: (event[0], event[1]),
+    )
+    peak, peak_at, running = 0, None, 0
+    for moment, delta in events:
+        running += delta
+        if running > peak:
+            peak, peak_at = running, moment
+    return peak, peak_at
+
+
+def simulate(
+    assignments: List[Dict[str, Any]],
+    cron: StubCronTab,
+    data_dir: str,
+    latency: float,
+    failure_rate: float,
+    rate_limit_per_hour: int,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Fire every scheduled post at its cron time through the real publishing code
+    (`media_post` and the retry queue drain), against a virtual clock.
+
+    Nothing sleeps: uploads advance the virtual clock, so a month of posts runs in
+    seconds. The data files and the retry queue live in `data_dir`.
+
+    Args:
+    - assignments (List[Dict[str, Any]]): The slot assignments returned by `schedule_posts`.
+    - cron (StubCronTab): The stub crontab the posts were scheduled in.
+    - data_dir (str): A scratch directory for the data files.
+    - latency (float): The mean upload latency in seconds.
+    - failure_rate (float): The probability that an upload fails.
+    - rate_limit_per_hour (int): The modeled posts per hour limit of each account.
+    - seed (int): The seed of the random generator, for reproducible runs.
+
+    Returns:
+    - Dict[str, Any]: The simulation report.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+
+    started_at = clock.now()
+    virtual_clock = VirtualClock(start=started_at)
+
+    for file_name, default in [
+        ("success.json", []),
+        ("error.json", []),
+        ("to-post.json", {"posts": []}),
+    ]:
+        with open(os.path.join(data_dir, file_name), "w") as file:
+            json.dump(default, file)
+
+    posts_by_key: Dict[str, Dict[str, Any]] = {}
+    posts_by_file: Dict[str, Dict[str, Any]] = {}
+    for assignment in assignments:
+        with open(assignment["scheduled_post_file_path"], "r") as file:
+            content = json.load(file)
+        info = {"account": assignment["account"], "requested": assignment["requested"]}
+        posts_by_key[post_key(content)] = info
+        posts_by_file[assignment["scheduled_post_file_path"]] = content
+
+    client = StubClient(
+        virtual_clock=virtual_clock,
+        rng=rng,
+        latency=latency,
+        failure_rate=failure_rate,
+        rate_limit_per_hour=rate_limit_per_hour,
+        posts_by_key=posts_by_key,
+    )
+
+    # A quiet logger, the publisher logs every step
+    logger = logging.getLogger("simulation")
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+
+    queue_path = os.path.join(data_dir, "retry-queue.json")
+
+    def prepare_upload_params(
+        json_post_content: Dict[str, Any], logger: logging.Logger
+    ) -> Dict[str, Any]:
+        """Tell the stub client which post is uploaded next, then prepare it."""
+        client.expect(json_post_content)
+        return media_post.prepare_upload_params(
+            json_post_content=json_post_content, logger=logger
+        )
+
+    # Route the publisher to the stubs, restored once the simulation is done
+    patches = [
+        (media_post, "DATA_DIR", data_dir),
+        (media_post, "upload_album", _stub_upload),
+        (media_post, "upload_reel", _stub_upload),
+        (retry_queue, "CronTab", lambda user=True: StubCronTab()),
+        (retry_posts, "setup_instagrapi", lambda logger, account=None: client),
+        (retry_posts, "prepare_upload_params", prepare_upload_params),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    clock.set_clock(virtual_clock.now)
+
+    # Events are (fire time, sequence, kind, payload)
+    events: List[Tuple[datetime, int, str, Optional[str]]] = []
+    for sequence, job in enumerate(cron.jobs):
+        post_file_path = job.command.split()[-1]
+        heapq.heappush(
+            events, (job.next_run(after=started_at), sequence, "post", post_file_path)
+        )
+
+    sequence = len(events)
+    scheduled_drains = set()
+    processes: List[Tuple[datetime, datetime]] = []
+    drains = 0
+
+    try:
+        while events:
+            fire_at, _, kind, payload = heapq.heappop(events)
+            virtual_clock.set(fire_at + timedelta(seconds=STARTUP_SECONDS))
+
+            # The media_post handlers exit after recording the outcome of a post
+            try:
+                if kind == "post":
+                    json_post_content = posts_by_file[payload]
+                    upload_params = prepare_upload_params(
+                        json_post_content=json_post_content, logger=logger
+                    )
+                    media_post.upload_to_instagram(
+                        client=client,
+                        upload_params=upload_params,
+                        json_post_content=json_post_content,
+                        logger=logger,
+                    )
+                else:
+                    drains += 1
+                    retry_posts.drain_retry_queue(queue_path=queue_path, logger=logger)
+            except SystemExit:
+                pass
+
+            processes.append((fire_at, virtual_clock.now()))
+
+            # Drain the retry queue the way its cron job would, at the next whole minute
+            next_attempt_at = retry_queue.RetryQueue(
+                queue_path=queue_path, logger=logger
+            ).next_attempt_at()
+            if next_attempt_at is not None:
+                drain_at = next_attempt_at.replace(second=0, microsecond=0) + timedelta(
+                    minutes=1
+                )
+                if drain_at not in scheduled_drains:
+                    scheduled_drains.add(drain_at)
+                    sequence += 1
+                    heapq.heappush(events, (drain_at, sequence, "drain", None))
+    finally:
+        clock.set_clock(None)
+        for module, name, value in originals:
+            setattr(module, name, value)
+
+    with open(os.path.join(data_dir, "error.json"), "r") as file:
+        dead_letters = len(json.load(file))
+
+    timeline = []
+    lags = []
+    for attempt in client.attempts:
+        lag = (
+            (attempt["finished_at"] - attempt["requested"]).total_seconds()
+            if attempt["requested"] is not None
+            else None
+        )
+        if attempt["status"] == "published" and lag is not None:
+            lags.append(lag)
+        timeline.append({**attempt, "lag_seconds": lag})
+
+    peak, peak_at = _peak_concurrency(processes)
+
+    return {
+        "posts": len(assignments),
+        "attempts": len(client.attempts),
+        "published": sum(a["status"] == "published" for a in client.attempts),
+        "connection_failures": sum(a["status"] == "failed" for a in client.attempts),
+        "rate_limit_hits": sum(a["status"] == "rate_limited" for a in client.attempts),
+        "dead_letters": dead_letters,
+        "retry_drains": drains,
+        "peak_concurrency": peak,
+        "peak_concurrency_at": peak_at,
+        "lag_seconds": {
+            "mean": sum(lags) / len(lags) if lags else None,
+            "p50": _percentile(lags, 50) if lags else None,
+            "p95": _percentile(lags, 95) if lags else None,
+            "max": max(lags) if lags else None,
+        },
+        "first_fire": processes[0][0] if processes else None,
+        "last_finish": max(end for _, end in processes) if processes else None,
+        "timeline": timeline,
+    }
+
+
+def print_report(report: Dict[str, Any], as_json: bool, show_timeline: bool) -> None:
+    """
+    Print a simulation report.
+
+    Args:
+    - report (Dict[str, Any]): The report returned by `simulate`.
+    - as_json (bool): Print the full report as JSON instead of a summary.
+    - show_timeline (bool): Also print every upload attempt in the summary.
+    """
+    if as_json:
+        print(json.dumps(report, default=str, indent=2))
+        return
+
+    if show_timeline:
+        for attempt in report["timeline"]:
+            print(
+                f"{attempt['started_at']:%Y-%m-%d %H:%M:%S}\t"
+                f"{attempt['account']}\t"
+                f"{attempt['status']}\t"
+                f"lag={attempt['lag_seconds']}s"
+            )
+        print()
+
+    lag = report["lag_seconds"]
+    for key in [
+        "posts",
+        "attempts",
+        "published",
+        "connection_failures",
+        "rate_limit_hits",
+        "dead_letters",
+        "retry_drains",
+        "peak_concurrency",
+        "peak_concurrency_at",
+        "first_fire",
+        "last_finish",
+    ]:
+        print(f"{key:<22}{report[key]}")
+    for key, value in lag.items():
+        print(
+            f"{'lag_' + key + '_seconds':<22}"
+            f"{value if value is None else round(value, 1)}"
+        )
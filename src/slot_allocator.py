@@ -0,0 +1,149 @@
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from accounts import DEFAULT_ACCOUNT, get_account_settings
+from post import Post
+
+# Posts of one account are at least this far apart unless the account says otherwise
+DEFAULT_MIN_GAP_MINUTES = 1
+
+
+def _ceil_to_minute(moment: datetime) -> datetime:
+    """Round a datetime up to the next whole minute, cron has minute resolution."""
+    if moment.second == 0 and moment.microsecond == 0:
+        return moment
+    return moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+
+def _first_free_slot(
+    slot: datetime,
+    occupied: List[datetime],
+    min_gap: timedelta,
+    posts_per_hour: Optional[int],
+) -> datetime:
+    """
+    Find the earliest slot at or after a time that keeps the posting limits with
+    the slots already occupied by the account.
+
+    Args:
+    - slot (datetime): The earliest acceptable slot, on a whole minute.
+    - occupied (List[datetime]): The occupied slots of the account, sorted.
+    - min_gap (timedelta): The minimum gap between two posts.
+    - posts_per_hour (Optional[int]): The maximum number of posts in any 60 minute window.
+
+    Returns:
+    - datetime: The slot.
+    """
+    while True:
+        index = bisect_left(occupied, slot)
+
+        # Both neighbours are at least the gap away
+        if index > 0 and slot - occupied[index - 1] < min_gap:
+            slot = occupied[index - 1] + min_gap
+            continue
+        if index < len(occupied) and occupied[index] - slot < min_gap:
+            slot = occupied[index] + min_gap
+            continue
+
+        if posts_per_hour:
+            # Any posts_per_hour + 1 consecutive slots around it span at least an hour
+            first = max(0, index - posts_per_hour)
+            window = occupied[first:index] + [slot] + occupied[index : index + posts_per_hour]
+            position = index - first
+            bumped = None
+            for start in range(max(0, position - posts_per_hour), position + 1):
+                end = start + posts_per_hour
+                if end < len(window) and window[end] - window[start] < timedelta(hours=1):
+                    # Slots before it push it an hour past the first, later ones a minute at a time
+                    bumped = (
+                        window[start] + timedelta(hours=1)
+                        if start < position
+                        else slot + timedelta(minutes=1)
+                    )
+                    break
+            if bumped is not None:
+                slot = bumped
+                continue
+
+        return slot
+
+
+def allocate_slots(
+    posts: List[Post],
+    accounts: Dict[str, Dict[str, Any]],
+    taken: Optional[Dict[str, List[datetime]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Assign each post the earliest slot at or after its requested time that respects
+    the posting limits of its account, and update `post_date_utc` accordingly.
+
+    Limits are read from the account settings (see `accounts.py`):
+    - "min_gap_minutes": The minimum gap between two posts. Defaults to 1.
+    - "posts_per_hour": The maximum number of posts in any 60 minute window. Defaults to no limit.
+
+    Posts are handled greedily in (requested time, original position) order, so the
+    result is deterministic and a rerun over the same queue gives the same slots.
+    Slots are assigned in increasing order, so each step only looks at the last
+    slots of the account and 100k posts take about a second.
+
+    Args:
+    - posts (List[Post]): The posts to schedule, with `post_date_utc` resolved.
+    - accounts (Dict[str, Dict[str, Any]]): The settings of every account.
+    - taken (Optional[Dict[str, List[datetime]]]): The UTC slots of every account
+      already assigned to posts scheduled earlier, which the new posts keep clear of.
+
+    Returns:
+    - List[Dict[str, Any]]: One entry per post, in the order of `posts`, with the
+      "requested" and "assigned" UTC times and the "shift" applied.
+    """
+    order = sorted(
+        range(len(posts)), key=lambda index: (posts[index].post_date_utc, index)
+    )
+
+    # The slots occupied per account, sorted
+    occupied: Dict[str, List[datetime]] = {
+        account: sorted(slots) for account, slots in (taken or {}).items()
+    }
+    # A slot before the last one assigned to the account was already not free
+    last_slot: Dict[str, datetime] = {}
+    limits: Dict[str, Dict[str, Optional[int]]] = {}
+    assignments: List[Dict[str, Any]] = [{} for _ in posts]
+
+    for index in order:
+        post = posts[index]
+        account = post.account or DEFAULT_ACCOUNT
+
+        if account not in limits:
+            settings = get_account_settings(accounts=accounts, account=post.account)
+            limits[account] = {
+                "min_gap_minutes": settings.get(
+                    "min_gap_minutes", DEFAULT_MIN_GAP_MINUTES
+                ),
+                "posts_per_hour": settings.get("posts_per_hour"),
+            }
+
+        requested = post.post_date_utc
+        slot = _ceil_to_minute(requested)
+        if account in last_slot:
+            slot = max(slot, last_slot[account])
+
+        slots = occupied.setdefault(account, [])
+        slot = _first_free_slot(
+            slot=slot,
+            occupied=slots,
+            min_gap=timedelta(minutes=limits[account]["min_gap_minutes"]),
+            posts_per_hour=limits[account]["posts_per_hour"],
+        )
+        insort(slots, slot)
+
+        last_slot[account] = slot
+        post.post_date_utc = slot
+        assignments[index] = {
+            "account": account,
+            "requested": requested,
+            "assigned": slot,
+            "shift": slot - requested,
+        }
+
+    return assignments
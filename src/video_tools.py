@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import subprocess
+from typing import Any, Dict
+
+VIDEO_EXTENSIONS = {".mp4", ".mov"}
+
+
+def _require_binary(name: str) -> str:
+    """
+    Return the path to an external binary.
+
+    Args:
+    - name (str): The name of the binary.
+
+    Returns:
+    - str: The full path to the binary.
+
+    Raises:
+    - RuntimeError: If the binary is not installed.
+    """
+    path = shutil.which(name)
+    if path is None:
+        raise RuntimeError(f"'{name}' is required for video posts but is not installed")
+    return path
+
+
+def probe_video(video_path: str) -> Dict[str, Any]:
+    """
+    Read the width, height and duration of a video with ffprobe.
+
+    Args:
+    - video_path (str): The path to the video file.
+
+    Returns:
+    - Dict[str, Any]: A dictionary with the "width", "height" and "duration" of the video.
+
+    Raises:
+    - RuntimeError: If ffprobe is missing or fails to read the video.
+    """
+    command = [
+        _require_binary("ffprobe"),
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "stream=width,height:format=duration",
+        "-of",
+        "json",
+        video_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffprobe failed for '{video_path}': {result.stderr.strip()}"
+        )
+
+    probe = json.loads(result.stdout)
+    stream = probe["streams"][0]
+
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "duration": float(probe["format"]["duration"]),
+    }
+
+
+def extract_thumbnail(video_path: str, thumbnail_path: str, at: float = 0.0) -> str:
+    """
+    Extract a single frame of a video into a JPEG thumbnail with ffmpeg.
+
+    Args:
+    - video_path (str): The path to the video file.
+    - thumbnail_path (str): The path to write the thumbnail to.
+    - at (float): The position of the frame in seconds. Defaults to the first frame.
+
+    Returns:
+    - str: The path to the written thumbnail.
+
+    Raises:
+    - RuntimeError: If ffmpeg is missing or fails to extract the frame.
+    """
+    os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+
+    command = [
+        _require_binary("ffmpeg"),
+        "-y",
+        "-v",
+        "error",
+        "-ss",
+        str(at),
+        "-i",
+        video_path,
+        "-frames:v",
+        "1",
+        "-q:v",
+        "2",
+        thumbnail_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0 or not os.path.isfile(thumbnail_path):
+        raise RuntimeError(
+            f"ffmpeg failed to extract a thumbnail from '{video_path}': {result.stderr.strip()}"
+        )
+
+    return thumbnail_path
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from instagrapi import Client, config
+from instagrapi.extractors import extract_media_v1
+from instagrapi.types import Media
+from instagrapi.utils import date_time_original
+
+from album_upload import TRANSCODE_NOT_FINISHED
+
+# Size of each upload request, the acknowledged offset is persisted after every chunk
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of configure attempts while Instagram finishes processing the video
+CONFIGURE_ATTEMPTS = 20
+CONFIGURE_TIMEOUT = 10
+
+
+def get_upload_state_path(video_path: str, state_dir: str) -> str:
+    """
+    Get the path of the file tracking the resumable upload of a video.
+
+    The name is derived from the video path, size and modification time, so a
+    changed file starts a fresh upload.
+
+    Args:
+    - video_path (str): The path to the video file.
+    - state_dir (str): The directory holding the upload state files.
+
+    Returns:
+    - str: The path to the upload state file.
+    """
+    stat = os.stat(video_path)
+    fingerprint = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+    return os.path.join(state_dir, f"video_upload_{digest}.json")
+
+
+def load_upload_state(state_path: str) -> Dict[str, Any]:
+    """
+    Load the resumable upload state of a video, creating a new one if needed.
+
+    Args:
+    - state_path (str): The path to the upload state file.
+
+    Returns:
+    - Dict[str, Any]: The upload id, upload name, waterfall id and acknowledged offset.
+    """
+    if os.path.exists(state_path):
+        try:
+            with open(state_path, "r") as state_file:
+                return json.load(state_file)
+        except (IOError, json.JSONDecodeError):
+            pass
+
+    upload_id = str(int(time.time() * 1000))
+    return {
+        "upload_id": upload_id,
+        "upload_name": f"{upload_id}_0_{random.randint(1000000000, 9999999999)}",
+        "waterfall_id": str(uuid.uuid4()),
+        "offset": 0,
+    }
+
+
+def save_upload_state(state_path: str, state: Dict[str, Any]) -> None:
+    """
+    Atomically persist the resumable upload state of a video.
+
+    Args:
+    - state_path (str): The path to the upload state file.
+    - state (Dict[str, Any]): The upload state to persist.
+    """
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    temp_path = f"{state_path}.tmp"
+    with open(temp_path, "w") as state_file:
+        json.dump(state, state_file)
+    os.replace(temp_path, state_path)
+
+
+def rupload_video_resumable(
+    client: Client,
+    video_path: str,
+    video_info: Dict[str, Any],
+    state_dir: str,
+    logger: logging.Logger,
+) -> str:
+    """
+    Upload a video in chunks, resuming from the last offset acknowledged by Instagram.
+
+    The file is memory-mapped and sent one `CHUNK_SIZE` slice at a time, so it is
+    never loaded fully into memory.
+
+    Args:
+    - client (Client): The Instagram client used for uploading media.
+    - video_path (str): The path to the video file.
+    - video_info (Dict[str, Any]): The "width", "height" and "duration" of the video.
+    - state_dir (str): The directory holding the upload state files.
+    - logger (logging.Logger): The logger instance to use for logging.
+
+    Returns:
+    - str: The upload id of the video.
+
+    Raises:
+    - ValueError: If the video file is empty.
+    - RuntimeError: If Instagram rejects the upload.
+    """
+    total_size = os.path.getsize(video_path)
+    if total_size == 0:
+        # An empty file cannot be memory-mapped, and there is nothing to upload
+        raise ValueError(f"'{video_path}' is empty")
+
+    state_path = get_upload_state_path(video_path=video_path, state_dir=state_dir)
+    state = load_upload_state(state_path=state_path)
+    save_upload_state(state_path=state_path, state=state)
+
+    rupload_params = {
+        "retry_context": json.dumps(
+            {"num_step_auto_retry": 0, "num_reupload": 0, "num_step_manual_retry": 0}
+        ),
+        "media_type": "2",
+        "xsharing_user_ids": json.dumps([client.user_id]),
+        "upload_id": state["upload_id"],
+        "upload_media_duration_ms": str(int(video_info["duration"] * 1000)),
+        "upload_media_width": str(video_info["width"]),
+        "upload_media_height": str(video_info["height"]),
+        "is_clips_video": "1",
+    }
+    headers = {
+        "Accept-Encoding": "gzip, deflate",
+        "X-Instagram-Rupload-Params": json.dumps(rupload_params),
+        "X_FB_VIDEO_WATERFALL_ID": state["waterfall_id"],
+        "X-Entity-Type": "video/mp4",
+    }
+    url = f"https://{config.API_DOMAIN}/rupload_igvideo/{state['upload_name']}"
+
+    # Ask Instagram how much of the file it already has
+    response = client.private.get(url, headers=headers)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to start the video upload: {response.text}")
+    offset = int(response.json().get("offset", 0) or 0)
+
+    if offset:
+        logger.info(f"Resuming upload of '{video_path}' at byte {offset}/{total_size}")
+
+    with open(video_path, "rb") as video_file, mmap.mmap(
+        video_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as video_data:
+        while offset < total_size:
+            chunk = video_data[offset : offset + CHUNK_SIZE]
+            chunk_headers = {
+                **headers,
+                "Offset": str(offset),
+                "X-Entity-Name": state["upload_name"],
+                "X-Entity-Length": str(total_size),
+                "Content-Type": "application/octet-stream",
+                "Content-Length": str(len(chunk)),
+            }
+            response = client.private.post(url, data=chunk, headers=chunk_headers)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"Video upload failed at byte {offset}/{total_size}: {response.text}"
+                )
+
+            offset += len(chunk)
+            state["offset"] = offset
+            save_upload_state(state_path=state_path, state=state)
+
+    logger.info(f"Uploaded {total_size} bytes of '{video_path}'")
+    return state["upload_id"]
+
+
+def configure_reel(
+    client: Client,
+    upload_id: str,
+    video_info: Dict[str, Any],
+    caption: str,
+    extra_data: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Configure an uploaded reel, the request of `Client.clip_configure` without
+    uploading its thumbnail again on every attempt.
+
+    Args:
+    - client (Client): The Instagram client used for uploading media.
+    - upload_id (str): The upload id of the video and its thumbnail.
+    - video_info (Dict[str, Any]): The "width", "height" and "duration" of the video.
+    - caption (str): The caption for the reel.
+    - extra_data (Optional[Dict[str, Any]]): Additional data for the post.
+
+    Returns:
+    - Dict[str, Any]: The response of the configure request.
+    """
+    data = {
+        "filter_type": "0",
+        "timezone_offset": str(client.timezone_offset),
+        "media_folder": "ScreenRecorder",
+        "location": client.location_build(None),
+        "source_type": "4",
+        "caption": caption,
+        "usertags": json.dumps({"in": []}),
+        "date_time_original": date_time_original(time.localtime()),
+        "clips_share_preview_to_feed": "1",
+        "upload_id": upload_id,
+        "device": client.device,
+        "length": video_info["duration"],
+        "clips": [{"length": video_info["duration"], "source_type": "4"}],
+        "extra": {
+            "source_width": video_info["width"],
+            "source_height": video_info["height"],
+        },
+        "audio_muted": False,
+        "poster_frame_index": 70,
+        **(extra_data or {}),
+    }
+    return client.private_request(
+        "media/configure_to_clips/?video=1",
+        client.with_default_data(data),
+        with_signature=True,
+    )
+
+
+def upload_reel(
+    client: Client,
+    video_path: str,
+    thumbnail_path: str,
+    video_info: Dict[str, Any],
+    caption: str,
+    state_dir: str,
+    logger: logging.Logger,
+    extra_data: Optional[Dict[str, Any]] = None,
+) -> Media:
+    """
+    Upload a video as a reel using a resumable upload and configure it.
+
+    Args:
+    - client (Client): The Instagram client used for uploading media.
+    - video_path (str): The path to the video file.
+    - thumbnail_path (str): The path to the thumbnail extracted at schedule time.
+    - video_info (Dict[str, Any]): The "width", "height" and "duration" of the video.
+    - caption (str): The caption for the reel.
+    - state_dir (str): The directory holding the upload state files.
+    - logger (logging.Logger): The logger instance to use for logging.
+    - extra_data (Optional[Dict[str, Any]]): Additional data for the post.
+
+    Returns:
+    - Media: The configured reel.
+
+    Raises:
+    - RuntimeError: If the upload fails or the video is still processing after every attempt.
+    - Exception: Any other configure error, for the caller to classify.
+    """
+    upload_id = rupload_video_resumable(
+        client=client,
+        video_path=video_path,
+        video_info=video_info,
+        state_dir=state_dir,
+        logger=logger,
+    )
+
+    # The cover goes under the upload id of the video, once for all the attempts
+    client.photo_rupload(Path(thumbnail_path), upload_id)
+
+    for attempt in range(CONFIGURE_ATTEMPTS):
+        time.sleep(CONFIGURE_TIMEOUT)
+        try:
+            configured = configure_reel(
+                client=client,
+                upload_id=upload_id,
+                video_info=video_info,
+                caption=caption,
+                extra_data=extra_data,
+            )
+        except Exception as e:
+            # Only a video still being processed is worth another attempt,
+            # anything else goes to the caller to be classified
+            if TRANSCODE_NOT_FINISHED not in str(e):
+                raise
+            logger.warning(f"Reel configure attempt {attempt} failed: {e}")
+            continue
+
+        if configured:
+            # The upload is complete, a new attempt must not resume it
+            os.remove(get_upload_state_path(video_path=video_path, state_dir=state_dir))
+            return extract_media_v1(client.last_json.get("media"))
+
+    raise RuntimeError(
+        f"Failed to configure the reel after {CONFIGURE_ATTEMPTS} attempts"
+    )
@@ -0,0 +1,379 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    post_id TEXT PRIMARY KEY,
+    post TEXT NOT NULL,
+    due_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_token INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    media_id TEXT,
+    last_error TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS posts_by_status ON posts (status, due_at);
+"""
+
+# Statuses of a post in the work queue:
+# - pending: waiting for its due time, or for another attempt
+# - claimed: leased by a worker that has not started the upload yet
+# - publishing: the upload started, the post is never handed out again
+# - in_doubt: the worker died while publishing, the post may or may not be live
+# - published / error: done, also recorded by `handle_post_update`
+STATUSES = ["pending", "claimed", "publishing", "in_doubt", "published", "error"]
+
+
+def post_id_for(post: Dict[str, Any]) -> str:
+    """
+    Derive the id of a post from its content, so scheduling it twice queues it once.
+
+    Args:
+    - post (Dict[str, Any]): The content of the post.
+
+    Returns:
+    - str: The hex digest identifying the post.
+    """
+    payload = json.dumps(post, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class WorkQueue(ABC):
+    """
+    A queue of scheduled posts shared by several publisher hosts.
+
+    Workers claim due posts with time limited leases. Every claim gets a new
+    lease token, and every later transition must present it, so a worker whose
+    lease was taken over cannot act on the post any more. A claim whose lease
+    expires before the upload started is handed out again. Once a worker marks
+    a post as publishing it is never handed out again: if that worker dies, the
+    post becomes in doubt and waits for someone to check Instagram. This is what
+    guarantees that a post is published at most once.
+    """
+
+    @abstractmethod
+    def enqueue(self, post_id: str, post: Dict[str, Any], due_at: datetime) -> bool:
+        """
+        Add a post, unless a post with the same id is already queued.
+
+        Args:
+        - post_id (str): The id of the post, derived from its content.
+        - post (Dict[str, Any]): The content of the post.
+        - due_at (datetime): The aware time to publish the post at.
+
+        Returns:
+        - bool: True if the post was added, False if it was already queued.
+        """
+
+    @abstractmethod
+    def claim(
+        self, worker: str, now: datetime, lease_seconds: float, limit: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        Lease due posts, and posts whose claim expired, to a worker.
+
+        Args:
+        - worker (str): The id of the worker.
+        - now (datetime): The aware current time.
+        - lease_seconds (float): How long the lease lasts.
+        - limit (int): The maximum number of posts to claim.
+
+        Returns:
+        - List[Dict[str, Any]]: The claimed posts, with "post_id", "post", "lease_token" and "attempts".
+        """
+
+    @abstractmethod
+    def expire_publishing(self, now: datetime) -> List[Dict[str, Any]]:
+        """
+        Mark the posts whose worker died while publishing them as in doubt.
+
+        Args:
+        - now (datetime): The aware current time.
+
+        Returns:
+        - List[Dict[str, Any]]: The posts that became in doubt.
+        """
+
+    @abstractmethod
+    def renew(
+        self, post_id: str, lease_token: int, now: datetime, lease_seconds: float
+    ) -> bool:
+        """
+        Extend a lease.
+
+        Returns:
+        - bool: False if the lease was lost.
+        """
+
+    @abstractmethod
+    def begin_publish(
+        self, post_id: str, lease_token: int, now: datetime, lease_seconds: float
+    ) -> bool:
+        """
+        Mark a claimed post as publishing, right before its upload starts.
+
+        Returns:
+        - bool: False if the lease was lost or expired, the post must not be uploaded then.
+        """
+
+    @abstractmethod
+    def complete(
+        self,
+        post_id: str,
+        lease_token: int,
+        status: str,
+        now: datetime,
+        media_id: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        """
+        Record the final outcome of a post, "published" or "error".
+
+        Returns:
+        - bool: False if the post was claimed by another worker in the meantime.
+        """
+
+    @abstractmethod
+    def release(
+        self,
+        post_id: str,
+        lease_token: int,
+        due_at: datetime,
+        now: datetime,
+        error: Optional[str] = None,
+        failed_attempt: bool = True,
+    ) -> bool:
+        """
+        Give a claimed or publishing post back for another attempt at `due_at`.
+
+        Returns:
+        - bool: False if the post was claimed by another worker in the meantime.
+        """
+
+    @abstractmethod
+    def resolve(self, post_id: str, status: str, now: datetime) -> bool:
+        """
+        Settle a post in doubt: "published" if it is live, "pending" to publish it again.
+
+        Returns:
+        - bool: False if the post is not in doubt.
+        """
+
+    @abstractmethod
+    def withdraw(self, post_id: str) -> bool:
+        """
+        Remove a post that no worker claimed yet, e.g. one removed from 'to-post'.
+
+        Returns:
+        - bool: False if the post is not pending any more.
+        """
+
+    @abstractmethod
+    def list_posts(self, status: str) -> List[Dict[str, Any]]:
+        """
+        List the posts with a status, by due time.
+
+        Args:
+        - status (str): The status of the posts.
+
+        Returns:
+        - List[Dict[str, Any]]: The posts.
+        """
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    A work queue in a SQLite database, on storage shared by the publisher hosts
+    (or on local disk for a single host).
+
+    Every transition is one `BEGIN IMMEDIATE` transaction, so concurrent workers
+    are serialized by the database lock. The rollback journal is kept, as WAL
+    does not work on network file systems.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30.0):
+        self.db_path = db_path
+        # Shared with the lease renewal thread, every use holds the lock
+        self.connection = sqlite3.connect(
+            db_path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run an immediate transaction, taking the write lock up front."""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def _update(self, query: str, parameters: tuple) -> bool:
+        """Run a single guarded update and tell whether it matched a post."""
+        with self._transaction() as connection:
+            return connection.execute(query, parameters).rowcount == 1
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        """Turn a row into a dict, with the post content decoded."""
+        entry = dict(row)
+        entry["post"] = json.loads(entry["post"])
+        return entry
+
+    def enqueue(self, post_id: str, post: Dict[str, Any], due_at: datetime) -> bool:
+        return self._update(
+            "INSERT OR IGNORE INTO posts (post_id, post, due_at, updated_at) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                post_id,
+                json.dumps(post, default=str),
+                due_at.timestamp(),
+                due_at.timestamp(),
+            ),
+        )
+
+    def claim(
+        self, worker: str, now: datetime, lease_seconds: float, limit: int = 1
+    ) -> List[Dict[str, Any]]:
+        timestamp = now.timestamp()
+        claims = []
+
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT * FROM posts WHERE (status = 'pending' AND due_at <= ?) "
+                "OR (status = 'claimed' AND lease_until <= ?) "
+                "ORDER BY due_at LIMIT ?",
+                (timestamp, timestamp, limit),
+            ).fetchall()
+
+            for row in rows:
+                connection.execute(
+                    "UPDATE posts SET status = 'claimed', worker = ?, "
+                    "lease_token = lease_token + 1, lease_until = ?, updated_at = ? "
+                    "WHERE post_id = ?",
+                    (worker, timestamp + lease_seconds, timestamp, row["post_id"]),
+                )
+                claim = self._to_dict(row)
+                claim["lease_token"] += 1
+                claims.append(claim)
+
+        return claims
+
+    def expire_publishing(self, now: datetime) -> List[Dict[str, Any]]:
+        timestamp = now.timestamp()
+
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT * FROM posts WHERE status = 'publishing' AND lease_until <= ?",
+                (timestamp,),
+            ).fetchall()
+            connection.execute(
+                "UPDATE posts SET status = 'in_doubt', updated_at = ? "
+                "WHERE status = 'publishing' AND lease_until <= ?",
+                (timestamp, timestamp),
+            )
+
+        return [self._to_dict(row) for row in rows]
+
+    def renew(
+        self, post_id: str, lease_token: int, now: datetime, lease_seconds: float
+    ) -> bool:
+        return self._update(
+            "UPDATE posts SET lease_until = ?, updated_at = ? WHERE post_id = ? "
+            "AND lease_token = ? AND status IN ('claimed', 'publishing')",
+            (now.timestamp() + lease_seconds, now.timestamp(), post_id, lease_token),
+        )
+
+    def begin_publish(
+        self, post_id: str, lease_token: int, now: datetime, lease_seconds: float
+    ) -> bool:
+        return self._update(
+            "UPDATE posts SET status = 'publishing', lease_until = ?, updated_at = ? "
+            "WHERE post_id = ? AND lease_token = ? AND status = 'claimed' "
+            "AND lease_until > ?",
+            (
+                now.timestamp() + lease_seconds,
+                now.timestamp(),
+                post_id,
+                lease_token,
+                now.timestamp(),
+            ),
+        )
+
+    def complete(
+        self,
+        post_id: str,
+        lease_token: int,
+        status: str,
+        now: datetime,
+        media_id: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> bool:
+        # A post that went in doubt while its worker was still uploading is settled too
+        return self._update(
+            "UPDATE posts SET status = ?, media_id = ?, last_error = ?, "
+            "lease_until = NULL, updated_at = ? WHERE post_id = ? AND lease_token = ? "
+            "AND status IN ('claimed', 'publishing', 'in_doubt')",
+            (status, media_id, error, now.timestamp(), post_id, lease_token),
+        )
+
+    def release(
+        self,
+        post_id: str,
+        lease_token: int,
+        due_at: datetime,
+        now: datetime,
+        error: Optional[str] = None,
+        failed_attempt: bool = True,
+    ) -> bool:
+        return self._update(
+            "UPDATE posts SET status = 'pending', due_at = ?, last_error = ?, "
+            "attempts = attempts + ?, lease_until = NULL, updated_at = ? "
+            "WHERE post_id = ? AND lease_token = ? "
+            "AND status IN ('claimed', 'publishing', 'in_doubt')",
+            (
+                due_at.timestamp(),
+                error,
+                1 if failed_attempt else 0,
+                now.timestamp(),
+                post_id,
+                lease_token,
+            ),
+        )
+
+    def resolve(self, post_id: str, status: str, now: datetime) -> bool:
+        return self._update(
+            "UPDATE posts SET status = ?, updated_at = ? "
+            "WHERE post_id = ? AND status = 'in_doubt'",
+            (status, now.timestamp(), post_id),
+        )
+
+    def withdraw(self, post_id: str) -> bool:
+        return self._update(
+            "DELETE FROM posts WHERE post_id = ? AND status = 'pending'", (post_id,)
+        )
+
+    def list_posts(self, status: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT * FROM posts WHERE status = ? ORDER BY due_at", (status,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
@@ -0,0 +1,375 @@
+import argparse
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import clock
+from logger_config import get_logger
+from media_post import (
+    find_post_problem,
+    handle_post_update,
+    is_already_published,
+    prepare_upload_params,
+    publish_media,
+)
+from retry_queue import MAX_ATTEMPTS, classify_error, compute_backoff
+from setup import setup_instagrapi
+from work_queue import SQLiteWorkQueue, WorkQueue
+
+# How long a claim lasts without renewal, a crashed worker's claims are free after that
+LEASE_SECONDS = 600
+
+# How long an idle worker waits before looking for due posts again
+POLL_SECONDS = 30
+
+
+def get_worker_id() -> str:
+    """Identify this worker by host and process."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseKeeper:
+    """
+    Renew a lease in the background while a post is being uploaded, so a slow
+    upload is not mistaken for a dead worker.
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        post_id: str,
+        lease_token: int,
+        lease_seconds: float,
+        logger: logging.Logger,
+    ):
+        self.queue = queue
+        self.post_id = post_id
+        self.lease_token = lease_token
+        self.lease_seconds = lease_seconds
+        self.logger = logger
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.lease_seconds / 3):
+            if not self.queue.renew(
+                post_id=self.post_id,
+                lease_token=self.lease_token,
+                now=clock.now(),
+                lease_seconds=self.lease_seconds,
+            ):
+                self.logger.warning(f"Lost the lease of post {self.post_id}")
+                return
+
+    def __enter__(self) -> "LeaseKeeper":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+
+def record_post_update(
+    success: bool,
+    json_post_content: Dict[str, Any],
+    logger: logging.Logger,
+    error: Optional[Dict[str, Any]] = None,
+    published: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Record the outcome in the post files, without exiting the worker on failure."""
+    try:
+        handle_post_update(
+            success=success,
+            json_post_content=json_post_content,
+            logger=logger,
+            error=error,
+            published=published,
+        )
+    except SystemExit:
+        logger.error("Failed to record the outcome of the post in the post files")
+
+
+def process_claim(
+    queue: WorkQueue,
+    claim: Dict[str, Any],
+    lease_seconds: float,
+    logger: logging.Logger,
+) -> str:
+    """
+    Publish a claimed post, and record the outcome in the queue and the post files.
+
+    The upload only starts once the post is marked as publishing under a lease
+    that is still held, and a post is checked against the success file first,
+    so it is never uploaded twice.
+
+    Args:
+    - queue (WorkQueue): The shared work queue.
+    - claim (Dict[str, Any]): The claimed post, as returned by `WorkQueue.claim`.
+    - lease_seconds (float): How long a lease lasts.
+    - logger (logging.Logger): The logger instance to use.
+
+    Returns:
+    - str: The outcome: "published", "error", "retrying", "skipped" or "lost".
+    """
+    post_id, lease_token = claim["post_id"], claim["lease_token"]
+    json_post_content = claim["post"]
+
+    problem = find_post_problem(json_post_content=json_post_content)
+    if problem is not None:
+        logger.error(f"Post {post_id} cannot be published: {problem}")
+        record_post_update(
+            success=False,
+            json_post_content=json_post_content,
+            logger=logger,
+            error={"type": "InvalidPost", "message": problem},
+        )
+        queue.complete(
+            post_id=post_id,
+            lease_token=lease_token,
+            status="error",
+            now=clock.now(),
+            error=problem,
+        )
+        return "error"
+
+    if is_already_published(json_post_content=json_post_content, post_id=post_id):
+        logger.warning(f"Post {post_id} is already in the success file, not publishing it")
+        queue.complete(
+            post_id=post_id, lease_token=lease_token, status="published", now=clock.now()
+        )
+        return "skipped"
+
+    try:
+        client = setup_instagrapi(
+            logger=logger, account=json_post_content.get("account")
+        )
+        upload_params = prepare_upload_params(
+            json_post_content=json_post_content, logger=logger
+        )
+    except SystemExit:
+        # Not the post's fault, so it keeps its attempts
+        queue.release(
+            post_id=post_id,
+            lease_token=lease_token,
+            due_at=clock.now() + compute_backoff(claim["attempts"] + 1),
+            now=clock.now(),
+            error="Could not set up the upload",
+            failed_attempt=False,
+        )
+        return "retrying"
+
+    if not queue.begin_publish(
+        post_id=post_id,
+        lease_token=lease_token,
+        now=clock.now(),
+        lease_seconds=lease_seconds,
+    ):
+        logger.warning(f"Lost the lease of post {post_id} before publishing it")
+        return "lost"
+
+    try:
+        with LeaseKeeper(
+            queue=queue,
+            post_id=post_id,
+            lease_token=lease_token,
+            lease_seconds=lease_seconds,
+            logger=logger,
+        ):
+            published = publish_media(
+                client=client, upload_params=upload_params, logger=logger
+            )
+    except Exception as e:
+        attempts = claim["attempts"] + 1
+        classification = classify_error(e)
+
+        if classification == "retryable" and attempts < MAX_ATTEMPTS:
+            next_attempt_at = clock.now() + compute_backoff(attempts)
+            logger.warning(
+                f"Failed to upload post {post_id} (attempt {attempts}), retrying at {next_attempt_at}: {e}"
+            )
+            queue.release(
+                post_id=post_id,
+                lease_token=lease_token,
+                due_at=next_attempt_at,
+                now=clock.now(),
+                error=str(e),
+            )
+            return "retrying"
+
+        logger.error(f"Failed to upload post {post_id}: {e}")
+        record_post_update(
+            success=False,
+            json_post_content=json_post_content,
+            logger=logger,
+            error={
+                "type": type(e).__name__,
+                "message": str(e),
+                "classification": classification,
+                "attempts": attempts,
+            },
+        )
+        queue.complete(
+            post_id=post_id,
+            lease_token=lease_token,
+            status="error",
+            now=clock.now(),
+            error=str(e),
+        )
+        return "error"
+
+    # The queue is the record every host reads, so it is settled first
+    queue.complete(
+        post_id=post_id,
+        lease_token=lease_token,
+        status="published",
+        now=clock.now(),
+        media_id=published["media_id"],
+    )
+    # The work queue id is what the success record is matched on later
+    record_post_update(
+        success=True,
+        json_post_content=json_post_content,
+        logger=logger,
+        published={**published, "post_id": post_id},
+    )
+    return "published"
+
+
+def settle_expired_publishing(queue: WorkQueue, logger: logging.Logger) -> None:
+    """
+    Move the posts of workers that died while publishing out of the way: posts
+    found in the success file are settled, the others wait in doubt.
+
+    Args:
+    - queue (WorkQueue): The shared work queue.
+    - logger (logging.Logger): The logger instance to use.
+    """
+    for entry in queue.expire_publishing(now=clock.now()):
+        if is_already_published(
+            json_post_content=entry["post"], post_id=entry["post_id"]
+        ):
+            queue.resolve(post_id=entry["post_id"], status="published", now=clock.now())
+            logger.info(f"Post {entry['post_id']} of a dead worker was published")
+        else:
+            logger.error(
+                f"Worker {entry['worker']} died while publishing post {entry['post_id']}, "
+                "check Instagram and settle it with --resolve"
+            )
+
+
+def run_worker(
+    queue: WorkQueue,
+    logger: logging.Logger,
+    lease_seconds: float = LEASE_SECONDS,
+    poll_seconds: float = POLL_SECONDS,
+    once: bool = False,
+) -> None:
+    """
+    Claim and publish due posts one at a time, until stopped or, with `once`,
+    until no post is due.
+
+    Args:
+    - queue (WorkQueue): The shared work queue.
+    - logger (logging.Logger): The logger instance to use.
+    - lease_seconds (float): How long a lease lasts.
+    - poll_seconds (float): How long to wait when no post is due.
+    - once (bool): Exit once no post is due, to run the worker from cron.
+    """
+    worker = get_worker_id()
+    logger.info(f"Worker {worker} started")
+
+    while True:
+        settle_expired_publishing(queue=queue, logger=logger)
+
+        claims = queue.claim(
+            worker=worker, now=clock.now(), lease_seconds=lease_seconds
+        )
+        for claim in claims:
+            outcome = process_claim(
+                queue=queue, claim=claim, lease_seconds=lease_seconds, logger=logger
+            )
+            logger.info(f"Post {claim['post_id']}: {outcome}")
+
+        if not claims:
+            if once:
+                return
+            time.sleep(poll_seconds)
+
+
+def main() -> None:
+    """
+    Run a publisher worker on a shared work queue, or inspect and settle the
+    posts in doubt.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    log_path = os.path.join(current_dir, "..", "logs", "post-activity.log")
+    default_queue_path = os.environ.get(
+        "WORK_QUEUE_PATH",
+        os.path.join(current_dir, "..", "data", "work-queue.sqlite3"),
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Publish posts from a work queue shared by several hosts."
+    )
+    parser.add_argument("queue_path", nargs="?", default=default_queue_path)
+    parser.add_argument(
+        "--lease", type=float, default=LEASE_SECONDS, help="Lease length in seconds."
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=POLL_SECONDS,
+        help="Seconds to wait when no post is due.",
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="Exit once no post is due."
+    )
+    parser.add_argument(
+        "--in-doubt",
+        action="store_true",
+        help="Print the posts whose worker died while publishing them and exit.",
+    )
+    parser.add_argument(
+        "--resolve",
+        nargs=2,
+        metavar=("POST_ID", "STATUS"),
+        help="Settle a post in doubt as 'published', or 'pending' to publish it again.",
+    )
+    args = parser.parse_args()
+
+    queue = SQLiteWorkQueue(db_path=args.queue_path)
+
+    if args.in_doubt:
+        for entry in queue.list_posts(status="in_doubt"):
+            post = entry["post"]
+            print(
+                f"{entry['post_id']}\t{post.get('post_date')}\t{entry['worker']}\t"
+                f"{post.get('image_path') or post.get('video_path')}"
+            )
+        return
+
+    logger = get_logger(log_file=log_path)
+
+    if args.resolve:
+        post_id, status = args.resolve
+        if status not in ("published", "pending") or not queue.resolve(
+            post_id=post_id, status=status, now=clock.now()
+        ):
+            logger.error(f"Could not settle post {post_id} as '{status}'")
+        return
+
+    run_worker(
+        queue=queue,
+        logger=logger,
+        lease_seconds=args.lease,
+        poll_seconds=args.poll,
+        once=args.once,
+    )
+
+
+if __name__ == "__main__":
+    main()
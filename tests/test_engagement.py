@@ -0,0 +1,150 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from dateutil import tz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import clock  # noqa: E402
+import media_post  # noqa: E402
+import post_list  # noqa: E402
+from engagement import EngagementModel  # noqa: E402
+
+# A Sunday, so the coming week starts on Monday 2024-07-01
+NOW = datetime(2024, 6, 30, 12, 0, tzinfo=tz.UTC)
+
+ACCOUNTS = {"a": {"timezone": "UTC"}, "b": {"timezone": "UTC"}}
+
+
+class FakeClient:
+    """Returns the same engagement for every media, counting the lookups."""
+
+    def __init__(self, like_count: int = 10, comment_count: int = 1):
+        self.like_count = like_count
+        self.comment_count = comment_count
+        self.lookups = []
+
+    def media_info(self, media_pk: str) -> SimpleNamespace:
+        self.lookups.append(media_pk)
+        return SimpleNamespace(
+            like_count=self.like_count, comment_count=self.comment_count
+        )
+
+
+def failed_login(account):
+    """Fail like `setup_instagrapi` does when the account cannot log in."""
+    sys.exit(1)
+
+
+class EngagementModelTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.success_path = os.path.join(self.data_dir.name, "success.json")
+        self.model_path = os.path.join(self.data_dir.name, "engagement-model.json")
+        self.logger = logging.getLogger("test")
+        self.client = FakeClient()
+        media_post.write_post_file(self.success_path, [], self.logger)
+
+    def tearDown(self) -> None:
+        clock.set_clock(None)
+        self.data_dir.cleanup()
+
+    def record(self, media_pk: int, account: str = "a", days_ago: int = 3) -> dict:
+        return {
+            "image_path": f"{media_pk}.jpg",
+            "description": f"post {media_pk}",
+            "post_date": "2024-06-25 18:00",
+            "account": account,
+            "media_pk": str(media_pk),
+            "published_at": (NOW - timedelta(days=days_ago)).isoformat(),
+        }
+
+    def publish(self, *records: dict) -> None:
+        for record in records:
+            media_post.append_post_record(self.success_path, record, self.logger)
+
+    def update(self, get_client=None) -> int:
+        model = EngagementModel(model_path=self.model_path, logger=self.logger)
+        return model.update_from_history(
+            success_path=self.success_path,
+            accounts=ACCOUNTS,
+            get_client=get_client or (lambda account: self.client),
+            now=NOW,
+        )
+
+    def test_unchanged_history_is_not_fetched_again(self) -> None:
+        self.publish(self.record(1), self.record(2))
+
+        self.assertEqual(self.update(), 2)
+        self.assertEqual(self.update(), 0)
+        self.assertEqual(self.client.lookups, ["1", "2"])
+
+        self.publish(self.record(3))
+
+        self.assertEqual(self.update(), 1)
+        self.assertEqual(self.client.lookups, ["1", "2", "3"])
+
+    def test_young_posts_wait_for_a_later_update(self) -> None:
+        self.publish(self.record(1), self.record(2, days_ago=0))
+
+        self.assertEqual(self.update(), 1)
+        self.assertEqual(self.update(), 0)
+        self.assertEqual(self.client.lookups, ["1"])
+
+    def test_rewritten_history_rebuilds_the_model(self) -> None:
+        self.publish(self.record(1), self.record(2))
+        self.update()
+
+        media_post.write_post_file(self.success_path, [self.record(3)], self.logger)
+
+        self.assertEqual(self.update(), 1)
+        self.assertEqual(self.client.lookups, ["1", "2", "3"])
+        model = EngagementModel(model_path=self.model_path, logger=self.logger)
+        self.assertEqual(model.slots, {"a": {"3-12": [1, 12.0]}})
+
+    def test_failed_login_keeps_the_progress(self) -> None:
+        self.publish(self.record(1), self.record(2, account="b"), self.record(3))
+
+        self.assertEqual(
+            self.update(
+                get_client=lambda account: self.client
+                if account == "a"
+                else failed_login(account)
+            ),
+            1,
+        )
+
+        # The post of the account that could not log in is read again
+        self.assertEqual(self.update(), 2)
+        self.assertEqual(self.client.lookups, ["1", "2", "3"])
+
+    def test_auto_posts_take_the_best_slots_first(self) -> None:
+        model = EngagementModel(model_path=self.model_path, logger=self.logger)
+        model.add(account="a", weekday=1, hour=9, score=50.0)
+        model.add(account="a", weekday=0, hour=18, score=100.0)
+        model.save()
+        clock.set_clock(lambda: NOW)
+
+        with mock.patch.object(post_list, "get_logger", return_value=self.logger):
+            posts = post_list.PostList(
+                log_path=os.path.join(self.data_dir.name, "post.log"),
+                engagement_model_path=self.model_path,
+            )
+        slots = [posts.resolve_auto_post_date("a", "UTC") for _ in range(3)]
+        new_account_slot = posts.resolve_auto_post_date("b", "UTC")
+
+        # Hours without history come last, in time order
+        self.assertEqual(
+            slots, ["2024-07-01 18:00", "2024-07-02 09:00", "2024-06-30 13:00"]
+        )
+        self.assertEqual(new_account_slot, "2024-06-30 13:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+from dateutil import tz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import hot_reload  # noqa: E402
+
+
+def post(index: int) -> dict:
+    return {
+        "image_path": f"{index}.jpg",
+        "description": f"post {index}",
+        "post_date": f"2024-07-01 10:{index:02d}",
+    }
+
+
+class ToPostTrackerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.to_post_path = os.path.join(self.data_dir.name, "to-post.json")
+        self.state_path = os.path.join(self.data_dir.name, "watch-state.json")
+        self.logger = logging.getLogger("test")
+
+    def tearDown(self) -> None:
+        self.data_dir.cleanup()
+
+    def tracker(self) -> hot_reload.ToPostTracker:
+        return hot_reload.ToPostTracker(
+            to_post_path=self.to_post_path,
+            state_path=self.state_path,
+            logger=self.logger,
+        )
+
+    def write(self, *posts: dict) -> None:
+        hot_reload.write_to_post_file(to_post_path=self.to_post_path, posts=list(posts))
+
+    def test_only_changed_entries_are_reported(self) -> None:
+        tracker = self.tracker()
+        self.write(post(1), post(2))
+
+        added, removed = tracker.read_changes()
+        self.assertEqual([entry for _, entry in added], [post(1), post(2)])
+        self.assertEqual(removed, [])
+        self.assertEqual(tracker.read_changes(), ([], []))
+
+        edited = {**post(2), "description": "edited"}
+        self.write(post(1), edited, post(3))
+
+        added, removed = tracker.read_changes()
+        self.assertEqual([entry for _, entry in added], [edited, post(3)])
+        self.assertEqual(removed, [hot_reload.entry_key(post(2))])
+
+    def test_duplicate_entries_are_counted(self) -> None:
+        tracker = self.tracker()
+        self.write(post(1), post(1))
+        self.assertEqual(len(tracker.read_changes()[0]), 2)
+
+        self.write(post(1))
+
+        self.assertEqual(tracker.read_changes(), ([], [hot_reload.entry_key(post(1))]))
+
+    def test_changes_made_while_stopped_are_picked_up(self) -> None:
+        tracker = self.tracker()
+        self.write(post(1))
+        tracker.read_changes()
+        tracker.save()
+
+        self.write(post(1), post(2))
+        restarted = self.tracker()
+
+        self.assertTrue(restarted.started)
+        added, removed = restarted.read_changes()
+        self.assertEqual([entry for _, entry in added], [post(2)])
+        self.assertEqual(removed, [])
+
+    def test_a_half_written_file_is_read_later(self) -> None:
+        tracker = self.tracker()
+        with open(self.to_post_path, "w") as to_post_file:
+            to_post_file.write('{"posts": [')
+
+        self.assertIsNone(tracker.read_changes())
+
+        self.write(post(1))
+        self.assertEqual(len(tracker.read_changes()[0]), 1)
+
+    def test_scheduled_entries_take_their_slots(self) -> None:
+        tracker = self.tracker()
+        due_at = datetime(2024, 7, 1, 10, 0, tzinfo=tz.UTC)
+        key = hot_reload.entry_key(post(1))
+        tracker.record_scheduled(
+            key=key,
+            record={"account": "a", "due_at": due_at.isoformat(), "post_id": "1"},
+        )
+        tracker.record_scheduled(
+            key=key, record={"due_at": due_at.isoformat(), "post_id": "2"}
+        )
+
+        self.assertEqual(tracker.taken_slots(), {"a": [due_at]})
+        self.assertEqual(tracker.pop_scheduled(key)["post_id"], "1")
+        self.assertEqual(tracker.pop_scheduled(key)["post_id"], "2")
+        self.assertIsNone(tracker.pop_scheduled(key))
+        self.assertEqual(tracker.taken_slots(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import media_post  # noqa: E402
+from history import HistoryIndex  # noqa: E402
+
+
+class AppendPostRecordTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.success_path = os.path.join(self.data_dir.name, "success.json")
+        self.logger = logging.getLogger("test")
+
+    def tearDown(self) -> None:
+        self.data_dir.cleanup()
+
+    def record(self, index: int) -> dict:
+        return {
+            "image_path": f"{index}.jpg",
+            "description": f"post {index}",
+            "post_date": f"2024-07-01 10:{index:02d}:00",
+        }
+
+    def test_appends_to_every_empty_layout(self) -> None:
+        for empty in ("[]", "[\n]"):
+            with open(self.success_path, "w") as success_file:
+                success_file.write(empty)
+
+            media_post.append_post_record(self.success_path, self.record(0), self.logger)
+
+            with open(self.success_path) as success_file:
+                self.assertEqual(
+                    json.load(success_file)[0]["post_date"], "2024-07-01 10:00"
+                )
+
+    def test_appended_records_are_indexed_incrementally(self) -> None:
+        media_post.write_post_file(self.success_path, [], self.logger)
+        index = HistoryIndex(
+            data_dir=self.data_dir.name,
+            db_path=os.path.join(self.data_dir.name, "history-index.sqlite3"),
+        )
+        try:
+            for position in range(3):
+                media_post.append_post_record(
+                    self.success_path, self.record(position), self.logger
+                )
+                index.refresh()
+
+            matches = list(index.query(statuses=["success"]))
+        finally:
+            index.close()
+
+        self.assertEqual(
+            [match["post"]["image_path"] for match in matches],
+            ["0.jpg", "1.jpg", "2.jpg"],
+        )
+        with open(self.success_path) as success_file:
+            self.assertEqual(len(success_file.read().splitlines()), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import profiling  # noqa: E402
+
+
+def summary(run_id: str, wall_seconds: float, **functions: float) -> Dict[str, Any]:
+    return {
+        "run_id": run_id,
+        "wall_seconds": wall_seconds,
+        "cpu_seconds": wall_seconds,
+        "peak_rss_kb": 100_000,
+        "traced_peak_kb": 10_000.0,
+        "top_allocations": [],
+        "top_functions": [
+            {"function": name.replace("__", ":"), "cumulative_seconds": seconds}
+            for name, seconds in functions.items()
+        ],
+    }
+
+
+def regressions(base: Dict[str, Any], new: Dict[str, Any]) -> list:
+    return [
+        line.split()[1]
+        for line in profiling.compare_runs(base=base, new=new, threshold=10.0)
+        if line.startswith("REGRESSION")
+    ]
+
+
+class CompareRunsTest(unittest.TestCase):
+    def test_drift_of_other_functions_is_not_a_regression(self) -> None:
+        base = summary("base", 75.0, **{"sqlite3__execute": 0.5})
+        new = summary("new", 74.8, **{"sqlite3__execute": 0.87})
+
+        self.assertEqual(regressions(base, new), [])
+
+    def test_watched_functions_below_the_noise_are_not_regressions(self) -> None:
+        base = summary("base", 75.0, **{"media_post.py__write_post_file": 0.2})
+        new = summary("new", 75.0, **{"media_post.py__write_post_file": 0.6})
+
+        self.assertEqual(regressions(base, new), [])
+
+    def test_slower_runs_and_watched_functions_are_regressions(self) -> None:
+        base = summary("base", 10.0, **{"media_post.py__write_post_file": 1.0})
+        new = summary("new", 13.0, **{"media_post.py__write_post_file": 4.0})
+
+        self.assertEqual(
+            regressions(base, new), ["wall", "CPU", "media_post.py:write_post_file"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
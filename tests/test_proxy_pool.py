@@ -0,0 +1,199 @@
+import logging
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from dateutil import tz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import clock  # noqa: E402
+import proxy_pool  # noqa: E402
+import setup  # noqa: E402
+
+
+class OriginHandler(BaseHTTPRequestHandler):
+    """The site behind the proxy, answers every GET with "ok"."""
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class StandInProxyHandler(BaseHTTPRequestHandler):
+    """A plain HTTP forward proxy: relays GETs for absolute URLs to the origin."""
+
+    def do_GET(self) -> None:
+        # Straight to the origin, whatever proxies the environment sets
+        opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+        with opener.open(self.path) as response:
+            body = response.read()
+        self.send_response(response.status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_server(handler: type) -> ThreadingHTTPServer:
+    """Serve a handler on a free local port, in a background thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def closed_port() -> int:
+    """Get a local port nothing listens on."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class ProxyPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.origin = start_server(OriginHandler)
+        self.proxy_server = start_server(StandInProxyHandler)
+        self.origin_url = f"http://127.0.0.1:{self.origin.server_port}/"
+        self.live_proxy = f"http://127.0.0.1:{self.proxy_server.server_port}"
+        self.dead_proxy = f"http://127.0.0.1:{closed_port()}"
+
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.pool = proxy_pool.ProxyPool(
+            proxies=[self.dead_proxy, self.live_proxy],
+            state_path=os.path.join(self.state_dir.name, "proxy-health.json"),
+            logger=logging.getLogger("test"),
+        )
+
+    def tearDown(self) -> None:
+        clock.set_clock(None)
+        self.origin.shutdown()
+        self.proxy_server.shutdown()
+        self.origin.server_close()
+        self.proxy_server.server_close()
+        self.state_dir.cleanup()
+
+    def session_through(self, proxy: str) -> requests.Session:
+        """A session sending every request through a tracked proxy."""
+        session = requests.Session()
+        session.trust_env = False
+        proxy_pool.mount_connection_pool(session)
+        session.proxies = {"http": proxy, "https": proxy}
+        self.pool.track_session(session, proxy)
+        return session
+
+    def test_requests_through_the_proxy_record_latency(self) -> None:
+        session = self.session_through(self.live_proxy)
+
+        for _ in range(3):
+            self.assertEqual(session.get(self.origin_url, timeout=5).text, "ok")
+
+        stats = self.pool.stats[self.live_proxy]
+        self.assertEqual(stats["consecutive_failures"], 0)
+        self.assertLess(stats["latency"], proxy_pool.MAX_LATENCY_SECONDS)
+        self.assertTrue(self.pool.is_healthy(self.live_proxy))
+
+    def test_connection_errors_rotate_the_account_away(self) -> None:
+        self.pool.assignments["brand"] = self.dead_proxy
+        session = self.session_through(self.dead_proxy)
+
+        for _ in range(proxy_pool.MAX_CONSECUTIVE_FAILURES):
+            with self.assertRaises(requests.ConnectionError):
+                session.get(self.origin_url, timeout=5)
+
+        self.assertFalse(self.pool.is_healthy(self.dead_proxy))
+        self.assertEqual(self.pool.get_proxy("brand"), self.live_proxy)
+
+    def test_unhealthy_proxy_recovers_after_its_cool_down(self) -> None:
+        now = datetime(2024, 7, 1, tzinfo=tz.UTC)
+        clock.set_clock(lambda: now)
+        for _ in range(proxy_pool.MAX_CONSECUTIVE_FAILURES):
+            self.pool.record_failure(self.live_proxy)
+        self.assertFalse(self.pool.is_healthy(self.live_proxy))
+
+        later = now + timedelta(seconds=proxy_pool.UNHEALTHY_COOLDOWN_SECONDS)
+        clock.set_clock(lambda: later)
+        self.assertTrue(self.pool.is_healthy(self.live_proxy))
+
+        # A single failure on its second chance starts another cool-down
+        self.pool.record_failure(self.live_proxy)
+        self.assertFalse(self.pool.is_healthy(self.live_proxy))
+
+        latest = later + timedelta(seconds=proxy_pool.UNHEALTHY_COOLDOWN_SECONDS)
+        clock.set_clock(lambda: latest)
+
+        # A success through the proxy restarts its statistics
+        session = self.session_through(self.live_proxy)
+        self.assertEqual(session.get(self.origin_url, timeout=5).text, "ok")
+        self.assertNotIn("unhealthy_at", self.pool.stats[self.live_proxy])
+        self.assertEqual(self.pool.stats[self.live_proxy]["consecutive_failures"], 0)
+
+    def test_other_processes_see_the_health_of_a_proxy(self) -> None:
+        for _ in range(proxy_pool.MAX_CONSECUTIVE_FAILURES):
+            self.pool.record_failure(self.dead_proxy)
+
+        # Another publisher process, with its own pool over the same state file
+        other = proxy_pool.ProxyPool(
+            proxies=[self.dead_proxy, self.live_proxy],
+            state_path=self.pool.state_path,
+            logger=logging.getLogger("test"),
+        )
+        self.assertFalse(other.is_healthy(self.dead_proxy))
+        self.assertEqual(other.get_proxy("brand"), self.live_proxy)
+
+    def test_cached_clients_move_off_an_unhealthy_proxy(self) -> None:
+        environment = {
+            "INSTA_USERNAME": "user",
+            "INSTA_PASSWORD": "secret",
+            "INSTA_PROXIES": f"{self.dead_proxy},{self.live_proxy}",
+        }
+        with mock.patch.dict(os.environ, environment), mock.patch.object(
+            setup, "DATA_DIR", self.state_dir.name
+        ), mock.patch.object(setup, "_clients", {}), mock.patch.object(
+            setup, "_client_proxies", {}
+        ), mock.patch.object(
+            setup, "_proxy_pool", None
+        ), mock.patch.object(
+            setup.Client, "login", return_value=True
+        ):
+            logger = logging.getLogger("test")
+            client = setup.setup_instagrapi(logger=logger)
+            first = setup._client_proxies["default"]
+
+            pool = setup.get_proxy_pool(logger=logger)
+            for _ in range(proxy_pool.MAX_CONSECUTIVE_FAILURES):
+                pool.record_failure(first)
+
+            self.assertIs(setup.setup_instagrapi(logger=logger), client)
+            second = setup._client_proxies["default"]
+            self.assertNotEqual(second, first)
+            self.assertEqual(client.private.proxies["https"], second)
+
+    def test_connection_pool_keeps_the_retry_policy(self) -> None:
+        session = requests.Session()
+        retries = session.get_adapter("https://").max_retries
+        retries.status_forcelist = [429, 500]
+
+        proxy_pool.mount_connection_pool(session)
+
+        adapter = session.get_adapter("https://")
+        self.assertEqual(adapter.max_retries.status_forcelist, [429, 500])
+        self.assertEqual(adapter._pool_maxsize, proxy_pool.POOL_SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from dateutil import tz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import clock  # noqa: E402
+import media_post  # noqa: E402
+import retry_posts  # noqa: E402
+import retry_queue  # noqa: E402
+
+NOW = datetime(2024, 7, 1, 12, 0, tzinfo=tz.UTC)
+
+
+class FakeClient:
+    """Publishes every photo, as the instagrapi client does on success."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def photo_upload(self, **upload_params):
+        self.uploads.append(upload_params)
+        media = {"id": f"{len(self.uploads)}_1", "pk": len(self.uploads)}
+        return SimpleNamespace(model_dump=lambda: media)
+
+
+def enqueue_many(queue_path: str, worker: int, count: int) -> None:
+    """Enqueue posts from another process, the way concurrent cron publishers do."""
+    queue = retry_queue.RetryQueue(queue_path=queue_path, logger=logging.getLogger("test"))
+    for index in range(count):
+        queue.enqueue(
+            json_post_content={"description": f"{worker}-{index}"},
+            error=ConnectionError("down"),
+            attempts=1,
+            now=NOW,
+        )
+
+
+class RetryQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.queue_path = os.path.join(self.data_dir.name, "retry-queue.json")
+        self.logger = logging.getLogger("test")
+        clock.set_clock(lambda: NOW)
+
+    def tearDown(self) -> None:
+        clock.set_clock(None)
+        self.data_dir.cleanup()
+
+    def queue(self) -> retry_queue.RetryQueue:
+        return retry_queue.RetryQueue(queue_path=self.queue_path, logger=self.logger)
+
+    def test_prepare_upload_params_leaves_the_post_untouched(self) -> None:
+        post = {
+            "image_path": "a.jpg",
+            "description": "hello",
+            "extra_data": {"disable_comments": 1},
+        }
+
+        upload_params = media_post.prepare_upload_params(
+            json_post_content=post, logger=self.logger
+        )
+
+        self.assertEqual(post["extra_data"], {"disable_comments": 1})
+        self.assertEqual(upload_params["extra_data"]["like_and_view_counts_disabled"], 0)
+
+    def test_entries_are_removed_by_id(self) -> None:
+        entry = self.queue().enqueue(
+            json_post_content={"description": "hello"},
+            error=ConnectionError("down"),
+            attempts=1,
+            now=NOW,
+        )
+        entry["post"]["description"] = "changed"
+
+        self.queue().remove(entry)
+
+        self.assertEqual(self.queue().entries, [])
+
+    def test_concurrent_enqueues_keep_every_entry(self) -> None:
+        processes = [
+            multiprocessing.Process(target=enqueue_many, args=(self.queue_path, worker, 20))
+            for worker in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(len(self.queue().entries), 80)
+
+    def test_a_successful_retry_leaves_the_queue(self) -> None:
+        post = {
+            "image_path": "a.jpg",
+            "description": "hello",
+            "post_date": "2024-07-01 11:00",
+            "extra_data": {"disable_comments": 1},
+        }
+        self.queue().enqueue(
+            json_post_content=post,
+            error=ConnectionError("down"),
+            attempts=1,
+            now=NOW - timedelta(hours=1),
+        )
+        client = FakeClient()
+
+        with mock.patch.object(media_post, "DATA_DIR", self.data_dir.name), mock.patch.object(
+            retry_posts, "setup_instagrapi", return_value=client
+        ):
+            retry_posts.drain_retry_queue(queue_path=self.queue_path, logger=self.logger)
+
+        self.assertEqual(len(client.uploads), 1)
+        self.assertEqual(self.queue().entries, [])
+        with open(os.path.join(self.data_dir.name, "success.json")) as success_file:
+            self.assertEqual(json.load(success_file)[0]["extra_data"], post["extra_data"])
+
+
+if __name__ == "__main__":
+    unittest.main()
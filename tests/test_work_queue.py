@@ -0,0 +1,185 @@
+import logging
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from dateutil import tz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import clock  # noqa: E402
+import media_post  # noqa: E402
+import worker  # noqa: E402
+from work_queue import SQLiteWorkQueue, post_id_for  # noqa: E402
+
+NOW = datetime(2024, 7, 1, 12, 0, tzinfo=tz.UTC)
+
+LEASE_SECONDS = 600
+
+POST = {
+    "image_path": "a.jpg",
+    "description": "hello",
+    "post_date": "2024-07-01 11:59",
+    "extra_data": {"disable_comments": 1},
+}
+
+
+class FakeClient:
+    """Publishes every photo, as the instagrapi client does on success."""
+
+    def __init__(self):
+        self.uploads = []
+
+    def photo_upload(self, **upload_params):
+        self.uploads.append(upload_params)
+        media = {"id": f"{len(self.uploads)}_1", "pk": len(self.uploads)}
+        return SimpleNamespace(model_dump=lambda: media)
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.logger = logging.getLogger("test")
+        self.now = NOW
+        clock.set_clock(lambda: self.now)
+        data_dir_patch = mock.patch.object(media_post, "DATA_DIR", self.data_dir.name)
+        data_dir_patch.start()
+        self.addCleanup(data_dir_patch.stop)
+
+    def tearDown(self) -> None:
+        clock.set_clock(None)
+        self.data_dir.cleanup()
+
+    def queue(self, name: str = "work-queue.sqlite3") -> SQLiteWorkQueue:
+        queue = SQLiteWorkQueue(db_path=os.path.join(self.data_dir.name, name))
+        self.addCleanup(queue.close)
+        return queue
+
+    def enqueue(self, queue: SQLiteWorkQueue) -> str:
+        post_id = post_id_for(POST)
+        queue.enqueue(post_id=post_id, post=POST, due_at=NOW - timedelta(minutes=1))
+        return post_id
+
+    def claim(self, queue: SQLiteWorkQueue, worker_id: str = "a") -> dict:
+        claims = queue.claim(worker=worker_id, now=self.now, lease_seconds=LEASE_SECONDS)
+        return claims[0]
+
+    def process(self, queue: SQLiteWorkQueue, client: FakeClient) -> str:
+        with mock.patch.object(worker, "setup_instagrapi", return_value=client):
+            return worker.process_claim(
+                queue=queue,
+                claim=self.claim(queue),
+                lease_seconds=LEASE_SECONDS,
+                logger=self.logger,
+            )
+
+    def test_an_expired_claim_is_handed_out_with_a_new_token(self) -> None:
+        queue = self.queue()
+        post_id = self.enqueue(queue)
+        first = self.claim(queue, worker_id="a")
+
+        self.assertEqual(queue.claim(worker="b", now=self.now, lease_seconds=60), [])
+
+        self.now += timedelta(seconds=LEASE_SECONDS)
+        second = self.claim(queue, worker_id="b")
+
+        self.assertEqual(second["lease_token"], first["lease_token"] + 1)
+        self.assertFalse(
+            queue.begin_publish(
+                post_id=post_id,
+                lease_token=first["lease_token"],
+                now=self.now,
+                lease_seconds=LEASE_SECONDS,
+            )
+        )
+        self.assertTrue(
+            queue.begin_publish(
+                post_id=post_id,
+                lease_token=second["lease_token"],
+                now=self.now,
+                lease_seconds=LEASE_SECONDS,
+            )
+        )
+
+    def test_a_publishing_post_is_never_handed_out_again(self) -> None:
+        queue = self.queue()
+        post_id = self.enqueue(queue)
+        claim = self.claim(queue)
+        queue.begin_publish(
+            post_id=post_id,
+            lease_token=claim["lease_token"],
+            now=self.now,
+            lease_seconds=LEASE_SECONDS,
+        )
+
+        self.now += timedelta(seconds=LEASE_SECONDS)
+
+        self.assertEqual(queue.claim(worker="b", now=self.now, lease_seconds=60), [])
+        self.assertEqual(
+            [entry["post_id"] for entry in queue.expire_publishing(now=self.now)],
+            [post_id],
+        )
+        self.assertEqual(len(queue.list_posts("in_doubt")), 1)
+
+    def test_a_published_post_is_not_published_again(self) -> None:
+        client = FakeClient()
+        self.enqueue(self.queue())
+        self.assertEqual(self.process(self.queue(), client), "published")
+
+        # The same post queued again, e.g. in a recreated queue database
+        other_queue = self.queue("other-queue.sqlite3")
+        self.enqueue(other_queue)
+
+        self.assertEqual(self.process(other_queue, client), "skipped")
+        self.assertEqual(len(client.uploads), 1)
+
+    def test_a_dead_workers_published_post_is_settled(self) -> None:
+        queue = self.queue()
+        post_id = self.enqueue(queue)
+        claim = self.claim(queue)
+        queue.begin_publish(
+            post_id=post_id,
+            lease_token=claim["lease_token"],
+            now=self.now,
+            lease_seconds=LEASE_SECONDS,
+        )
+        # The worker recorded the upload, then died before settling the queue
+        worker.record_post_update(
+            success=True,
+            json_post_content=POST,
+            logger=self.logger,
+            published={"media_id": "1_1", "media_pk": "1", "post_id": post_id},
+        )
+
+        self.now += timedelta(seconds=LEASE_SECONDS)
+        worker.settle_expired_publishing(queue=queue, logger=self.logger)
+
+        self.assertEqual(
+            [entry["post_id"] for entry in queue.list_posts("published")], [post_id]
+        )
+
+    def test_an_unrecorded_post_stays_in_doubt(self) -> None:
+        queue = self.queue()
+        post_id = self.enqueue(queue)
+        claim = self.claim(queue)
+        queue.begin_publish(
+            post_id=post_id,
+            lease_token=claim["lease_token"],
+            now=self.now,
+            lease_seconds=LEASE_SECONDS,
+        )
+
+        self.now += timedelta(seconds=LEASE_SECONDS)
+        worker.settle_expired_publishing(queue=queue, logger=self.logger)
+
+        self.assertEqual(
+            [entry["post_id"] for entry in queue.list_posts("in_doubt")], [post_id]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()